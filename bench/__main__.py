@@ -0,0 +1,302 @@
+"""
+Benchmarks the query path of the db package on synthetic databases, e.g.:
+
+    python -m bench --tracks 10000 --tracks 1000000 --output results.json
+    python -m bench --tracks 10000 --compare results.json
+    python -m bench --tracks 1000000 --connection-profile default --connection-profile analytics
+
+Every operation is timed separately and reported as JSON (latency percentiles, throughput and peak RSS),
+`--compare` fails when an operation became slower than the given results by more than the threshold.
+Every connection profile is measured on its own, the results of a profile other than the default are reported
+under '<tracks>/<profile>', e.g. '1000000/analytics'.
+The startup of the application is measured by the time it takes to import its modules in a new interpreter
+(`python -X importtime`) and by the time it takes to open a database and show a table, which should not grow
+with the size of the database.
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the peak RSS is not reported there.
+    resource = None
+
+from bench.synthetic import generate_database
+from db import utilities
+from db.context_manager import CONNECTION_PROFILES, DEFAULT_PROFILE
+from db.data_structures import ConnectionProfile
+from db.filters import get_filter
+from db.handler import SqlLiteHandler
+
+MAIN_TABLE = 'tracks'
+JOINED_TABLES = ('albums', 'genres', 'artists')
+PAGE_SIZE = 50
+PREVIEW_ROWS = 1000
+DEFAULT_TRACKS = (10_000,)
+DEFAULT_REPEAT = 10
+DEFAULT_THRESHOLD = 0.2
+# The modules whose import time is measured, the GUI imports all the others.
+IMPORTED_MODULES = ('db', 'main_view')
+
+
+def get_peak_rss() -> Optional[int]:
+    """ The peak resident set size of the process in bytes """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """ The nearest-rank percentile of `samples` """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def measure(operation: Callable[[], int], repeat: int, setup: Callable[[], None] = None) -> Dict:
+    """
+    Runs `operation` `repeat` times after a warm-up run.
+
+    :param operation: Runs the operation once and returns the number of rows it processed.
+    :param repeat: The number of timed runs.
+    :param setup: Runs before every run and is not timed, e.g. to reset caches.
+    """
+    samples: List[float] = []
+    rows = 0
+    for run in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        rows = operation()
+        elapsed = time.perf_counter() - start
+        if run > 0:
+            samples.append(elapsed)
+    return summarize(samples, rows)
+
+
+def summarize(samples: Sequence[float], rows: int) -> Dict:
+    """ The latency percentiles and throughput of the timed runs of an operation """
+    mean = sum(samples) / len(samples)
+    return {'rows': rows, 'runs': len(samples), 'mean_s': mean, 'p50_s': percentile(samples, 0.5),
+            'p99_s': percentile(samples, 0.99), 'rows_per_s': rows / mean if mean > 0 else None,
+            'peak_rss_bytes': get_peak_rss()}
+
+
+def measure_import(module_name: str, repeat: int) -> Dict:
+    """
+    Imports `module_name` in a new interpreter `repeat` times after a warm-up run, the time of every import
+    is the cumulative import time `python -X importtime` reports for the module. The rows are the number of
+    modules that were imported.
+    """
+    samples: List[float] = []
+    modules = 0
+    for run in range(repeat + 1):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                                 capture_output=True, text=True, check=True, cwd=Path(__file__).parent.parent)
+        # 'import time: self [us] | cumulative | imported package', the module itself is imported last.
+        lines = [line for line in process.stderr.splitlines() if line.startswith('import time:')][1:]
+        modules = len(lines)
+        if run > 0:
+            samples.append(int(lines[-1].split('|')[1]) / 1_000_000)
+    return summarize(samples, modules)
+
+
+def _count_rows(rows) -> int:
+    return sum(1 for _ in rows)
+
+
+class _Renderer:
+    """ Shows a page of the result in a Treeview like the virtual grid does, or only fetches it without a display """
+
+    def __init__(self):
+        self.table = None
+        try:
+            import tkinter as tk
+            from tkinter import ttk
+            self._root = tk.Tk()
+            self._root.withdraw()
+            self.table = ttk.Treeview(self._root, show='headings')
+        except Exception:  # No display (or no Tk), only the fetching is measured.
+            self._root = None
+
+    @property
+    def backend(self) -> str:
+        return 'tk' if self.table is not None else 'headless'
+
+    def render(self, handler: SqlLiteHandler, columns: Sequence[str]) -> int:
+        rows_count = handler.count_current_rows()
+        rows = handler.fetch_current_rows(max(0, rows_count // 2 - PAGE_SIZE // 2), PAGE_SIZE)
+        if self.table is not None:
+            self.table['columns'] = list(columns)
+            self.table.delete(*self.table.get_children())
+            for row in rows:
+                self.table.insert('', 'end', values=row)
+            self._root.update_idletasks()
+        return len(rows)
+
+    def close(self) -> None:
+        if self._root is not None:
+            self._root.destroy()
+
+
+def benchmark_database(database_path: Path, repeat: int, renderer: _Renderer,
+                       connection_profile: ConnectionProfile = DEFAULT_PROFILE) -> Dict[str, Dict]:
+    """ Times every operation of the query path on one database, opened with `connection_profile` """
+    handler = SqlLiteHandler(database_path, connection_profile)
+
+    def reset_caches():
+        handler.result_cache.clear()
+
+    results = dict()
+    results['get_columns_for'] = measure(lambda: len(handler.get_columns_for(MAIN_TABLE)), repeat)
+    results['get_data_from_table'] = measure(
+        lambda: _count_rows(handler.get_data_from_table(MAIN_TABLE)), repeat, reset_caches)
+    # The first paint of a table in the preview mode: its first rows, their count and the estimate of the table.
+    results['preview_table'] = measure(
+        lambda: (_count_rows(handler.get_data_from_table(MAIN_TABLE, preview_rows=PREVIEW_ROWS)),
+                 handler.count_current_rows(), handler.estimate_current_rows())[0], repeat, reset_caches)
+    results['join_tables'] = measure(
+        lambda: _count_rows(handler.join_tables(MAIN_TABLE, *JOINED_TABLES)[1]), repeat, reset_caches)
+
+    columns, _ = handler.join_tables(MAIN_TABLE, *JOINED_TABLES)
+    columns_by_name = {column.get_full_name(): column for column in columns}
+    genre_filter = get_filter(columns_by_name['genres.Name'])
+    genre_filter.value = 'Genre 3'
+    length_filter = get_filter(columns_by_name['tracks.Milliseconds'])
+    length_filter.operator = next(op for op in length_filter.operators if op.name == 'Greater than')
+    length_filter.value = '300000'
+
+    def reset_join():
+        # A new join forgets the previous filtered result, so every run filters the joined tables.
+        utilities.consume(handler.join_tables(MAIN_TABLE, *JOINED_TABLES)[1])
+        reset_caches()
+
+    results['filter_last_executed_query'] = measure(
+        lambda: _count_rows(handler.filter_last_executed_query([genre_filter, length_filter])), repeat, reset_join)
+
+    def refine():
+        utilities.consume(handler.filter_last_executed_query([genre_filter]))
+        reset_caches()
+
+    results['filter_refinement'] = measure(
+        lambda: _count_rows(handler.filter_last_executed_query([genre_filter, length_filter])), repeat, refine)
+    results['render_page'] = measure(lambda: renderer.render(handler, list(columns_by_name)), repeat, reset_caches)
+
+    # A filter that scans the whole main table, by a single query and by a query on every range of its rowids.
+    table_length_filter = get_filter(next(column for column in handler.get_columns_for(MAIN_TABLE)
+                                          if column.title == 'Milliseconds'))
+    table_length_filter.operator = length_filter.operator
+    table_length_filter.value = length_filter.value
+
+    def reset_table(parallel: bool) -> None:
+        handler.parallel_scan.enabled = parallel
+        handler.parallel_scan.min_rows = 0
+        utilities.consume(handler.get_data_from_table(MAIN_TABLE))
+        reset_caches()
+
+    results['filter_table'] = measure(lambda: _count_rows(handler.filter_last_executed_query([table_length_filter])),
+                                      repeat, lambda: reset_table(False))
+    results['filter_table_parallel'] = measure(
+        lambda: _count_rows(handler.filter_last_executed_query([table_length_filter])), repeat,
+        lambda: reset_table(True))
+
+    def open_database(schema_snapshot: bool) -> int:
+        # What the application does before it is usable: list the tables and show the preview of one of them.
+        opened_handler = SqlLiteHandler(database_path, connection_profile, schema_snapshot)
+        assert MAIN_TABLE in opened_handler.table_names
+        opened_handler.get_joinable_tables(MAIN_TABLE)
+        return _count_rows(opened_handler.get_data_from_table(MAIN_TABLE, preview_rows=PREVIEW_ROWS))
+
+    # Measured last, a new handler attaches its own databases to the connections the handler above uses.
+    results['open_database'] = measure(lambda: open_database(False), repeat)
+    results['open_database_snapshot'] = measure(lambda: open_database(True), repeat)
+    return results
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """ Returns the operations whose p50 latency grew by more than `threshold` relative to `baseline` """
+    measured = [(f'{name} on {size} tracks', result, baseline.get('databases', {}).get(size, {}).get(name))
+                for size, operations in results['databases'].items() for name, result in operations.items()]
+    measured += [(f'import {module_name}', result, baseline.get('imports', {}).get(module_name))
+                 for module_name, result in results.get('imports', {}).items()]
+    regressions = []
+    for description, result, previous in measured:
+        if previous and previous['p50_s'] > 0 and result['p50_s'] > previous['p50_s'] * (1 + threshold):
+            regressions.append(f'{description}: p50 {previous["p50_s"] * 1000:.2f}ms -> '
+                               f'{result["p50_s"] * 1000:.2f}ms')
+    return regressions
+
+
+def parse_arguments(arguments: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the db package.')
+    parser.add_argument('-t', '--tracks', type=int, action='append',
+                        help=f'The number of tracks of a synthetic database, may be repeated (default: {DEFAULT_TRACKS}).')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed of the synthetic data.')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT, help='The number of timed runs.')
+    parser.add_argument('-d', '--directory', type=Path, default=Path(tempfile.gettempdir()) / 'sql_gui_bench',
+                        help='Where the synthetic databases are kept, they are generated only once.')
+    parser.add_argument('-o', '--output', type=Path, help='The file to write the results to, defaults to stdout.')
+    parser.add_argument('-c', '--compare', type=Path, help='Results of a previous run to compare to.')
+    parser.add_argument('-p', '--connection-profile', action='append', choices=list(CONNECTION_PROFILES),
+                        help=f'The connection profile to open the databases with, may be repeated '
+                             f'(default: {DEFAULT_PROFILE.name}).')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='The relative slowdown of p50 that counts as a regression.')
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[Sequence[str]] = None) -> int:
+    arguments = parse_arguments(arguments)
+    renderer = _Renderer()
+    results = {'commit': get_commit(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+               'platform': platform.platform(), 'seed': arguments.seed, 'repeat': arguments.repeat,
+               'render_backend': renderer.backend, 'imports': dict(), 'databases': dict()}
+    try:
+        for module_name in IMPORTED_MODULES:
+            print(f'Benchmarking the import of {module_name}...', file=sys.stderr)
+            results['imports'][module_name] = measure_import(module_name, arguments.repeat)
+        for tracks in arguments.tracks or DEFAULT_TRACKS:
+            database_path = arguments.directory / f'chinook_{tracks}_{arguments.seed}.db'
+            print(f'Generating {database_path}...', file=sys.stderr)
+            generate_database(database_path, tracks, arguments.seed)
+            for profile_name in arguments.connection_profile or (DEFAULT_PROFILE.name,):
+                print(f'Benchmarking {tracks} tracks with the {profile_name} profile...', file=sys.stderr)
+                key = str(tracks) if profile_name == DEFAULT_PROFILE.name else f'{tracks}/{profile_name}'
+                results['databases'][key] = benchmark_database(database_path, arguments.repeat, renderer,
+                                                               CONNECTION_PROFILES[profile_name])
+    finally:
+        renderer.close()
+
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        arguments.output.write_text(output + '\n')
+    else:
+        print(output)
+
+    if arguments.compare:
+        regressions = compare(results, json.loads(arguments.compare.read_text()), arguments.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
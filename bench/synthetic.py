@@ -0,0 +1,127 @@
+"""
+Generates synthetic databases with the schema of the bundled Chinook database, scaled to any number of tracks.
+
+The data is generated by SQL alone with a seeded multiplicative hash instead of `random()`,
+so the same size and seed always produce the same database, on every platform.
+"""
+__all__ = ['generate_database', 'get_table_sizes']
+
+import sqlite3
+from pathlib import Path
+from typing import Dict
+
+from db.context_manager import DATABASE_PATH
+
+# The number of rows in the bundled database, the synthetic tables keep their ratio to the tracks table.
+_CHINOOK_TRACKS = 3503
+_SCALED_TABLES = {'artists': 275, 'albums': 347, 'customers': 59, 'invoices': 412, 'invoice_items': 2240,
+                  'playlist_track': 8715}
+_FIXED_TABLES = {'genres': 25, 'media_types': 5, 'employees': 8, 'playlists': 18}
+_COUNTRIES = ('USA', 'Canada', 'Brazil', 'France', 'Germany', 'United Kingdom', 'Portugal', 'India', 'Chile',
+              'Czech Republic')
+
+
+def get_table_sizes(tracks: int) -> Dict[str, int]:
+    """ The number of rows of every table in a database with `tracks` tracks """
+    sizes = {table_name: max(1, tracks * rows // _CHINOOK_TRACKS) for table_name, rows in _SCALED_TABLES.items()}
+    sizes.update(_FIXED_TABLES)
+    sizes['tracks'] = tracks
+    return sizes
+
+
+class _Generator:
+
+    def __init__(self, connection: sqlite3.Connection, sizes: Dict[str, int], seed: int):
+        self.connection = connection
+        self.sizes = sizes
+        self.seed = seed
+
+    def pick(self, salt: int, table_name_or_count) -> str:
+        """ A pseudo-random id in [1, count] for the row `i`, the same for the same seed and salt """
+        count = self.sizes.get(table_name_or_count, table_name_or_count)
+        offset = self.seed * 7919 + salt * 104729
+        return f'((i * 2654435761 + {offset}) % 4294967296 % {count} + 1)'
+
+    def insert(self, table_name: str, columns: Dict[str, str]) -> None:
+        self.connection.execute(f"""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {self.sizes[table_name]})
+            INSERT INTO "{table_name}" ({', '.join(columns)})
+            SELECT {', '.join(columns.values())} FROM n
+        """)
+
+    def generate(self) -> None:
+        pick = self.pick
+        countries = ', '.join(f"'{country}'" for country in _COUNTRIES)
+        country = f"json_extract(json_array({countries}), '$[' || ({pick(10, len(_COUNTRIES))} - 1) || ']')"
+        self.insert('media_types', {'MediaTypeId': 'i', 'Name': "'Media type ' || i"})
+        self.insert('genres', {'GenreId': 'i', 'Name': "'Genre ' || i"})
+        self.insert('playlists', {'PlaylistId': 'i', 'Name': "'Playlist ' || i"})
+        self.insert('artists', {'ArtistId': 'i', 'Name': "'Artist ' || i"})
+        self.insert('albums', {'AlbumId': 'i', 'Title': "'Album ' || i", 'ArtistId': pick(1, 'artists')})
+        self.insert('tracks', {
+            'TrackId': 'i', 'Name': "'Track ' || i", 'AlbumId': pick(2, 'albums'),
+            'MediaTypeId': pick(3, 'media_types'), 'GenreId': pick(4, 'genres'),
+            'Composer': f"CASE WHEN {pick(5, 4)} = 1 THEN NULL ELSE 'Composer ' || {pick(6, 1000)} END",
+            'Milliseconds': f'60000 + {pick(7, 600000)}', 'Bytes': f'1000000 + {pick(8, 20000000)}',
+            'UnitPrice': f'CASE WHEN {pick(9, 10)} = 1 THEN 1.99 ELSE 0.99 END'})
+        self.insert('employees', {'EmployeeId': 'i', 'LastName': "'Employee ' || i", 'FirstName': "'First ' || i",
+                                  'ReportsTo': 'CASE WHEN i = 1 THEN NULL ELSE 1 END'})
+        self.insert('customers', {'CustomerId': 'i', 'FirstName': "'First ' || i", 'LastName': "'Customer ' || i",
+                                  'Country': country, 'Email': "'customer' || i || '@example.com'",
+                                  'SupportRepId': pick(11, 'employees')})
+        self.insert('invoices', {'InvoiceId': 'i', 'CustomerId': pick(12, 'customers'),
+                                 'InvoiceDate': f"date('2009-01-01', '+' || {pick(13, 1800)} || ' days')",
+                                 'BillingCountry': country, 'Total': f'{pick(14, 2500)} / 100.0'})
+        self.insert('invoice_items', {'InvoiceLineId': 'i', 'InvoiceId': pick(15, 'invoices'),
+                                      'TrackId': pick(16, 'tracks'), 'UnitPrice': '0.99', 'Quantity': '1'})
+        # Every (playlist, track) pair must be unique, so the pairs are enumerated instead of picked.
+        playlists = self.sizes['playlists']
+        self.sizes['playlist_track'] = min(self.sizes['playlist_track'], playlists * self.sizes['tracks'])
+        self.insert('playlist_track', {'PlaylistId': f'(i - 1) % {playlists} + 1',
+                                       'TrackId': f'(i - 1) / {playlists} + 1'})
+
+
+def generate_database(file_path, tracks: int, seed: int = 0, template_path=DATABASE_PATH) -> Path:
+    """
+    Creates a database with the schema of `template_path` and `tracks` tracks, unless it already exists.
+
+    :param file_path: The database to create.
+    :param tracks: The number of rows in the tracks table, the other tables are scaled accordingly.
+    :param seed: Databases with the same size and seed are identical.
+    :param template_path: The database whose schema is copied.
+    :return: The path of the database.
+    """
+    file_path = Path(file_path)
+    if file_path.exists():
+        return file_path
+
+    with sqlite3.connect(template_path) as template:
+        schema = template.execute(r"""
+            SELECT type, sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'sql\_gui\_fts\_%' ESCAPE '\'
+            ORDER BY type = 'index'
+        """).fetchall()
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = file_path.with_name(file_path.name + '.part')
+    if partial_path.exists():
+        partial_path.unlink()
+    connection = sqlite3.connect(partial_path, isolation_level=None)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('BEGIN')
+        for object_type, sql in schema:
+            if object_type == 'table':
+                connection.execute(sql)
+        _Generator(connection, get_table_sizes(tracks), seed).generate()
+        # The indexes are created after the data, which is much faster than updating them on every insert.
+        for object_type, sql in schema:
+            if object_type == 'index':
+                connection.execute(sql)
+        connection.execute('COMMIT')
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    partial_path.replace(file_path)
+    return file_path
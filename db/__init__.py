@@ -1,4 +1,16 @@
 from .filters import *
 from .handler import *
 from .utilities import *
-from .data_structures import ColumnData, RelatedTable
+from .data_structures import Aggregate, ColumnData, ColumnType, ConnectionProfile, Operator, RelatedTable, \
+    RowEstimate, SavedQuery, SqlDialect
+from .executor import QueryExecutor, QueryTask
+from .engine import QueryEngine, QueryCursor, load_query_spec
+from .profiling import JsonLinesSink, QueryProfile, QueryProfiler
+from .backends import DatabaseBackend, DbApiBackend, DuckDbBackend, SqlAlchemyBackend, SqliteBackend, get_backend
+from .columnar import ColumnarResult
+from .aggregation import AGGREGATE_FUNCTIONS
+from .estimation import RowEstimator
+from .saved_queries import MaterializedViewCache, SavedQueryStore
+from .workspace import Workspace
+from .parallel_scan import ParallelScanner
+from .context_manager import CONNECTION_PROFILES, DEFAULT_PROFILE, READ_ONLY_ANALYTICS_PROFILE
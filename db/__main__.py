@@ -0,0 +1,132 @@
+"""
+Runs a saved query spec on one or more databases without starting the GUI, e.g.:
+
+    python -m db spec.json --database a.db --database b.db --output 'out/{database}.csv'
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+try:
+    import yaml
+except ImportError:  # YAML specs are optional
+    yaml = None
+
+from db import export, utilities
+from db.backends import DuckDbBackend, SqliteBackend
+from db.context_manager import DATABASE_PATH
+from db.engine import QueryEngine, load_query_spec
+
+DATABASE_PLACEHOLDER = '{database}'
+# The errors of reading and parsing a spec file.
+_SPEC_ERRORS = (OSError, ValueError, KeyError, TypeError) + ((yaml.YAMLError,) if yaml is not None else ())
+
+
+def parse_arguments(arguments: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m db', description='Run a saved query spec (JSON or YAML).')
+    parser.add_argument('spec', help='The query spec file.')
+    parser.add_argument('-d', '--database', action='append', dest='databases',
+                        help=f'A database to run the query on, may be repeated (default: {DATABASE_PATH}). '
+                             f'Besides sqlite files, databases may be given as URLs: duckdb:///file.duckdb '
+                             f'or any SQLAlchemy URL (e.g. postgresql://user@host/name).')
+    parser.add_argument('-o', '--output',
+                        help=f'The file to write, defaults to stdout. With several databases the path must contain '
+                             f'{DATABASE_PLACEHOLDER}, which is replaced by the name of every database.')
+    parser.add_argument('-f', '--format', choices=export.EXPORT_FORMATS,
+                        help='The output format, defaults to the extension of the output file or csv for stdout.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='The number of rows fetched at a time.')
+    return parser.parse_args(arguments)
+
+
+def _read(cursor) -> Iterator:
+    """ The result of a cursor in the form the writers of `export` expect: the columns names and then batches """
+    yield cursor.columns_names
+    yield from cursor
+
+
+def _read_all(engines: Sequence[QueryEngine], spec, batch_size: int) -> Iterator:
+    """ Concatenates the results of all the databases, with a leading column that holds the name of the database """
+    header_written = False
+    for engine in engines:
+        database_name = Path(engine.database_file_path).stem
+        with engine.run(spec, batch_size) as cursor:
+            if not header_written:
+                yield ['database', *cursor.columns_names]
+                header_written = True
+            for batch in cursor:
+                yield [(database_name, *row) for row in batch]
+
+
+def main(arguments: Optional[Sequence[str]] = None) -> int:
+    arguments = parse_arguments(arguments)
+    databases: List[str] = arguments.databases or [str(DATABASE_PATH)]
+    if arguments.output and len(databases) > 1 and DATABASE_PLACEHOLDER not in arguments.output:
+        print(f'error: --output must contain {DATABASE_PLACEHOLDER} when running on several databases',
+              file=sys.stderr)
+        return 2
+
+    try:
+        spec = load_query_spec(arguments.spec)
+    except _SPEC_ERRORS as e:
+        print(f'error: invalid spec {arguments.spec!r}: {e}', file=sys.stderr)
+        return 2
+
+    try:
+        engines = [QueryEngine(database) for database in databases]
+    except ValueError as e:  # e.g. a URL whose driver is not installed
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+
+    missing_databases = [str(engine.database_file_path) for engine in engines
+                         if isinstance(engine.backend, (SqliteBackend, DuckDbBackend))
+                         and not Path(engine.backend.database_file_path).is_file()]
+    if missing_databases:
+        # sqlite and duckdb would create an empty database instead of failing.
+        print(f'error: no such database: {", ".join(missing_databases)}', file=sys.stderr)
+        return 2
+
+    for engine in engines:
+        try:
+            # The spec is checked against every database before any result is written (e.g. unknown tables).
+            engine.build_query(spec)
+        except ValueError as e:
+            print(f'error: {engine.database_file_path}: {e}', file=sys.stderr)
+            return 2
+        except Exception as e:  # e.g. the file is not a database
+            print(f'error: {engine.database_file_path}: {e}', file=sys.stderr)
+            return 1
+
+    if not arguments.output:
+        # All the results are written to stdout as a single table.
+        try:
+            result = _read_all(engines, spec, arguments.batch_size) if len(engines) > 1 \
+                else _read(engines[0].run(spec, arguments.batch_size))
+            utilities.consume(export.write_batches(result, sys.stdout, arguments.format or export.CSV_FORMAT))
+        except BrokenPipeError:
+            # The reader (e.g. `head`) stopped reading, which is not an error.
+            sys.stderr.close()
+            return 0
+        except Exception as e:
+            print(f'error: {e}', file=sys.stderr)
+            return 1
+        return 0
+
+    exit_code = 0
+    for engine in engines:
+        output = arguments.output.replace(DATABASE_PLACEHOLDER, Path(engine.database_file_path).stem)
+        try:
+            rows_written = 0
+            with engine.run(spec, arguments.batch_size) as cursor:
+                for rows_written in export.export_batches(_read(cursor), output, arguments.format):
+                    pass
+            print(f'{engine.database_file_path}: wrote {rows_written} rows to {output}', file=sys.stderr)
+        except Exception as e:
+            # A failing database does not stop the batch, the exit code reports it.
+            print(f'error: {engine.database_file_path}: {e}', file=sys.stderr)
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
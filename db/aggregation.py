@@ -0,0 +1,106 @@
+__all__ = ['AGGREGATE_FUNCTIONS', 'build_group_query', 'get_aggregate_column']
+
+from typing import Iterable, List, Mapping, Sequence, Tuple
+
+from db import utilities
+from db.data_structures import Aggregate, ColumnData, ColumnType, Query
+from db.filters import Filter
+
+COUNT = 'count'
+COUNT_DISTINCT = 'count_distinct'
+SUM = 'sum'
+AVG = 'avg'
+MIN = 'min'
+MAX = 'max'
+AGGREGATE_FUNCTIONS = (COUNT, COUNT_DISTINCT, SUM, AVG, MIN, MAX)
+# Functions that are only meaningful on numbers.
+_NUMERIC_FUNCTIONS = (SUM, AVG)
+
+
+def get_aggregate_column(aggregate: Aggregate, columns: Mapping[str, ColumnData]) -> ColumnData:
+    """
+    The column of an aggregate in a grouped result, its full name is the name of the aggregate
+    (see `Aggregate.get_full_name`) so filters and sort keys refer to it like to any other column.
+
+    :param aggregate: The aggregate.
+    :param columns: The columns of the result that is grouped by their full names.
+    :raise ValueError: If the aggregate is invalid.
+    """
+    if aggregate.function not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f'Unknown aggregate function {aggregate.function!r}, '
+                         f'supported functions are: {AGGREGATE_FUNCTIONS}')
+    if aggregate.column_name is None:
+        if aggregate.function != COUNT:
+            raise ValueError(f'{aggregate.function} requires a column')
+        return ColumnData(aggregate.function, ColumnType.Numeric, '*', False, False)
+
+    column = columns.get(aggregate.column_name)
+    if column is None:
+        raise ValueError(f'Can not aggregate unknown column {aggregate.column_name!r}')
+    if aggregate.function in _NUMERIC_FUNCTIONS and column.column_type is not ColumnType.Numeric:
+        raise ValueError(f'{aggregate.function} requires a numeric column, {aggregate.column_name!r} is not')
+    # The count of a group is never NULL, the other aggregates are NULL if all the values are NULL.
+    column_type = column.column_type if aggregate.function in (MIN, MAX) else ColumnType.Numeric
+    return ColumnData(aggregate.function, column_type, aggregate.column_name, False,
+                      aggregate.function not in (COUNT, COUNT_DISTINCT))
+
+
+def _get_expression(aggregate: Aggregate) -> str:
+    if aggregate.column_name is None:
+        return 'COUNT(*)'
+    column = utilities.quote_identifier(aggregate.column_name)
+    if aggregate.function == COUNT_DISTINCT:
+        return f'COUNT(DISTINCT {column})'
+    return f'{aggregate.function.upper()}({column})'
+
+
+def build_group_query(query: str, parameters: Sequence, columns: Mapping[str, ColumnData], group_by: Sequence[str],
+                      aggregates: Sequence[Aggregate], having: Iterable[Filter] = (),
+                      case_sensitive: bool = False) -> Tuple[List[ColumnData], Query]:
+    """
+    Builds the query that groups the result of `query` and computes the aggregates of every group in the database.
+
+    :param query: The query whose result is grouped, its columns must be selected with `select_columns`.
+    :param parameters: The parameters of `query`.
+    :param columns: The columns of the result of `query` by their full names.
+    :param group_by: The full names of the columns to group by, all the rows are a single group if it is empty.
+    :param aggregates: The aggregates to compute for every group.
+    :param having: Filters on the groups, on the group by columns or on the aggregates by their full names.
+    :param case_sensitive: Are the filters case sensitive.
+    :return: The columns of the grouped result and its query with its parameters.
+    :raise ValueError: If a column or an aggregate is invalid.
+    """
+    if len(group_by) == 0 and len(aggregates) == 0:
+        raise ValueError('Select columns to group by or aggregates to compute')
+    unknown_columns = [column_name for column_name in group_by if column_name not in columns]
+    if unknown_columns:
+        raise ValueError(f'Can not group by unknown columns {unknown_columns}')
+
+    group_by = list(dict.fromkeys(group_by))
+    result_columns = [columns[column_name] for column_name in group_by]
+    expressions = {column_name: utilities.quote_identifier(column_name) for column_name in group_by}
+    for aggregate in aggregates:
+        if aggregate.get_full_name() in expressions:
+            continue
+        result_columns.append(get_aggregate_column(aggregate, columns))
+        expressions[aggregate.get_full_name()] = _get_expression(aggregate)
+
+    having_queries = []
+    query_parameters = list(parameters)
+    for table_filter in having:
+        expression = expressions.get(table_filter.column_name)
+        if expression is None:
+            raise ValueError(f'Can not filter the groups by {table_filter.column_name!r}, '
+                             f'only by the grouped columns and the aggregates')
+        filter_query, filter_parameters = table_filter.get_query(case_sensitive, expression)
+        having_queries.append(filter_query)
+        query_parameters.extend(filter_parameters)
+
+    select = ', '.join(f'{expression} AS {utilities.quote_identifier(full_name)}'
+                       for full_name, expression in expressions.items())
+    group_query = f'SELECT {select} FROM ({query})'
+    if group_by:
+        group_query += f' GROUP BY {", ".join(expressions[column_name] for column_name in group_by)}'
+    if having_queries:
+        group_query += f' HAVING {" AND ".join(having_queries)}'
+    return result_columns, (group_query, query_parameters)
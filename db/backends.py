@@ -0,0 +1,591 @@
+"""
+Database backends: connecting, introspecting, executing and streaming behind one interface.
+
+`SqliteBackend` is the local database the GUI works on. `DbApiBackend` runs on any DB-API 2.0 driver and
+introspects the database through `information_schema`, `DuckDbBackend` is such a backend for DuckDB files.
+`SqlAlchemyBackend` runs on any engine SQLAlchemy supports, with its pooling and server-side cursors.
+The queries of the application use `?` placeholders, they are converted to the paramstyle of the driver.
+"""
+__all__ = ['DatabaseBackend', 'SqliteBackend', 'DbApiBackend', 'DuckDbBackend', 'SqlAlchemyBackend',
+           'get_backend', 'convert_placeholders']
+
+import hashlib
+import importlib
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from db import operators, utilities
+from db.context_manager import DATABASE_PATH, DEFAULT_POOL_SIZE, SqlConnectionPool
+from db.data_structures import ColumnData, RelatedTable, TableSchema
+
+DEFAULT_BATCH_SIZE = 1000
+
+# (table, column, sql type, is primary key, is nullable)
+ColumnRow = Tuple[str, str, str, bool, bool]
+# (table, referenced table, column, referenced column)
+ForeignKeyRow = Tuple[str, str, str, str]
+
+# The tables of the full-text indexes are not tables of the user.
+_SQLITE_COLUMNS_QUERY = r"""
+    SELECT m.name, p.name, p.type, p.pk > 0, NOT p."notnull"
+    FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND m.name NOT LIKE 'sql\_gui\_fts\_%' ESCAPE '\'
+    ORDER BY m.name, p.cid
+"""
+_SQLITE_TABLES_QUERY = r"""
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'sql\_gui\_fts\_%' ESCAPE '\'
+    ORDER BY name
+"""
+_SQLITE_TABLE_COLUMNS_QUERY = 'SELECT ?, name, type, pk > 0, NOT "notnull" FROM pragma_table_info(?) ORDER BY cid'
+_SQLITE_TABLE_FOREIGN_KEYS_QUERY = 'SELECT ?, "table", "from", "to" FROM pragma_foreign_key_list(?) ORDER BY id, seq'
+_SQLITE_FOREIGN_KEYS_QUERY = r"""
+    SELECT m.name, f."table", f."from", f."to"
+    FROM sqlite_master AS m JOIN pragma_foreign_key_list(m.name) AS f
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND m.name NOT LIKE 'sql\_gui\_fts\_%' ESCAPE '\'
+    ORDER BY m.name, f.id, f.seq
+"""
+
+_INFORMATION_SCHEMA_COLUMNS_QUERY = """
+    SELECT c.table_name, c.column_name, c.data_type, c.is_nullable
+    FROM information_schema.columns AS c JOIN information_schema.tables AS t
+        ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE c.table_schema = ? AND t.table_type = 'BASE TABLE'
+    ORDER BY c.table_name, c.ordinal_position
+"""
+_INFORMATION_SCHEMA_PRIMARY_KEYS_QUERY = """
+    SELECT k.table_name, k.column_name
+    FROM information_schema.table_constraints AS t JOIN information_schema.key_column_usage AS k
+        ON k.constraint_schema = t.constraint_schema AND k.constraint_name = t.constraint_name
+        AND k.table_name = t.table_name
+    WHERE t.table_schema = ? AND t.constraint_type = 'PRIMARY KEY'
+"""
+_INFORMATION_SCHEMA_FOREIGN_KEYS_QUERY = """
+    SELECT k.table_name, u.table_name, k.column_name, u.column_name
+    FROM information_schema.referential_constraints AS r
+    JOIN information_schema.key_column_usage AS k
+        ON k.constraint_schema = r.constraint_schema AND k.constraint_name = r.constraint_name
+    JOIN information_schema.key_column_usage AS u
+        ON u.constraint_schema = r.unique_constraint_schema AND u.constraint_name = r.unique_constraint_name
+        AND u.ordinal_position = k.position_in_unique_constraint
+    WHERE k.table_schema = ?
+    ORDER BY k.table_name, r.constraint_name, k.ordinal_position
+"""
+
+_PARAMSTYLES = ('qmark', 'numeric', 'named', 'format', 'pyformat')
+
+
+def _import_optional(module_name: str):
+    """
+    Imports an optional package when a backend first needs it, None if it is not installed.
+    DuckDB and SQLAlchemy take longer to import than the rest of the application, so they are not imported
+    on startup when the database is a SQLite file.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+def convert_placeholders(query: str, parameters: Sequence[Any], paramstyle: str) -> Tuple[str, Any]:
+    """
+    Converts the `?` placeholders of `query` to another DB-API paramstyle.
+    Placeholders inside string literals and quoted identifiers are left alone.
+
+    :param query: A query with `?` placeholders.
+    :param parameters: The values of the placeholders.
+    :param paramstyle: The paramstyle of the driver, see PEP 249.
+    :return: The converted query and its parameters, a mapping for the 'named' and 'pyformat' styles.
+    """
+    if paramstyle not in _PARAMSTYLES:
+        raise ValueError(f'Unsupported paramstyle {paramstyle!r}, supported are: {_PARAMSTYLES}')
+    if paramstyle == 'qmark':
+        return query, parameters
+
+    placeholders = {'numeric': ':{}', 'named': ':p{}', 'format': '%s', 'pyformat': '%(p{})s'}[paramstyle]
+    # With the format styles every literal '%' has to be escaped, even inside strings.
+    escape_percent = paramstyle in ('format', 'pyformat')
+    parts: List[str] = []
+    quote: Optional[str] = None
+    index = 0
+    for character in query:
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in ('"', "'", '`'):
+            quote = character
+        elif character == '?':
+            index += 1
+            parts.append(placeholders.format(index))
+            continue
+        parts.append('%%' if escape_percent and character == '%' else character)
+
+    if index != len(parameters):
+        raise ValueError(f'The query has {index} placeholders but {len(parameters)} parameters were given')
+    if paramstyle in ('named', 'pyformat'):
+        return ''.join(parts), {f'p{i}': value for i, value in enumerate(parameters, 1)}
+    return ''.join(parts), parameters
+
+
+def build_table_schemas(columns_rows: Iterable[ColumnRow], foreign_keys_rows: Iterable[ForeignKeyRow],
+                        table_names: Optional[Iterable[str]] = None) -> List[TableSchema]:
+    """
+    Creates the schemas of the tables from the introspected rows of their columns and foreign keys.
+
+    :param columns_rows: The columns of the tables.
+    :param foreign_keys_rows: The foreign keys of the tables.
+    :param table_names: The tables the foreign keys may reference, defaults to the tables of `columns_rows`.
+    """
+    columns: Dict[str, List[ColumnData]] = dict()
+    for table_name, column_name, sql_type, is_primary, is_nullable in columns_rows:
+        columns.setdefault(table_name, []).append(
+            ColumnData(table_name, utilities.sql_type_to_enum_type(sql_type or ''), column_name, bool(is_primary),
+                       bool(is_nullable)))
+
+    table_names = columns if table_names is None else set(table_names)
+    foreign_keys: Dict[str, List[RelatedTable]] = dict()
+    for table_name, referenced_table, from_column, to_column in foreign_keys_rows:
+        if referenced_table != table_name and referenced_table in table_names:
+            foreign_keys.setdefault(table_name, []).append(RelatedTable(referenced_table, from_column, to_column))
+
+    return [TableSchema(table_name, tuple(table_columns), tuple(foreign_keys.get(table_name, ())))
+            for table_name, table_columns in columns.items()]
+
+
+def _fingerprint(rows: Iterable[Sequence[Any]]) -> str:
+    """ A schema version for engines without one: the digest of the introspected columns """
+    return hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()
+
+
+class DatabaseBackend(ABC):
+    """
+    A database the application can work on: pooled connections, introspection, execution and streaming.
+
+    The queries of the application are written for SQLite. How the filters and sort keys compare texts
+    case insensitively is given by `dialect`: engines without SQLite's `COLLATE NOCASE` and
+    `PRAGMA case_sensitive_like` (e.g. PostgreSQL) compare the lowercased texts.
+    """
+    name = 'generic'
+    dialect = operators.GENERIC_DIALECT
+    supports_full_text = False
+    # Whether `load_table_names` and `load_table` introspect less than `load_schema`, so the catalog loads
+    # the columns of a table only once the table is used.
+    supports_lazy_schema = False
+
+    @abstractmethod
+    def acquire(self):
+        """ Checks out a DB-API connection, it must be given back with `release` """
+
+    @abstractmethod
+    def release(self, connection) -> None:
+        """ Returns a connection that was checked out with `acquire` """
+
+    @abstractmethod
+    def get_schema_version(self) -> Hashable:
+        """ A value that changes whenever the schema of the database changes """
+
+    @abstractmethod
+    def load_schema(self) -> Tuple[Hashable, List[TableSchema]]:
+        """ Returns the schema version and the schemas of all the tables, read consistently with each other """
+
+    def load_table_names(self) -> Tuple[Hashable, List[str]]:
+        """ Returns the schema version and the names of all the tables """
+        schema_version, table_schemas = self.load_schema()
+        return schema_version, [table.table_name for table in table_schemas]
+
+    def load_table(self, table_name: str, table_names: Iterable[str]) -> Optional[TableSchema]:
+        """
+        Returns the schema of a single table, None if there is no such table.
+
+        :param table_name: The table.
+        :param table_names: The tables its foreign keys may reference.
+        """
+        _, table_schemas = self.load_schema()
+        return next((table for table in table_schemas if table.table_name == table_name), None)
+
+    def close(self) -> None:
+        """ Closes the idle connections of the backend """
+
+    def get_setup_queries(self, case_sensitive: bool) -> Sequence[str]:
+        """ Statements to run on the connection before the queries of filters with the given case sensitivity """
+        return ()
+
+    def cursor(self, connection):
+        """ Opens a cursor for a query whose result is streamed, backends override it with a server-side cursor """
+        return connection.cursor()
+
+    def prepare(self, query: str, parameters: Sequence[Any]) -> Tuple[str, Any]:
+        """ Converts a query with `?` placeholders to the paramstyle of the driver """
+        return query, parameters
+
+    @contextmanager
+    def connect(self):
+        """ A pooled connection for the duration of the block """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def execute(self, query: str, parameters: Sequence[Any] = ()) -> Iterator[Sequence[Any]]:
+        """ Runs `query` and yields its rows one by one """
+        for batch in self.stream(query, parameters, skip_columns_names=True):
+            yield from batch
+
+    def stream(self, query: str, parameters: Sequence[Any] = (), batch_size: int = DEFAULT_BATCH_SIZE,
+               setup_queries: Iterable[str] = (), skip_columns_names: bool = False) -> Iterator:
+        """
+        Runs `query` and yields its result in batches, only `batch_size` rows are held in memory at a time.
+
+        :param query: The query to run, with `?` placeholders.
+        :param parameters: The values to bind to the placeholders of the query.
+        :param batch_size: The maximal number of rows in every batch.
+        :param setup_queries: Statements to run on the connection before the query.
+        :param skip_columns_names: Yield only the batches.
+        :return: Yields the names of the columns and after that yields every batch of rows.
+        """
+        with self.connect() as connection:
+            for setup_query in setup_queries:
+                setup_cursor = connection.cursor()
+                setup_cursor.execute(setup_query)
+                setup_cursor.close()
+            cursor = self.cursor(connection)
+            try:
+                cursor.execute(*self.prepare(query, parameters))
+                if not skip_columns_names:
+                    yield [description[0] for description in cursor.description]
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if len(batch) == 0:
+                        return
+                    yield batch
+            finally:
+                cursor.close()
+
+
+class SqliteBackend(DatabaseBackend):
+    """ A local SQLite database, its connections come from the shared `SqlConnectionPool` of the file """
+    name = 'sqlite'
+    dialect = operators.SQLITE_DIALECT
+    supports_full_text = True
+    supports_lazy_schema = True
+
+    def __init__(self, database_file_path=DATABASE_PATH):
+        self.database_file_path = database_file_path
+
+    @property
+    def pool(self) -> SqlConnectionPool:
+        return SqlConnectionPool.get_pool(self.database_file_path)
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def release(self, connection) -> None:
+        self.pool.release(connection)
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def get_schema_version(self) -> int:
+        with self.connect() as connection:
+            schema_version, = connection.execute('PRAGMA schema_version').fetchone()
+        return schema_version
+
+    def load_schema(self) -> Tuple[int, List[TableSchema]]:
+        with self.connect() as connection:
+            # Read everything in one transaction so the version matches the loaded schema.
+            connection.execute('BEGIN')
+            schema_version, = connection.execute('PRAGMA schema_version').fetchone()
+            columns_rows = connection.execute(_SQLITE_COLUMNS_QUERY).fetchall()
+            foreign_keys_rows = connection.execute(_SQLITE_FOREIGN_KEYS_QUERY).fetchall()
+            connection.execute('COMMIT')
+        return schema_version, build_table_schemas(columns_rows, foreign_keys_rows)
+
+    def load_table_names(self) -> Tuple[int, List[str]]:
+        with self.connect() as connection:
+            connection.execute('BEGIN')
+            schema_version, = connection.execute('PRAGMA schema_version').fetchone()
+            table_names = [table_name for table_name, in connection.execute(_SQLITE_TABLES_QUERY).fetchall()]
+            connection.execute('COMMIT')
+        return schema_version, table_names
+
+    def load_table(self, table_name: str, table_names: Iterable[str]) -> Optional[TableSchema]:
+        with self.connect() as connection:
+            connection.execute('BEGIN')
+            columns_rows = connection.execute(_SQLITE_TABLE_COLUMNS_QUERY, (table_name, table_name)).fetchall()
+            foreign_keys_rows = connection.execute(_SQLITE_TABLE_FOREIGN_KEYS_QUERY,
+                                                   (table_name, table_name)).fetchall()
+            connection.execute('COMMIT')
+        table_schemas = build_table_schemas(columns_rows, foreign_keys_rows, table_names)
+        return table_schemas[0] if table_schemas else None
+
+    def get_setup_queries(self, case_sensitive: bool) -> Sequence[str]:
+        return f'PRAGMA case_sensitive_like = {case_sensitive}',
+
+    def stream(self, query: str, parameters: Sequence[Any] = (), batch_size: int = DEFAULT_BATCH_SIZE,
+               setup_queries: Iterable[str] = (), skip_columns_names: bool = False) -> Iterator:
+        batches = utilities.execute_query_in_batches(query, parameters, batch_size, setup_queries,
+                                                     self.database_file_path)
+        columns_names = next(batches)
+        if not skip_columns_names:
+            yield columns_names
+        yield from batches
+
+
+class DbApiConnectionPool:
+    """ Thread safe pool of reusable connections of any DB-API 2.0 driver """
+
+    def __init__(self, connect: Callable[[], Any], pool_size: int = DEFAULT_POOL_SIZE):
+        """
+        :param connect: Opens a new connection.
+        :param pool_size: The maximal number of idle connections kept open by the pool.
+        """
+        if pool_size < 1:
+            raise ValueError(f'Invalid pool size {pool_size!r}, must be at least 1!')
+        self._connect = connect
+        self.pool_size = pool_size
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Checks out a healthy connection from the pool, a new connection is opened if no idle one is available """
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    return self._connect()
+                connection = self._idle.pop()
+            if self._is_healthy(connection):
+                return connection
+            self._close_connection(connection)
+
+    def release(self, connection) -> None:
+        """ Returns `connection` to the pool, the connection is closed if the pool is already full """
+        try:
+            # End the transaction the driver may have opened, so the next query sees fresh data.
+            connection.rollback()
+        except Exception:
+            self._close_connection(connection)
+            return
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        self._close_connection(connection)
+
+    def close(self) -> None:
+        """ Closes all the idle connections of the pool """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close_connection(connection)
+
+    @staticmethod
+    def _close_connection(connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass  # The connection is discarded anyway.
+
+    @staticmethod
+    def _is_healthy(connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+
+class DbApiBackend(DatabaseBackend):
+    """
+    A database of any DB-API 2.0 driver whose engine has `information_schema`, e.g. PostgreSQL, MySQL or DuckDB.
+
+    Drivers that buffer the whole result in `execute` stream it with a server-side cursor instead when given
+    a `cursor_factory`, e.g. `lambda connection: connection.cursor(name='sql_gui')` for psycopg2.
+    """
+    name = 'dbapi'
+
+    def __init__(self, connect: Callable[[], Any], paramstyle: str = 'qmark', schema: Optional[str] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, cursor_factory: Optional[Callable[[Any], Any]] = None):
+        """
+        :param connect: Opens a new connection to the database.
+        :param paramstyle: The paramstyle of the driver (the `paramstyle` attribute of its module).
+        :param schema: The schema whose tables are used, defaults to the current schema of the connection.
+        :param pool_size: The maximal number of idle connections kept open.
+        :param cursor_factory: Opens the cursor of a streamed query on a connection.
+        """
+        if paramstyle not in _PARAMSTYLES:
+            raise ValueError(f'Unsupported paramstyle {paramstyle!r}, supported are: {_PARAMSTYLES}')
+        self.paramstyle = paramstyle
+        self.schema = schema
+        self._pool = DbApiConnectionPool(connect, pool_size)
+        self._cursor_factory = cursor_factory
+
+    def acquire(self):
+        return self._pool.acquire()
+
+    def release(self, connection) -> None:
+        self._pool.release(connection)
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def cursor(self, connection):
+        if self._cursor_factory is None:
+            return connection.cursor()
+        return self._cursor_factory(connection)
+
+    def prepare(self, query: str, parameters: Sequence[Any]) -> Tuple[str, Any]:
+        return convert_placeholders(query, parameters, self.paramstyle)
+
+    def get_schema_version(self) -> str:
+        with self.connect() as connection:
+            return _fingerprint(self._fetch(connection, _INFORMATION_SCHEMA_COLUMNS_QUERY,
+                                            (self._get_schema(connection),)))
+
+    def load_schema(self) -> Tuple[str, List[TableSchema]]:
+        with self.connect() as connection:
+            schema = self._get_schema(connection)
+            columns_rows = self._fetch(connection, _INFORMATION_SCHEMA_COLUMNS_QUERY, (schema,))
+            primary_keys = set(self._fetch(connection, _INFORMATION_SCHEMA_PRIMARY_KEYS_QUERY, (schema,)))
+            foreign_keys_rows = self._fetch(connection, _INFORMATION_SCHEMA_FOREIGN_KEYS_QUERY, (schema,))
+        return _fingerprint(columns_rows), build_table_schemas(
+            ((table_name, column_name, sql_type, (table_name, column_name) in primary_keys,
+              str(is_nullable).upper() != 'NO')
+             for table_name, column_name, sql_type, is_nullable in columns_rows), foreign_keys_rows)
+
+    def _get_schema(self, connection) -> str:
+        if self.schema is None:
+            # The schema is resolved once, the connections of the backend are all opened the same way.
+            self.schema, = self._fetch(connection, 'SELECT current_schema()')[0]
+        return self.schema
+
+    def _fetch(self, connection, query: str, parameters: Sequence[Any] = ()) -> List[Sequence[Any]]:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(*self.prepare(query, parameters))
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+class DuckDbBackend(DbApiBackend):
+    """ A DuckDB database file, requires the `duckdb` package """
+    name = 'duckdb'
+
+    def __init__(self, database_file_path, read_only: bool = False, pool_size: int = DEFAULT_POOL_SIZE):
+        duckdb = _import_optional('duckdb')
+        if duckdb is None:
+            raise ValueError('DuckDB databases require the duckdb package')
+        self.database_file_path = database_file_path
+        # Connections of the same file share a single database instance of the process, so they see each other.
+        super().__init__(lambda: duckdb.connect(str(database_file_path), read_only=read_only), 'qmark', 'main',
+                         pool_size)
+
+
+class SqlAlchemyBackend(DatabaseBackend):
+    """
+    A database of any engine SQLAlchemy supports, requires the `sqlalchemy` package.
+
+    The connections come from the pool of the SQLAlchemy engine, streamed results use server-side cursors
+    on the dialects that have them (`stream_results`) so they are not buffered by the driver.
+    """
+    name = 'sqlalchemy'
+
+    def __init__(self, url_or_engine: Union[str, Any], schema: Optional[str] = None, **engine_options):
+        """
+        :param url_or_engine: A database URL, e.g. 'postgresql://user@host/db', or an engine.
+        :param schema: The schema whose tables are used, defaults to the default schema of the engine.
+        :param engine_options: Options of `sqlalchemy.create_engine`, e.g. `pool_size`.
+        """
+        sqlalchemy = _import_optional('sqlalchemy')
+        if sqlalchemy is None:
+            raise ValueError('Database URLs require the sqlalchemy package')
+        self.engine = sqlalchemy.create_engine(url_or_engine, **engine_options) \
+            if isinstance(url_or_engine, str) else url_or_engine
+        self.schema = schema
+        self.database_file_path = str(self.engine.url)
+        self._inspect = sqlalchemy.inspect
+
+    def acquire(self):
+        # A pooled DB-API connection, closing it returns it to the pool of the engine.
+        return self.engine.raw_connection()
+
+    def release(self, connection) -> None:
+        connection.close()
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+    def prepare(self, query: str, parameters: Sequence[Any]) -> Tuple[str, Any]:
+        return convert_placeholders(query, parameters, self.engine.dialect.paramstyle)
+
+    def get_schema_version(self) -> str:
+        inspector = self._inspect(self.engine)
+        return _fingerprint((table_name, column['name'], str(column['type']))
+                            for (_, table_name), table_columns in
+                            sorted(inspector.get_multi_columns(schema=self.schema).items())
+                            for column in table_columns)
+
+    def load_schema(self) -> Tuple[str, List[TableSchema]]:
+        inspector = self._inspect(self.engine)
+        columns_by_table = sorted(inspector.get_multi_columns(schema=self.schema).items())
+        primary_keys = inspector.get_multi_pk_constraint(schema=self.schema)
+        foreign_keys = inspector.get_multi_foreign_keys(schema=self.schema)
+
+        columns_rows = []
+        foreign_keys_rows = []
+        for key, table_columns in columns_by_table:
+            table_name = key[1]
+            primary_key = set(primary_keys.get(key, {}).get('constrained_columns') or ())
+            columns_rows += [(table_name, column['name'], str(column['type']), column['name'] in primary_key,
+                              column.get('nullable', True)) for column in table_columns]
+            for foreign_key in foreign_keys.get(key, ()):
+                foreign_keys_rows += [(table_name, foreign_key['referred_table'], from_column, to_column)
+                                      for from_column, to_column in zip(foreign_key['constrained_columns'],
+                                                                        foreign_key['referred_columns'])]
+        version = _fingerprint((table_name, column_name, sql_type)
+                               for table_name, column_name, sql_type, _, _ in columns_rows)
+        return version, build_table_schemas(columns_rows, foreign_keys_rows)
+
+    def stream(self, query: str, parameters: Sequence[Any] = (), batch_size: int = DEFAULT_BATCH_SIZE,
+               setup_queries: Iterable[str] = (), skip_columns_names: bool = False) -> Iterator:
+        with self.engine.connect() as connection:
+            for setup_query in setup_queries:
+                connection.exec_driver_sql(setup_query)
+            result = connection.execution_options(stream_results=True, max_row_buffer=batch_size) \
+                .exec_driver_sql(*self.prepare(query, parameters))
+            try:
+                if not skip_columns_names:
+                    yield list(result.keys())
+                while True:
+                    batch = result.fetchmany(batch_size)
+                    if len(batch) == 0:
+                        return
+                    yield [tuple(row) for row in batch]
+            finally:
+                result.close()
+
+
+def get_backend(database=DATABASE_PATH) -> DatabaseBackend:
+    """
+    Returns the backend of a database.
+
+    :param database: A backend, the path (or 'file:' URI) of a SQLite database, a 'duckdb:///path' URL,
+                     or the URL of any engine SQLAlchemy supports.
+    """
+    if isinstance(database, DatabaseBackend):
+        return database
+    database = str(database)
+    scheme, separator, location = database.partition('://')
+    if not separator or scheme == 'file':
+        return SqliteBackend(database)
+    if scheme == 'duckdb':
+        # 'duckdb:///data.duckdb' is a relative path like in SQLAlchemy URLs, 'duckdb:////data.duckdb' is absolute.
+        return DuckDbBackend(Path(location[1:] if location.startswith('/') else location))
+    return SqlAlchemyBackend(database)
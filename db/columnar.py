@@ -0,0 +1,342 @@
+__all__ = ['ColumnarResult']
+
+import gc
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, it is only required by the analytics mode
+    np = None
+
+from db import operators
+from db.data_structures import ColumnData, ColumnType
+from db.filters import Filter
+
+_FETCH_SIZE = 1000
+# sqlite's NOCASE collation and case insensitive LIKE only fold the ASCII letters.
+_ASCII_FOLD = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def _fold(value: str) -> str:
+    return value.translate(_ASCII_FOLD)
+
+
+def _like_to_regex(pattern: str) -> 're.Pattern':
+    """ Compiles a LIKE pattern, '%' matches any sequence of characters and '_' any single character """
+    return re.compile(''.join('.*' if character == '%' else '.' if character == '_' else re.escape(character)
+                              for character in pattern), re.DOTALL)
+
+
+def _to_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _get_sort_value(value, is_numeric: bool) -> Tuple[int, Any]:
+    """
+    Orders values like the ORDER BY of `utilities.build_order_by`: numbers before texts and texts before blobs.
+    Texts of numeric columns (e.g. dates) are compared as they are, texts of text columns case insensitively.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return 0, value or 0
+    if isinstance(value, str):
+        return 1, value if is_numeric else _fold(value)
+    return 2, value
+
+
+class _NumericColumn:
+    """ A column whose values are all numbers (or NULL), held in a single typed array """
+
+    def __init__(self, values: Sequence[Any], is_integer: bool):
+        objects = np.array(values, dtype=object)
+        self.nulls = np.equal(objects, None)
+        objects[self.nulls] = 0
+        self.values = objects.astype(np.int64 if is_integer else np.float64)
+
+    def get_values(self, indices) -> List[Any]:
+        values = self.values[indices].tolist()
+        return [None if is_null else value for value, is_null in zip(values, self.nulls[indices].tolist())]
+
+    def get_mask(self, table_filter: Filter, case_sensitive: bool):
+        operator = table_filter.operator
+        if operator is operators.NONE_OPERATOR:
+            return self.nulls.copy()
+        if operator is operators.NOT_NONE_OPERATOR:
+            return ~self.nulls
+        if operator is operators.IN_OPERATOR:
+            numbers = [number for number in map(_to_number, table_filter.value.split(',')) if number is not None]
+            return np.isin(self.values, numbers) & ~self.nulls
+
+        value = _to_number(table_filter.value)
+        comparisons = {operators.EQUALS_OPERATOR: np.equal, operators.NOT_EQUALS_OPERATOR: np.not_equal,
+                       operators.LESS_THAN_OPERATOR: np.less, operators.LESS_THAN_OR_EQUALS_OPERATOR: np.less_equal,
+                       operators.GREATER_THAN_OPERATOR: np.greater,
+                       operators.GREATER_THAN_OR_EQUALS_OPERATOR: np.greater_equal}
+        if value is None or operator not in comparisons:
+            raise ValueError(f'Can not evaluate {table_filter} on a numeric column')
+        return comparisons[operator](self.values, value) & ~self.nulls
+
+    def get_sort_key(self, descending: bool):
+        return -self.values if descending else self.values
+
+
+class _DictionaryColumn:
+    """
+    A dictionary encoded column: every distinct value is held once and the rows hold the codes of their values.
+    Filters are evaluated once per distinct value and the result is looked up by the codes of the rows.
+    """
+
+    def __init__(self, values: List[Any], is_numeric: bool):
+        lookup: Dict[Any, int] = dict()
+        # `len(lookup)` is evaluated before the value is inserted, so every new value gets the next code.
+        self.codes = np.array([lookup.setdefault(value, len(lookup)) for value in values], dtype=np.int32)
+        self.dictionary = np.empty(len(lookup), dtype=object)
+        self.dictionary[:] = list(lookup)
+        self.null_code = lookup.get(None, -1)
+        self.is_numeric = is_numeric
+        self._texts: Dict[bool, Any] = dict()
+
+    def get_values(self, indices) -> List[Any]:
+        return self.dictionary[self.codes[indices]].tolist()
+
+    def get_mask(self, table_filter: Filter, case_sensitive: bool):
+        operator = table_filter.operator
+        if operator is operators.NONE_OPERATOR:
+            return self.codes == self.null_code
+        matches = self._match(table_filter, case_sensitive)
+        if self.null_code >= 0:
+            matches[self.null_code] = False  # NULL is never equal, like or unlike anything.
+        return matches[self.codes]
+
+    def get_sort_key(self, descending: bool):
+        keys = [_get_sort_value(value, self.is_numeric) for value in self.dictionary]
+        if self.null_code >= 0:
+            keys[self.null_code] = min(keys)  # NULLs are ordered by the separate NULLs key.
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        # Equal keys get equal ranks, so rows with equal values keep their order.
+        ranks = np.empty(len(keys), dtype=np.int64)
+        rank = 0
+        for position, code in enumerate(order):
+            if position > 0 and keys[code] != keys[order[position - 1]]:
+                rank += 1
+            ranks[code] = rank
+        ranks = ranks[self.codes]
+        return -ranks if descending else ranks
+
+    def _get_texts(self, folded: bool):
+        """ The distinct values as a NumPy string array, for vectorized comparisons """
+        texts = self._texts.get(folded)
+        if texts is None:
+            texts = np.array(['' if value is None else str(value) for value in self.dictionary], dtype=str)
+            if folded:
+                # Fold the ASCII letters on the code points of the characters.
+                code_points = texts.view(np.uint32).copy()
+                code_points[(code_points >= ord('A')) & (code_points <= ord('Z'))] += ord('a') - ord('A')
+                texts = code_points.view(texts.dtype)
+            self._texts[folded] = texts
+        return texts
+
+    def _match(self, table_filter: Filter, case_sensitive: bool):
+        """ Evaluates the filter on every distinct value """
+        operator = table_filter.operator
+        value = table_filter.value
+        if operator is operators.NOT_NONE_OPERATOR:
+            return np.ones(len(self.dictionary), dtype=bool)
+        if self.is_numeric:
+            return self._match_numbers(table_filter)
+
+        if operator in operators.FULL_TEXT_OPERATORS:
+            # The trigram tokenizer of the full-text index is case insensitive.
+            case_sensitive = False
+        texts = self._get_texts(not case_sensitive)
+        value = value if case_sensitive else _fold(value)
+        if operator is operators.EQUALS_OPERATOR:
+            return texts == value
+        if operator is operators.NOT_EQUALS_OPERATOR:
+            return texts != value
+        if operator is operators.LESS_THAN_OPERATOR:
+            return texts < value
+        if operator is operators.LESS_THAN_OR_EQUALS_OPERATOR:
+            return texts <= value
+        if operator is operators.GREATER_THAN_OPERATOR:
+            return texts > value
+        if operator is operators.GREATER_THAN_OR_EQUALS_OPERATOR:
+            return texts >= value
+        if operator is operators.IN_OPERATOR:
+            return np.isin(texts, [item.strip() for item in value.split(',')])
+        if operator in (operators.STARTS_WITH_OPERATOR, operators.MATCHES_PREFIX_OPERATOR):
+            return np.char.startswith(texts, value)
+        if operator is operators.ENDS_WITH_OPERATOR:
+            return np.char.endswith(texts, value)
+        if operator is operators.CONTAINS_OPERATOR:
+            return np.char.find(texts, value) >= 0
+        if operator is operators.MATCHES_OPERATOR:
+            # Every term of the value is looked up on its own, see `operators.quote_full_text_terms`.
+            matches = np.ones(len(texts), dtype=bool)
+            for term in value.split():
+                matches &= np.char.find(texts, term) >= 0
+            return matches
+        if operator in (operators.LIKE_OPERATOR, operators.NOT_LIKE_OPERATOR):
+            pattern = _like_to_regex(value)
+            matches = np.fromiter((pattern.fullmatch(text) is not None for text in texts.tolist()), dtype=bool,
+                                  count=len(texts))
+            return matches if operator is operators.LIKE_OPERATOR else ~matches
+        raise ValueError(f'Can not evaluate {table_filter} on a text column')
+
+    def _match_numbers(self, table_filter: Filter):
+        # Like sqlite, numbers are smaller than any text, and the value of the filter is compared as a number.
+        def key(value):
+            return (0, value, '') if isinstance(value, (int, float)) else (1, 0, str(value))
+
+        operator = table_filter.operator
+        if operator is operators.IN_OPERATOR:
+            numbers = {(0, number, '') for number in map(_to_number, table_filter.value.split(','))
+                       if number is not None}
+            return np.fromiter((key(value) in numbers for value in self.dictionary), dtype=bool,
+                               count=len(self.dictionary))
+        comparisons: Dict[Any, Callable[[Any, Any], bool]] = {
+            operators.EQUALS_OPERATOR: lambda a, b: a == b, operators.NOT_EQUALS_OPERATOR: lambda a, b: a != b,
+            operators.LESS_THAN_OPERATOR: lambda a, b: a < b, operators.LESS_THAN_OR_EQUALS_OPERATOR: lambda a, b: a <= b,
+            operators.GREATER_THAN_OPERATOR: lambda a, b: a > b,
+            operators.GREATER_THAN_OR_EQUALS_OPERATOR: lambda a, b: a >= b}
+        value = _to_number(table_filter.value)
+        if value is None or operator not in comparisons:
+            raise ValueError(f'Can not evaluate {table_filter} on a numeric column')
+        compare = comparisons[operator]
+        return np.fromiter((value is not None and compare(key(item), (0, value, '')) for item in self.dictionary),
+                           dtype=bool, count=len(self.dictionary))
+
+
+class ColumnarResult:
+    """
+    A query result loaded into memory column by column, so it can be filtered and sorted again
+    without running queries on the database (requires NumPy).
+
+    Numeric columns are typed NumPy arrays, text columns (and numeric columns that hold text, e.g. dates) are
+    dictionary encoded. Filters are evaluated as vectorized masks and sorting uses a stable argsort, with the same
+    semantics as the queries of the handler: case insensitive comparisons fold the ASCII letters only,
+    NULLs never pass a comparison and are always sorted last.
+    """
+
+    def __init__(self, columns: Sequence[ColumnData], rows_count: int, data: Sequence[Any]):
+        self.columns = tuple(columns)
+        self.total_rows = rows_count
+        self._data = data
+        self._indices_by_name = {column.get_full_name(): index for index, column in enumerate(self.columns)}
+        self._mask = None
+        self._order = None
+        self._view = np.arange(rows_count)
+        self.filters: Tuple[Filter, ...] = ()
+        self.case_sensitive = False
+        self.sort_keys: Tuple[Tuple[str, bool], ...] = ()
+
+    @staticmethod
+    def load(columns: Sequence[ColumnData], batches: Iterable[Sequence[Sequence[Any]]]) -> 'ColumnarResult':
+        """
+        Loads a result into memory.
+
+        :param columns: The columns of the result, in the order of the values in the rows.
+        :param batches: The batches of rows of the result.
+        :raise ValueError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ValueError('The analytics mode requires NumPy')
+        values: List[List[Any]] = [[] for _ in columns]
+        # Millions of rows are allocated while loading, which would trigger the garbage collector over and over
+        # (it is more than half of the loading time) although they can not be in reference cycles.
+        is_gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for batch in batches:
+                for column_values, batch_values in zip(values, zip(*batch)):
+                    column_values.extend(batch_values)
+        finally:
+            if is_gc_enabled:
+                gc.enable()
+
+        data = []
+        for column, column_values in zip(columns, values):
+            is_numeric = column.column_type is ColumnType.Numeric
+            value_types = set(map(type, column_values)) - {type(None)}
+            if is_numeric and value_types <= {int, float}:
+                try:
+                    data.append(_NumericColumn(column_values, value_types <= {int}))
+                    continue
+                except OverflowError:  # Integers beyond 64 bits
+                    pass
+            data.append(_DictionaryColumn(column_values, is_numeric))
+        return ColumnarResult(columns, len(values[0]) if values else 0, data)
+
+    @staticmethod
+    def is_supported() -> bool:
+        """ Whether NumPy, which the columnar results require, is installed """
+        return np is not None
+
+    @property
+    def columns_names(self) -> List[str]:
+        return [column.get_full_name() for column in self.columns]
+
+    def __len__(self) -> int:
+        """ The number of rows that pass the filters """
+        return len(self._view)
+
+    def __iter__(self) -> Iterator[Sequence[Any]]:
+        for offset in range(0, len(self._view), _FETCH_SIZE):
+            yield from self.fetch_rows(offset, _FETCH_SIZE)
+
+    def stream(self, batch_size: int = _FETCH_SIZE) -> Iterator:
+        """ Yields the names of the columns and after that yields the rows in batches, like `export` expects """
+        yield self.columns_names
+        for offset in range(0, len(self._view), batch_size):
+            yield self.fetch_rows(offset, batch_size)
+
+    def filter(self, filters: Iterable[Filter], case_sensitive: bool = False) -> None:
+        """
+        Replaces the filters of the result, like `SqlLiteHandler.filter_last_executed_query` the filters are
+        applied on the whole loaded result and not on the previously filtered rows.
+        """
+        filters = tuple(filters)
+        mask = None
+        for table_filter in filters:
+            column_mask = self._get_column(table_filter.column_name).get_mask(table_filter, case_sensitive)
+            mask = column_mask if mask is None else mask & column_mask
+        self._mask = mask
+        self.filters = filters
+        self.case_sensitive = case_sensitive
+        self._update_view()
+
+    def sort(self, sort_keys: Sequence[Tuple[str, bool]]) -> None:
+        """
+        Sorts the result like `SqlLiteHandler.sort_current_result`.
+
+        :param sort_keys: (column full name, is descending) pairs, the first pair is the primary sort key.
+        """
+        keys = []
+        # `lexsort` sorts by its last key first, NULLs are sorted last in both directions.
+        for column_name, descending in reversed(sort_keys):
+            column = self._get_column(column_name)
+            keys.append(column.get_sort_key(descending))
+            keys.append(column.nulls if isinstance(column, _NumericColumn) else column.codes == column.null_code)
+        self._order = np.lexsort(keys) if keys else None
+        self.sort_keys = tuple(sort_keys)
+        self._update_view()
+
+    def fetch_rows(self, offset: int, limit: int) -> List[Sequence[Any]]:
+        """ Returns a single window of the filtered and sorted rows, like `SqlLiteHandler.fetch_current_rows` """
+        indices = self._view[offset:offset + limit]
+        return list(zip(*(column.get_values(indices) for column in self._data)))
+
+    def _get_column(self, column_name: str):
+        index = self._indices_by_name.get(column_name)
+        if index is None:
+            raise ValueError(f'Unknown column {column_name!r}')
+        return self._data[index]
+
+    def _update_view(self) -> None:
+        view = self._order if self._order is not None else np.arange(self.total_rows)
+        if self._mask is not None:
+            view = view[self._mask[view]]
+        self._view = view
@@ -1,21 +1,261 @@
+import hashlib
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Union
+
+from db.data_structures import ConnectionProfile
 
 path = Path(os.path.dirname(__file__))
 DATABASE_PATH = path.parent / "db/chinook.db"
+# Directory of the files the application keeps about the databases it opens (statistics, caches etc.)
+STATE_DIRECTORY = Path.home() / ".sql_gui"
+
+DEFAULT_POOL_SIZE = 4
+# The number of prepared statements every connection keeps, so repeated queries are not compiled again.
+DEFAULT_CACHED_STATEMENTS = 256
+# PRAGMAs that are applied once on every new connection of the pool.
+# A negative cache_size is in KiB (so -64000 is ~64MB), see https://www.sqlite.org/pragma.html#pragma_cache_size
+# `journal_mode` is not set by default because it is persistent and changes the database file itself.
+DEFAULT_PRAGMAS: Mapping[str, Union[str, int]] = {
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+DEFAULT_PROFILE = ConnectionProfile('default', pragmas=DEFAULT_PRAGMAS)
+# For reading a live database that another process writes to: the database can not be written by mistake,
+# pages are read through the memory map and a large cache, and temporary tables (e.g. of sorts) stay in memory.
+# Readers of a WAL database are not blocked by its writer, the busy timeout waits out the short locks
+# of its checkpoints (and the writer's locks if the database is not in WAL mode).
+READ_ONLY_ANALYTICS_PROFILE = ConnectionProfile('analytics', read_only=True, pragmas={
+    'cache_size': -256000,
+    'mmap_size': 1024 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 10000,
+})
+CONNECTION_PROFILES: Mapping[str, ConnectionProfile] = {
+    profile.name: profile for profile in (DEFAULT_PROFILE, READ_ONLY_ANALYTICS_PROFILE)}
+
+
+class SqlConnectionPool:
+    """ Thread safe pool of reusable sqlite connections to a single database file """
+    _pools: Dict[str, 'SqlConnectionPool'] = dict()
+    _pools_lock = threading.Lock()
+    # The owner the connections checked out on the current thread are recorded with, see `owned_by`.
+    _owners = threading.local()
+
+    def __init__(self, database_file_path=DATABASE_PATH, pool_size: int = DEFAULT_POOL_SIZE,
+                 pragmas: Optional[Mapping[str, Union[str, int]]] = None, profile: ConnectionProfile = DEFAULT_PROFILE):
+        """
+        :param database_file_path: The database the connections of the pool are opened to.
+        :param pool_size: The maximal number of idle connections kept open by the pool.
+        :param pragmas: PRAGMAs to run once on every new connection, defaults to the PRAGMAs of the profile.
+        :param profile: How the connections open the database, see `set_profile`.
+        """
+        if pool_size < 1:
+            raise ValueError(f'Invalid pool size {pool_size!r}, must be at least 1!')
+
+        self.database_file_path = database_file_path
+        self.pool_size = pool_size
+        self.profile = profile
+        self.pragmas = dict(profile.pragmas if pragmas is None else pragmas)
+        self._idle: List[sqlite3.Connection] = []
+        # Checked out connections that were opened with a previous profile, they are closed when returned.
+        self._outdated: Set[sqlite3.Connection] = set()
+        # The checked out connections and their owners: the threads that checked them out or their `owned_by` owners.
+        self._in_use: Dict[sqlite3.Connection, Any] = dict()
+        # Databases that are attached to every connection of the pool by their schema names.
+        self._attachments: Dict[str, str] = dict()
+        self._attached: Dict[sqlite3.Connection, Set[str]] = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_pool(database_file_path=DATABASE_PATH, pool_size: int = DEFAULT_POOL_SIZE) -> 'SqlConnectionPool':
+        """
+        Returns the shared pool of `database_file_path`, the pool is created on first use.
+
+        :param database_file_path: The database of the pool.
+        :param pool_size: The maximal number of idle connections of the pool, if the pool is created.
+        """
+        key = str(database_file_path)
+        with SqlConnectionPool._pools_lock:
+            pool = SqlConnectionPool._pools.get(key)
+            if pool is None:
+                pool = SqlConnectionPool._pools[key] = SqlConnectionPool(database_file_path, pool_size)
+            return pool
+
+    @staticmethod
+    @contextmanager
+    def owned_by(owner: Any) -> Iterator[None]:
+        """
+        Records the connections the current thread checks out of any pool as checked out by `owner` rather than by
+        the thread, so `interrupt_owner(owner)` aborts only their queries even when the thread runs other work later.
+        """
+        previous = getattr(SqlConnectionPool._owners, 'owner', None)
+        SqlConnectionPool._owners.owner = owner
+        try:
+            yield
+        finally:
+            SqlConnectionPool._owners.owner = previous
+
+    @staticmethod
+    def interrupt_owner(owner: Any) -> None:
+        """ Aborts the queries running on the connections `owner` (a thread id or an `owned_by` owner) checked out """
+        with SqlConnectionPool._pools_lock:
+            pools = list(SqlConnectionPool._pools.values())
+        for pool in pools:
+            pool.interrupt(owner)
+
+    def acquire(self) -> sqlite3.Connection:
+        """ Checks out a healthy connection from the pool, a new connection is opened if no idle one is available """
+        con = None
+        while con is None:
+            with self._lock:
+                if len(self._idle) == 0:
+                    break
+                con = self._idle.pop()
+            if not self._is_healthy(con):
+                self._close_connection(con)
+                con = None
+
+        if con is None:
+            con = self._connect()
+        self._attach_databases(con)
+        owner = getattr(SqlConnectionPool._owners, 'owner', None)
+        with self._lock:
+            self._in_use[con] = threading.get_ident() if owner is None else owner
+        return con
+
+    def release(self, con: sqlite3.Connection) -> None:
+        """ Returns `con` to the pool, the connection is closed if the pool is already full """
+        if con.in_transaction:
+            con.rollback()
+        with self._lock:
+            self._in_use.pop(con, None)
+            is_outdated = con in self._outdated
+            self._outdated.discard(con)
+            if not is_outdated and len(self._idle) < self.pool_size:
+                self._idle.append(con)
+                return
+        self._close_connection(con)
+
+    def attach(self, schema_name: str, database_uri: str) -> None:
+        """
+        Attaches a database to every connection of the pool, connections are attached when they are checked out.
+
+        :param schema_name: The name the tables of the attached database are qualified with.
+        :param database_uri: The URI or path of the attached database.
+        """
+        with self._lock:
+            self._attachments[schema_name] = database_uri
+
+    @property
+    def attachments(self) -> Dict[str, str]:
+        """ The URIs of the databases attached to the connections of the pool by their schema names """
+        with self._lock:
+            return dict(self._attachments)
+
+    def set_profile(self, profile: ConnectionProfile) -> None:
+        """
+        Opens the connections of the pool with `profile` from now on, the open connections are closed:
+        the idle connections at once and the checked out connections when they are returned.
+        """
+        with self._lock:
+            self.profile = profile
+            self.pragmas = dict(profile.pragmas)
+            idle, self._idle = self._idle, []
+            self._outdated.update(self._in_use)
+        for con in idle:
+            self._close_connection(con)
+
+    def interrupt(self, owner: Any) -> None:
+        """ Aborts the queries running on the connections `owner` (a thread id or an `owned_by` owner) checked out """
+        # The connections are interrupted while they are known to be checked out by `owner`,
+        # a connection that was returned in the meantime may already run the query of another owner.
+        with self._lock:
+            for con, con_owner in self._in_use.items():
+                if con_owner == owner:
+                    con.interrupt()
+
+    def close(self) -> None:
+        """ Closes all the idle connections of the pool """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            self._close_connection(con)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections may be checked out by one thread and returned by another, access is guarded by the pool.
+        # The database is opened as a URI so URIs of attached databases are understood as well.
+        with self._lock:
+            read_only, pragmas = self.profile.read_only, list(self.pragmas.items())
+        con = sqlite3.connect(to_uri(self.database_file_path, read_only), uri=True, check_same_thread=False,
+                              cached_statements=DEFAULT_CACHED_STATEMENTS)
+        for pragma, value in pragmas:
+            con.execute(f'PRAGMA {pragma} = {value}').fetchall()
+        return con
+
+    def _attach_databases(self, con: sqlite3.Connection) -> None:
+        with self._lock:
+            attached = self._attached.setdefault(con, set())
+            missing = [(schema_name, uri) for schema_name, uri in self._attachments.items()
+                       if schema_name not in attached]
+        for schema_name, uri in missing:
+            con.execute(f'ATTACH DATABASE ? AS "{schema_name}"', (uri,))
+            with self._lock:
+                attached.add(schema_name)
+
+    def _close_connection(self, con: sqlite3.Connection) -> None:
+        with self._lock:
+            self._attached.pop(con, None)
+        con.close()
+
+    @staticmethod
+    def _is_healthy(con: sqlite3.Connection) -> bool:
+        try:
+            con.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+def get_state_file_path(database_file_path, suffix: str) -> Path:
+    """ Returns the path of a file in `STATE_DIRECTORY` that belongs to the given database, e.g. its statistics """
+    database_file_path = Path(database_file_path).resolve()
+    digest = hashlib.sha1(str(database_file_path).encode()).hexdigest()[:12]
+    return STATE_DIRECTORY / f'{database_file_path.stem}-{digest}{suffix}'
+
+
+def to_uri(database_file_path, read_only: bool = False) -> str:
+    """
+    Returns the URI of a database file, for connections that are opened with `uri=True`.
+
+    :param database_file_path: The database file, or its URI.
+    :param read_only: Open the database read-only (`mode=ro`).
+    """
+    database_file_path = str(database_file_path)
+    uri = database_file_path if database_file_path.startswith('file:') else Path(database_file_path).resolve().as_uri()
+    if read_only and 'mode=' not in uri:
+        uri += f'{"&" if "?" in uri else "?"}mode=ro'
+    return uri
 
 
 class SqlLocalDatabaseContextManager:
     def __init__(self, database_file_path=DATABASE_PATH):
         self.database_file_path = database_file_path
         self.con: Optional[sqlite3.Connection] = None
+        self._cursor: Optional[sqlite3.Cursor] = None
 
     def __enter__(self) -> sqlite3.Cursor:
-        self.con = sqlite3.connect(self.database_file_path)
-        return self.con.cursor()
+        self.con = SqlConnectionPool.get_pool(self.database_file_path).acquire()
+        self._cursor = self.con.cursor()
+        return self._cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
         if self.con is not None:
-            self.con.close()
+            SqlConnectionPool.get_pool(self.database_file_path).release(self.con)
+            self.con = None
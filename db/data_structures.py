@@ -1,6 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import Callable
+from typing import Any, Callable, Mapping, Optional, Sequence, Tuple, Union
+
+# A SQL statement with `?` placeholders and the values bound to them.
+Query = Tuple[str, Sequence[Any]]
 
 
 class ColumnType(Enum):
@@ -15,6 +18,7 @@ class ColumnData:
     column_type: ColumnType
     title: str
     is_primary: bool
+    is_nullable: bool = True
 
     def get_full_name(self) -> str:
         return f'{self.table_name}.{self.title}'
@@ -28,17 +32,141 @@ class RelatedTable:
     to_column: str
 
 
+@dataclass(frozen=True, eq=False)
+class JoinStep:
+    """ Dataclass that holds a single join of a join plan: `parent_table.from_column = table_name.to_column` """
+    parent_table: str
+    related_table: RelatedTable
+    is_left: bool = False
+
+    @property
+    def table_name(self) -> str:
+        return self.related_table.table_name
+
+
+@dataclass(frozen=True, eq=False)
+class JoinPlan:
+    """ Dataclass that holds the joins from a main table to other tables, in the order they are executed """
+    main_table: str
+    steps: Tuple[JoinStep, ...]
+    # The joined tables in a stable order that does not depend on the filters, the columns are selected in it.
+    table_names: Tuple[str, ...]
+
+
+@dataclass(frozen=True, eq=False)
+class SqlDialect:
+    """ How the queries of a database engine compare texts case insensitively (see `operators.SQLITE_DIALECT`) """
+    name: str
+    # Does the engine have sqlite's NOCASE collation and `PRAGMA case_sensitive_like`,
+    # otherwise the texts are lowercased on both sides of the comparison.
+    has_nocase_collation: bool
+
+
 @dataclass(frozen=True, eq=False)
 class Operator:
     _name: str
-    _get_as_query: Callable[[str, str, bool], str]
+    _get_as_query: Callable[[str, str, bool, SqlDialect], Query]
 
     @property
     def name(self):
         return self._name
 
-    def get_query(self, column, value, case_sensitive) -> str:
-        return self._get_as_query(column, value, case_sensitive)
+    def get_query(self, column, value, case_sensitive, dialect: SqlDialect) -> Query:
+        """ Returns the operator as a SQL condition with placeholders and the parameters to bind to them """
+        return self._get_as_query(column, value, case_sensitive, dialect)
 
     def __str__(self):
         return self._name
+
+
+@dataclass(frozen=True, eq=False)
+class TableSchema:
+    """ Dataclass that holds the metadata of a single table """
+    table_name: str
+    columns: Tuple[ColumnData, ...]
+    foreign_keys: Tuple[RelatedTable, ...]
+
+    @property
+    def primary_keys(self) -> Tuple[ColumnData, ...]:
+        return tuple(column for column in self.columns if column.is_primary)
+
+
+@dataclass(frozen=True, eq=False)
+class IndexRecommendation:
+    """ Dataclass that holds an index that is advised to be created and why """
+    table_name: str
+    column_name: str
+    uses: int
+    reason: str
+    # How many of the recent queries scanned the whole table.
+    scans: int = 0
+
+    @property
+    def index_name(self) -> str:
+        return f'sql_gui_idx_{self.table_name}_{self.column_name}'
+
+    def get_create_statement(self) -> str:
+        return f'CREATE INDEX IF NOT EXISTS "{self.index_name}" ON "{self.table_name}" ("{self.column_name}")'
+
+
+@dataclass(frozen=True, eq=False)
+class FilterSpec:
+    """ Dataclass that holds a filter of a saved query, the operator is referenced by its name """
+    column_name: str
+    operator_name: str
+    value: str = ''
+
+
+@dataclass(frozen=True, eq=False)
+class QuerySpec:
+    """ Dataclass that holds a saved query: the table, the tables joined to it, the filters and the sort order """
+    main_table: str
+    related_tables: Tuple[str, ...] = ()
+    filters: Tuple[FilterSpec, ...] = ()
+    case_sensitive: bool = False
+    sort_keys: Tuple[Tuple[str, bool], ...] = ()
+
+
+@dataclass(frozen=True, eq=False)
+class Aggregate:
+    """ Dataclass that holds an aggregate function of a grouped result and the column it is computed on """
+    function: str
+    column_name: Optional[str] = None  # None for counting the rows
+
+    def get_full_name(self) -> str:
+        """ The name of the aggregated column in the result, e.g. 'sum.tracks.Milliseconds' or 'count.*' """
+        return f'{self.function}.{self.column_name or "*"}'
+
+
+@dataclass(frozen=True, eq=False)
+class RowEstimate:
+    """ Dataclass that holds the estimated number of rows of a result and where the estimate comes from """
+    rows: int
+    source: str  # 'exact', 'stat1', 'rowid' or 'sample'
+
+    @property
+    def is_exact(self) -> bool:
+        return self.source == 'exact'
+
+    def __str__(self):
+        return f'{self.rows}' if self.is_exact else f'~{self.rows}'
+
+
+@dataclass(frozen=True, eq=False)
+class SavedQuery:
+    """ Dataclass that holds a named saved query and whether its result is materialized in the cache database """
+    name: str
+    spec: QuerySpec
+    materialize: bool = False
+    # Seconds between refreshes of the materialized result, None to refresh it only when the database changes.
+    refresh_interval: Optional[float] = None
+
+
+@dataclass(frozen=True, eq=False)
+class ConnectionProfile:
+    """ Dataclass that holds how the connections of a pool open the database, see `CONNECTION_PROFILES` """
+    name: str
+    # Open the database with a `mode=ro` URI, the databases attached to the connections can still be written.
+    read_only: bool = False
+    # PRAGMAs that are applied once on every new connection.
+    pragmas: Mapping[str, Union[str, int]] = field(default_factory=dict)
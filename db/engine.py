@@ -0,0 +1,197 @@
+__all__ = ['QueryEngine', 'QueryCursor', 'load_query_spec']
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import yaml
+except ImportError:  # YAML specs are optional
+    yaml = None
+
+from db import operators, utilities
+from db.backends import DatabaseBackend, SqliteBackend, get_backend
+from db.context_manager import DATABASE_PATH
+from db.data_structures import ColumnData, FilterSpec, QuerySpec
+from db.filters import Filter, get_filter, get_operators
+from db.full_text import FullTextIndex
+from db.join_planner import JoinPlanner, build_plan_query
+from db.schema import SchemaCatalog
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def load_query_spec(file_path) -> QuerySpec:
+    """
+    Loads a saved query from a JSON file, or from a YAML file if PyYAML is installed.
+
+    The file holds a mapping with `main_table` and optionally `related_tables` (names of tables),
+    `filters` (mappings of `column`, `operator` and `value`), `case_sensitive` and
+    `sort` (mappings of `column` and `descending`).
+    """
+    file_path = Path(file_path)
+    text = file_path.read_text(encoding='utf-8')
+    if file_path.suffix.lower() in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError(f'Loading {str(file_path)!r} requires PyYAML')
+        content = yaml.safe_load(text)
+    else:
+        content = json.loads(text)
+    return parse_query_spec(content)
+
+
+def parse_query_spec(content: Dict[str, Any]) -> QuerySpec:
+    """ Creates a `QuerySpec` from its (JSON or YAML) mapping, see `load_query_spec` """
+    if not isinstance(content, dict) or 'main_table' not in content:
+        raise ValueError('A query spec must be a mapping with a main_table')
+    return QuerySpec(
+        main_table=content['main_table'],
+        related_tables=tuple(content.get('related_tables', ())),
+        filters=tuple(FilterSpec(item['column'], item['operator'], str(item.get('value', '')))
+                      for item in content.get('filters', ())),
+        case_sensitive=bool(content.get('case_sensitive', False)),
+        sort_keys=tuple((item['column'], bool(item.get('descending', False))) for item in content.get('sort', ())))
+
+
+def query_spec_to_mapping(spec: QuerySpec) -> Dict[str, Any]:
+    """ The (JSON or YAML) mapping of `spec`, see `load_query_spec` """
+    return {
+        'main_table': spec.main_table,
+        'related_tables': list(spec.related_tables),
+        'filters': [{'column': filter_spec.column_name, 'operator': filter_spec.operator_name,
+                     'value': filter_spec.value} for filter_spec in spec.filters],
+        'case_sensitive': spec.case_sensitive,
+        'sort': [{'column': column_name, 'descending': descending} for column_name, descending in spec.sort_keys]}
+
+
+def create_filter(filter_spec: FilterSpec, columns_by_name: Dict[str, ColumnData]) -> Filter:
+    """
+    Creates the filter of a saved query.
+
+    :param filter_spec: The saved filter, its operator is referenced by its name (case insensitive).
+    :param columns_by_name: The columns of the query by their full names.
+    :raise ValueError: If the column, the operator or the value is invalid.
+    """
+    column: Optional[ColumnData] = columns_by_name.get(filter_spec.column_name)
+    if column is None:
+        raise ValueError(f'Can not filter by unknown column {filter_spec.column_name!r}')
+    table_filter = get_filter(column)
+    column_operators = get_operators(column.column_type)
+    for operator in column_operators:
+        if operator.name.lower() == filter_spec.operator_name.lower():
+            table_filter.operator = operator
+            break
+    else:
+        raise ValueError(f'Invalid operator {filter_spec.operator_name!r} for {filter_spec.column_name!r}, '
+                         f'supported operators are: {[operator.name for operator in column_operators]}')
+    table_filter.value = filter_spec.value
+    return table_filter
+
+
+class QueryCursor:
+    """
+    The streaming result of a query that `QueryEngine` ran.
+
+    Iterating the cursor yields batches of rows, the query runs only while the cursor is iterated
+    and its connection returns to the pool once the cursor is exhausted or closed.
+    """
+
+    def __init__(self, columns: Sequence[ColumnData], query: str, parameters: Sequence[Any],
+                 case_sensitive: bool, backend: DatabaseBackend, batch_size: int):
+        self.columns = tuple(columns)
+        self.query = query
+        self.parameters = tuple(parameters)
+        self._batches = backend.stream(query, self.parameters, batch_size, backend.get_setup_queries(case_sensitive))
+        self._started = False
+
+    @property
+    def columns_names(self) -> List[str]:
+        return [column.get_full_name() for column in self.columns]
+
+    def __iter__(self) -> Iterator[List[Sequence]]:
+        if not self._started:
+            self._started = True
+            next(self._batches)  # The names of the columns, which the cursor already knows.
+        return self._batches
+
+    def fetchall(self) -> List[Sequence]:
+        return [row for batch in self for row in batch]
+
+    def close(self) -> None:
+        self._batches.close()
+
+    def __enter__(self) -> 'QueryCursor':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class QueryEngine:
+    """
+    Runs saved queries on a database without any UI or handler state, e.g. in batch jobs.
+    Every call builds the query from the spec alone, so an engine can be shared by threads.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH):
+        """ :param database_file_path: The database, a path, a URL or a backend (see `backends.get_backend`). """
+        self.database_file_path = database_file_path
+        self.backend = get_backend(database_file_path)
+        self._catalog = SchemaCatalog(self.backend)
+        self._join_planner = JoinPlanner(self._catalog, database_file_path)
+        # Full-text indexes are FTS5 tables, which only sqlite has.
+        self._full_text = FullTextIndex(self._catalog, database_file_path) if self.backend.supports_full_text \
+            else None
+
+    @property
+    def catalog(self) -> SchemaCatalog:
+        return self._catalog
+
+    def run(self, spec: QuerySpec, batch_size: int = DEFAULT_BATCH_SIZE) -> QueryCursor:
+        """
+        Builds the query of `spec` and returns a cursor that streams its result.
+
+        :param spec: The saved query.
+        :param batch_size: The number of rows in every batch the cursor yields.
+        :raise ValueError: If the spec references tables, columns or operators that do not exist.
+        """
+        query, parameters, columns = self.build_query(spec)
+        return QueryCursor(columns, query, parameters, spec.case_sensitive, self.backend, batch_size)
+
+    def build_query(self, spec: QuerySpec) -> Tuple[str, Sequence[Any], List[ColumnData]]:
+        """ Returns the query of `spec`, the parameters to bind to it and the columns of its result """
+        self._catalog.validate()
+        if spec.main_table not in self._catalog.table_names:
+            raise ValueError(f'Unknown table {spec.main_table!r}')
+        # The columns do not depend on the filters, so the filters are created from the plan without them.
+        plan = self._join_planner.plan(spec.main_table, spec.related_tables)
+        columns, _ = build_plan_query(plan, self._catalog.get_columns)
+        columns_by_name = {column.get_full_name(): column for column in columns}
+
+        filters = [create_filter(filter_spec, columns_by_name) for filter_spec in spec.filters]
+        if self._full_text is not None:
+            self._full_text.validate_filters(filters)
+        else:
+            for table_filter in filters:
+                if table_filter.operator in operators.FULL_TEXT_OPERATORS:
+                    raise ValueError(f'The {table_filter.operator.name!r} operator is not supported by '
+                                     f'{self.backend.name} databases')
+        if not isinstance(self.backend, SqliteBackend):
+            # Long IN lists are bound as a JSON array that is read with SQLite's json_each.
+            for table_filter in filters:
+                if table_filter.operator is operators.IN_OPERATOR and \
+                        len(operators.split_in_values(table_filter.value)) >= operators.BULK_IN_MIN_VALUES:
+                    raise ValueError(f'{self.backend.name} databases support IN filters of less than '
+                                     f'{operators.BULK_IN_MIN_VALUES} values')
+        plan = self._join_planner.plan(spec.main_table, spec.related_tables, filters)
+        _, (query, parameters) = build_plan_query(plan, self._catalog.get_columns, filters, spec.case_sensitive,
+                                                 self.backend.dialect)
+
+        for column_name, _ in spec.sort_keys:
+            if column_name not in columns_by_name:
+                raise ValueError(f'Can not sort by unknown column {column_name!r}')
+        order_by = utilities.build_order_by(spec.sort_keys, columns_by_name, self.backend.dialect)
+        if order_by:
+            # The derived table is named, which some engines require.
+            query = f'SELECT * FROM ({query}) AS result {order_by}'
+        return query, parameters, columns
@@ -0,0 +1,148 @@
+__all__ = ['RowEstimator', 'DEFAULT_SAMPLE_SIZE']
+
+import sqlite3
+from typing import Dict, Optional, Sequence, Tuple
+
+from db import operators, utilities
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager
+from db.data_structures import RowEstimate
+from db.filters import Filter
+from db.utilities import quote_table_name
+
+DEFAULT_SAMPLE_SIZE = 1000
+
+_STAT1_EXISTS_QUERY = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+# Every row of an index is 'rows avg-rows-per-key-prefix...', the rows of a table without indexes are 'rows'.
+_STAT1_QUERY = """
+    SELECT stat, (SELECT name FROM pragma_index_info(s.idx) WHERE seqno = 0) FROM sqlite_stat1 AS s WHERE tbl = ?
+"""
+# The rowids are picked by a multiplicative hash of the row number instead of `random()`,
+# so the same table is sampled the same way every time and the sampled result can be paged and cached.
+_SAMPLED_ROWIDS = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {size})
+    SELECT (i * 2654435761) % {max_rowid} + 1 FROM n
+"""
+
+
+class RowEstimator:
+    """
+    Estimates the number of rows of a table and of the table filtered, without scanning the table.
+
+    The number of rows comes from `sqlite_stat1` (written by ANALYZE) or from the largest rowid.
+    The selectivity of equality filters on the first column of an index comes from `sqlite_stat1` as well,
+    any other filter is evaluated on a sample of the table's rows.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        self.database_file_path = database_file_path
+        self.sample_size = sample_size
+
+    def get_sample_source(self, table_name: str, size: int = None) -> str:
+        """
+        A subquery that selects a sample of about `size` rows of `table_name` spread over the whole table,
+        aliased as the table so its columns are referred to by their full names.
+        Tables without a rowid are sampled by their first rows.
+        """
+        size = size or self.sample_size
+        max_rowid = self._get_max_rowid(table_name)
+        table = quote_table_name(table_name)
+        if max_rowid is None:
+            return f'(SELECT * FROM {table} LIMIT {int(size)}) AS {table}'
+        if max_rowid <= size:
+            return table
+        rowids = _SAMPLED_ROWIDS.format(size=int(size), max_rowid=max_rowid)
+        # The rowid is selected as well, the full-text operators look the rows up by it.
+        return f'(SELECT rowid AS rowid, * FROM {table} WHERE rowid IN ({rowids})) AS {table}'
+
+    def estimate(self, table_name: str, filters: Sequence[Filter] = (), case_sensitive: bool = False) \
+            -> RowEstimate:
+        """
+        Estimates the number of rows of `table_name` that apply to `filters`.
+
+        :param table_name: The table.
+        :param filters: The filters of the table's columns by their full names.
+        :param case_sensitive: Are the filters case sensitive.
+        """
+        table_rows, source = self.estimate_table_rows(table_name)
+        if len(filters) == 0:
+            return RowEstimate(table_rows, source)
+
+        selectivity = self._get_indexed_selectivity(table_name, filters)
+        if selectivity is not None:
+            return RowEstimate(round(table_rows * selectivity), 'stat1')
+
+        conditions, parameters = [], []
+        for table_filter in filters:
+            filter_query, filter_parameters = table_filter.get_query(case_sensitive)
+            conditions.append(filter_query)
+            parameters.extend(filter_parameters)
+        condition = ' AND '.join(conditions)
+        # The filters are evaluated on the sampled rows of the table itself rather than on `get_sample_source`,
+        # a subquery can not be aliased as a table that is qualified by its schema.
+        table = quote_table_name(table_name)
+        max_rowid = self._get_max_rowid(table_name)
+        if max_rowid is None:
+            sampled_rows_source = f'{table} LIMIT {int(self.sample_size)}'
+        elif max_rowid <= self.sample_size:
+            sampled_rows_source = table
+        else:
+            rowids = _SAMPLED_ROWIDS.format(size=int(self.sample_size), max_rowid=max_rowid)
+            sampled_rows_source = f'{table} WHERE rowid IN ({rowids})'
+        (sampled_rows, matching_rows), = utilities.execute_queries((
+            f'PRAGMA case_sensitive_like = {case_sensitive}',
+            (f'SELECT COUNT(*), COALESCE(SUM(matches), 0) '
+             f'FROM (SELECT CASE WHEN {condition} THEN 1 ELSE 0 END AS matches FROM {sampled_rows_source})',
+             parameters)), self.database_file_path)
+        if sampled_rows_source == table:
+            # The whole table was read.
+            return RowEstimate(matching_rows, 'exact')
+        if sampled_rows == 0:
+            return RowEstimate(0, 'sample')
+        return RowEstimate(round(table_rows * matching_rows / sampled_rows), 'sample')
+
+    def estimate_table_rows(self, table_name: str) -> Tuple[int, str]:
+        """ The estimated number of rows of `table_name`, and its source: 'stat1', 'rowid' or 'exact' """
+        stats = self._get_stat1(table_name)
+        if stats:
+            return next(iter(stats.values()))[0], 'stat1'
+        max_rowid = self._get_max_rowid(table_name)
+        if max_rowid is not None and max_rowid > self.sample_size:
+            # Deleted rows leave gaps, so the largest rowid is an upper bound.
+            return max_rowid, 'rowid'
+        (rows, ), = utilities.execute_query(f'SELECT COUNT(*) FROM {quote_table_name(table_name)}',
+                                            database_file_path=self.database_file_path)
+        return rows, 'exact'
+
+    def _get_indexed_selectivity(self, table_name: str, filters: Sequence[Filter]) -> Optional[float]:
+        # Only equality filters on the first column of an analyzed index are estimated by the statistics.
+        stats = self._get_stat1(table_name)
+        selectivity = 1.0
+        for table_filter in filters:
+            filter_table, _, column_name = table_filter.column_name.partition('.')
+            if filter_table != table_name or table_filter.operator is not operators.EQUALS_OPERATOR \
+                    or len(stats.get(column_name, ())) < 2:
+                return None
+            rows, rows_per_key, *_ = stats[column_name]
+            selectivity *= rows_per_key / rows if rows > 0 else 0.0
+        return selectivity
+
+    def _get_stat1(self, table_name: str) -> Dict[Optional[str], Sequence[int]]:
+        """ The statistics of the table's indexes by the first column of the index """
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            if cursor.execute(_STAT1_EXISTS_QUERY).fetchone() is None:
+                return dict()
+            rows = cursor.execute(_STAT1_QUERY, (table_name,)).fetchall()
+        stats = dict()
+        for stat, first_column in rows:
+            # The stat may end with options, e.g. 'unordered'.
+            stats[first_column] = [int(value) for value in stat.split() if value.isdigit()]
+        return stats
+
+    def _get_max_rowid(self, table_name: str) -> Optional[int]:
+        try:
+            (max_rowid, ), = utilities.execute_query(f'SELECT MAX(rowid) FROM {quote_table_name(table_name)}',
+                                                     database_file_path=self.database_file_path)
+        except sqlite3.OperationalError:
+            # A WITHOUT ROWID table.
+            return None
+        return max_rowid or 0
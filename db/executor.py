@@ -0,0 +1,131 @@
+__all__ = ['QueryExecutor', 'QueryTask']
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from db.context_manager import SqlConnectionPool
+
+DEFAULT_BATCH_SIZE = 500
+
+RowsSource = Callable[[], Iterable[Sequence]]
+
+
+class QueryTask:
+    """
+    A query that runs on a worker thread of `QueryExecutor`.
+
+    The rows are sent back in batches that the UI thread collects with `get_batches`,
+    so the UI only ever touches rows that were already fetched.
+    """
+
+    def __init__(self, rows_source: RowsSource, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param rows_source: Function that executes the query and returns its rows, it is called on the worker thread.
+        :param batch_size: The number of rows in every batch.
+        """
+        self.batch_size = batch_size
+        self.rows_fetched = 0
+        self.error: Optional[Exception] = None
+        self._rows_source = rows_source
+        self._batches: 'queue.Queue[List[Sequence]]' = queue.Queue()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def is_done(self) -> bool:
+        """ Whether the query finished, failed or was cancelled """
+        return self._done.is_set()
+
+    @property
+    def has_pending_batches(self) -> bool:
+        return not self._batches.empty()
+
+    def cancel(self) -> None:
+        """
+        Stops the query, a running sqlite statement is aborted with `sqlite3.Connection.interrupt`.
+        Only the connections the task checked out are interrupted, never the query of the task that runs after it.
+        """
+        self._cancelled.set()
+        if not self.is_done:
+            SqlConnectionPool.interrupt_owner(self)
+
+    def get_batches(self, max_batches: Optional[int] = None) -> List[List[Sequence]]:
+        """ Returns (up to `max_batches` of) the batches that were fetched since the last call without blocking """
+        batches = []
+        while max_batches is None or len(batches) < max_batches:
+            try:
+                batches.append(self._batches.get_nowait())
+            except queue.Empty:
+                break
+        return batches
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """ Blocks until the task is done, returns False on timeout """
+        return self._done.wait(timeout)
+
+    def run(self) -> None:
+        """ Executes the query on the current thread """
+        with SqlConnectionPool.owned_by(self):
+            self._run()
+
+    def _run(self) -> None:
+        rows = None
+        try:
+            if self.is_cancelled:
+                return
+            rows = iter(self._rows_source())
+            batch = []
+            for row in rows:
+                if self.is_cancelled:
+                    return
+                batch.append(row)
+                if len(batch) == self.batch_size:
+                    self._put_batch(batch)
+                    batch = []
+            if len(batch) > 0:
+                self._put_batch(batch)
+        except sqlite3.OperationalError as e:
+            # An interrupted statement raises an OperationalError, which is expected after a cancel.
+            if not self.is_cancelled:
+                self.error = e
+        except Exception as e:
+            self.error = e
+        finally:
+            # Closing the generator returns its connection to the pool right away.
+            close = getattr(rows, 'close', None)
+            if close is not None:
+                close()
+            self._done.set()
+
+    def _put_batch(self, batch: List[Sequence]) -> None:
+        self.rows_fetched += len(batch)
+        self._batches.put(batch)
+
+
+class QueryExecutor:
+    """ Runs queries on background worker threads so the caller (e.g. the Tk main loop) never blocks """
+
+    def __init__(self, max_workers: int = 1):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-executor')
+
+    def submit(self, rows_source: RowsSource, batch_size: int = DEFAULT_BATCH_SIZE) -> QueryTask:
+        """
+        Schedules a query to run on a worker thread.
+
+        :param rows_source: Function that executes the query and returns its rows, it is called on the worker thread.
+        :param batch_size: The number of rows in every batch sent back from the worker.
+        :return: The task of the query, use it to collect the rows or cancel the query.
+        """
+        task = QueryTask(rows_source, batch_size)
+        self._pool.submit(task.run)
+        return task
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,201 @@
+__all__ = ['EXPORT_FORMATS', 'STREAM_FORMATS', 'get_available_formats', 'get_format_for_path', 'export_batches',
+           'write_batches']
+
+import csv
+import importlib.util
+import json
+import os
+from pathlib import Path
+from typing import Iterator, List, Sequence, TextIO
+
+CSV_FORMAT = 'csv'
+JSON_LINES_FORMAT = 'jsonl'
+PARQUET_FORMAT = 'parquet'
+EXPORT_FORMATS = (CSV_FORMAT, JSON_LINES_FORMAT, PARQUET_FORMAT)
+# The formats that can be written to a text stream, e.g. stdout.
+STREAM_FORMATS = (CSV_FORMAT, JSON_LINES_FORMAT)
+
+_FORMATS_BY_SUFFIX = {'.csv': CSV_FORMAT, '.jsonl': JSON_LINES_FORMAT, '.ndjson': JSON_LINES_FORMAT,
+                      '.parquet': PARQUET_FORMAT}
+_PARTIAL_FILE_SUFFIX = '.part'
+
+
+def get_available_formats() -> Sequence[str]:
+    """ The export formats that can be used in the current environment """
+    # Parquet export is optional, pyarrow is only imported once a Parquet file is written since it is slow to import.
+    return [export_format for export_format in EXPORT_FORMATS
+            if export_format != PARQUET_FORMAT or importlib.util.find_spec('pyarrow') is not None]
+
+
+def get_format_for_path(file_path) -> str:
+    """ Returns the export format that matches the extension of `file_path` """
+    suffix = Path(file_path).suffix.lower()
+    if suffix not in _FORMATS_BY_SUFFIX:
+        raise ValueError(f'Unknown export format for {str(file_path)!r}, supported extensions are: '
+                         f'{", ".join(_FORMATS_BY_SUFFIX)}')
+    return _FORMATS_BY_SUFFIX[suffix]
+
+
+def export_batches(result: Iterator, file_path, export_format: str = None) -> Iterator[int]:
+    """
+    Writes a result to `file_path` batch by batch, so only a single batch is held in memory.
+    The result is written to a temporary file that replaces `file_path` only when the export is complete.
+
+    :param result: Yields the names of the columns and after that yields batches of rows.
+    :param file_path: The file to write.
+    :param export_format: One of `EXPORT_FORMATS`, defaults to the format that matches the extension of `file_path`.
+    :return: Yields the number of rows written so far after every batch.
+    """
+    export_format = export_format or get_format_for_path(file_path)
+    if export_format not in get_available_formats():
+        raise ValueError(f'Export format {export_format!r} is not available, '
+                         f'supported formats are: {get_available_formats()}')
+
+    partial_path = f'{file_path}{_PARTIAL_FILE_SUFFIX}'
+    try:
+        columns_names = list(next(result))
+        writer = _WRITERS[export_format]
+        yield from writer(columns_names, result, partial_path)
+        os.replace(partial_path, file_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def write_batches(result: Iterator, output: TextIO, export_format: str = CSV_FORMAT) -> Iterator[int]:
+    """
+    Writes a result to a text stream batch by batch, so only a single batch is held in memory.
+
+    :param result: Yields the names of the columns and after that yields batches of rows.
+    :param output: The stream to write, e.g. `sys.stdout`.
+    :param export_format: One of `STREAM_FORMATS`.
+    :return: Yields the number of rows written so far after every batch.
+    """
+    if export_format not in STREAM_FORMATS:
+        raise ValueError(f'Export format {export_format!r} can not be written to a stream, '
+                         f'supported formats are: {STREAM_FORMATS}')
+    columns_names = list(next(result))
+    yield from _STREAM_WRITERS[export_format](columns_names, result, output)
+
+
+def _write_csv(columns_names: List[str], batches: Iterator[Sequence], file_path: str) -> Iterator[int]:
+    with open(file_path, 'w', newline='', encoding='utf-8') as output:
+        yield from _write_csv_to_stream(columns_names, batches, output)
+
+
+def _write_csv_to_stream(columns_names: List[str], batches: Iterator[Sequence], output: TextIO) -> Iterator[int]:
+    rows_written = 0
+    writer = csv.writer(output)
+    writer.writerow(columns_names)
+    for batch in batches:
+        writer.writerows(batch)
+        rows_written += len(batch)
+        yield rows_written
+
+
+def _write_json_lines(columns_names: List[str], batches: Iterator[Sequence], file_path: str) -> Iterator[int]:
+    with open(file_path, 'w', encoding='utf-8') as output:
+        yield from _write_json_lines_to_stream(columns_names, batches, output)
+
+
+def _write_json_lines_to_stream(columns_names: List[str], batches: Iterator[Sequence],
+                                output: TextIO) -> Iterator[int]:
+    rows_written = 0
+    for batch in batches:
+        output.writelines(json.dumps(dict(zip(columns_names, row)), default=str) + '\n' for row in batch)
+        rows_written += len(batch)
+        yield rows_written
+
+
+def _write_parquet(columns_names: List[str], batches: Iterator[Sequence], file_path: str) -> Iterator[int]:
+    import pyarrow
+    import pyarrow.parquet
+
+    rows_written = 0
+    writer = None
+    # The file the row groups are written to, the row groups move to another file whenever the schema is promoted.
+    written_path = file_path
+    try:
+        for batch in batches:
+            arrays = [_to_parquet_array([row[index] for row in batch]) for index in range(len(columns_names))]
+            schema = pyarrow.schema([(name, array.type) for name, array in zip(columns_names, arrays)])
+            if writer is not None:
+                schema = _promote_schema(writer.schema, schema)
+            if writer is not None and not schema.equals(writer.schema):
+                # A column got a wider type (e.g. NULLs then numbers, or integers then floats), so the row groups
+                # written so far are converted to the new schema.
+                writer.close()
+                promoted_path = f'{file_path}.1' if written_path == file_path else file_path
+                writer = _copy_parquet(written_path, promoted_path, schema)
+                written_path = promoted_path
+            elif writer is None:
+                writer = pyarrow.parquet.ParquetWriter(written_path, schema)
+            writer.write_table(pyarrow.Table.from_arrays(
+                [array.cast(field.type) for array, field in zip(arrays, schema)], schema=schema))
+            rows_written += len(batch)
+            yield rows_written
+        if writer is None:
+            # Write an empty file with the columns of the result.
+            pyarrow.parquet.write_table(pyarrow.table({name: [] for name in columns_names}), file_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if written_path != file_path:
+            os.replace(written_path, file_path)
+
+
+def _to_parquet_array(values: List) -> 'pyarrow.Array':
+    """ The values of a column in a batch, sqlite columns may mix types so a mixed column is converted to texts """
+    import pyarrow
+
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array([None if value is None else str(value) for value in values], pyarrow.string())
+
+
+def _promote_type(written_type: 'pyarrow.DataType', batch_type: 'pyarrow.DataType') -> 'pyarrow.DataType':
+    """ The type of a column that holds the values of both types """
+    import pyarrow
+
+    if written_type.equals(batch_type) or pyarrow.types.is_null(batch_type):
+        return written_type
+    if pyarrow.types.is_null(written_type):
+        return batch_type
+    if all(pyarrow.types.is_integer(data_type) or pyarrow.types.is_floating(data_type)
+           for data_type in (written_type, batch_type)):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _promote_schema(written_schema: 'pyarrow.Schema', batch_schema: 'pyarrow.Schema') -> 'pyarrow.Schema':
+    import pyarrow
+
+    return pyarrow.schema([(field.name, _promote_type(field.type, batch_field.type))
+                           for field, batch_field in zip(written_schema, batch_schema)])
+
+
+def _copy_parquet(source_path: str, target_path: str, schema: 'pyarrow.Schema') -> 'pyarrow.parquet.ParquetWriter':
+    """
+    Copies the row groups of a Parquet file to a new file with `schema`, one row group at a time,
+    and removes the source file.
+
+    :return: The open writer of the new file, the next row groups are written to it.
+    """
+    import pyarrow.parquet
+
+    writer = pyarrow.parquet.ParquetWriter(target_path, schema)
+    try:
+        with pyarrow.parquet.ParquetFile(source_path) as source:
+            for index in range(source.num_row_groups):
+                writer.write_table(source.read_row_group(index).cast(schema))
+    except BaseException:
+        writer.close()
+        os.remove(target_path)
+        raise
+    os.remove(source_path)
+    return writer
+
+
+_WRITERS = {CSV_FORMAT: _write_csv, JSON_LINES_FORMAT: _write_json_lines, PARQUET_FORMAT: _write_parquet}
+_STREAM_WRITERS = {CSV_FORMAT: _write_csv_to_stream, JSON_LINES_FORMAT: _write_json_lines_to_stream}
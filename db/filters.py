@@ -1,15 +1,24 @@
-__all__ = ['get_filter']
+__all__ = ['get_filter', 'get_operators']
 
 from abc import ABC, abstractmethod
-from typing import Dict, Sequence, Type
+from typing import Dict, FrozenSet, List, Sequence, Tuple, Type
 
 from db import operators
-from db.data_structures import ColumnData, ColumnType, Operator
+from db.data_structures import ColumnData, ColumnType, Operator, Query, SqlDialect
+from db.operators import SQLITE_DIALECT
 
 _filter_types_by_column_type: Dict[ColumnType, Type['Filter']] = dict()
 
 
 class Filter(ABC):
+    # Filters are created for every filter the user adds, so they hold no per-instance dict.
+    __slots__ = ('column_name', '_operator', '_value')
+    # The operators every filter of the type supports, the first one is the default.
+    operators: Tuple[Operator, ...] = (
+        operators.EQUALS_OPERATOR, operators.NOT_EQUALS_OPERATOR, operators.IN_OPERATOR,
+        operators.GREATER_THAN_OPERATOR, operators.LESS_THAN_OPERATOR, operators.GREATER_THAN_OR_EQUALS_OPERATOR,
+        operators.LESS_THAN_OR_EQUALS_OPERATOR, operators.NONE_OPERATOR, operators.NOT_NONE_OPERATOR)
+    _operators_set: FrozenSet[Operator]
 
     def __init__(self, column_name: str):
         self.column_name = column_name
@@ -18,11 +27,19 @@ class Filter(ABC):
 
     def __init_subclass__(cls, column_type: ColumnType = None, **kwargs):
         super().__init_subclass__(**kwargs)
+        cls._operators_set = frozenset(cls.operators)
         _filter_types_by_column_type[column_type] = cls
 
-    def get_query(self, case_sensitive: bool) -> str:
-        """ Returns the filter formatted to SQL query """
-        return self.operator.get_query(self.column_name, self.value, case_sensitive)
+    def get_query(self, case_sensitive: bool, column: str = None,
+                  dialect: SqlDialect = SQLITE_DIALECT) -> Query:
+        """
+        Returns the filter formatted to SQL condition and the parameters to bind to its placeholders.
+
+        :param case_sensitive: Is the filter case sensitive.
+        :param column: The column expression the filter is applied on, defaults to `column_name`.
+        :param dialect: How the database engine compares texts case insensitively.
+        """
+        return self.operator.get_query(column or self.column_name, self.value, case_sensitive, dialect)
 
     # region Properties
     @property
@@ -36,7 +53,13 @@ class Filter(ABC):
             return
         if len(value) == 0:
             raise ValueError(f"Value can't be an empty string!")
-        if not self._validate_value(value) and self.operator is not operators.IN_OPERATOR:
+        if self.operator is operators.IN_OPERATOR:
+            # Every value of the list is validated, the list may hold thousands of pasted values.
+            invalid_values = self._get_invalid_values(operators.split_in_values(value))
+            if invalid_values:
+                raise ValueError(f'Invalid values {invalid_values[:10]!r}' +
+                                 (f' and {len(invalid_values) - 10} more!' if len(invalid_values) > 10 else '!'))
+        elif not self._validate_value(value):
             raise ValueError(f'Invalid value {value!r}!')
 
         self._value = value
@@ -47,18 +70,11 @@ class Filter(ABC):
 
     @operator.setter
     def operator(self, operator: Operator):
-        if operator not in self.operators:
+        if operator not in self._operators_set:
             raise ValueError(f'Invalid operator {operator!r}, supported operators are: {self.operators}')
 
         self._operator = operator
 
-    @property
-    def operators(self) -> Sequence[Operator]:
-        """ Sequence of all the operators this filter supports """
-        return operators.EQUALS_OPERATOR, operators.NOT_EQUALS_OPERATOR, operators.IN_OPERATOR, \
-               operators.GREATER_THAN_OPERATOR, operators.LESS_THAN_OPERATOR, operators.GREATER_THAN_OR_EQUALS_OPERATOR, \
-               operators.LESS_THAN_OR_EQUALS_OPERATOR, operators.NONE_OPERATOR, operators.NOT_NONE_OPERATOR
-
     # endregion
 
     def __str__(self):
@@ -68,8 +84,29 @@ class Filter(ABC):
     def _validate_value(self, value: str):
         pass
 
+    def _get_invalid_values(self, values: Sequence[str]) -> List[str]:
+        return [value for value in values if not self._validate_value(value)]
+
+
+def _to_number(value):
+    """ Converts a numeric parameter to a number, engines with strict types do not compare numbers with text """
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
 
 class NumericFilter(Filter, column_type=ColumnType.Numeric):
+    __slots__ = ()
+
+    def get_query(self, case_sensitive: bool, column: str = None,
+                  dialect: SqlDialect = SQLITE_DIALECT) -> Query:
+        # Collations only apply to text, so numbers are always compared case sensitively.
+        query, parameters = super().get_query(True, column, dialect)
+        return query, [_to_number(parameter) for parameter in parameters]
 
     def _validate_value(self, value: str):
         try:
@@ -81,20 +118,35 @@ class NumericFilter(Filter, column_type=ColumnType.Numeric):
         #     return True
         # return False
 
+    def _get_invalid_values(self, values: Sequence[str]) -> List[str]:
+        try:
+            # All the values are converted at once, they are only validated one by one to report the invalid ones.
+            list(map(float, values))
+            return []
+        except ValueError:
+            return super()._get_invalid_values(values)
+
 
 class StringFilter(Filter, column_type=ColumnType.Text):
+    __slots__ = ()
+    # Append operators specific to this type to the base type operators.
+    # The full-text operators can only be used on columns with a full-text index (see `full_text.FullTextIndex`).
+    operators = (*Filter.operators, operators.STARTS_WITH_OPERATOR, operators.ENDS_WITH_OPERATOR,
+                 operators.CONTAINS_OPERATOR, operators.LIKE_OPERATOR, operators.NOT_LIKE_OPERATOR,
+                 *operators.FULL_TEXT_OPERATORS)
 
     def _validate_value(self, value: str):
+        if self.operator in operators.FULL_TEXT_OPERATORS:
+            return len(value) >= operators.FULL_TEXT_MIN_LENGTH
         return len(value) > 0
 
-    @property
-    def operators(self):
-        # Append operators specific to this type to the base type operators.
-        return (*super().operators, operators.STARTS_WITH_OPERATOR, operators.ENDS_WITH_OPERATOR,
-                operators.CONTAINS_OPERATOR, operators.LIKE_OPERATOR, operators.NOT_LIKE_OPERATOR)
-
 
 def get_filter(column_data: ColumnData) -> Filter:
     """ Creates a filter instance for the given column based on its name and type. """
     filter_type = _filter_types_by_column_type[column_data.column_type]
     return filter_type(column_data.get_full_name())
+
+
+def get_operators(column_type: ColumnType) -> Sequence[Operator]:
+    """ The operators of the filters of columns of `column_type`, without creating a filter """
+    return _filter_types_by_column_type[column_type].operators
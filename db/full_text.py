@@ -0,0 +1,142 @@
+__all__ = ['FullTextIndex']
+
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager
+from db.data_structures import ColumnType
+from db import operators
+from db.filters import Filter
+from db.operators import FULL_TEXT_TABLE_PREFIX, get_full_text_table_name
+from db.schema import SchemaCatalog
+from db.utilities import quote_identifier
+
+_INDEXES_QUERY = r"""
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND name LIKE 'sql\_gui\_fts\_%' ESCAPE '\' AND sql LIKE 'CREATE VIRTUAL TABLE%'
+"""
+_TRIGGER_SUFFIXES = ('_insert', '_delete', '_update')
+
+
+class FullTextIndex:
+    """
+    Manages FTS5 shadow indexes of the text columns of tables.
+
+    An index is an external-content FTS5 table with the trigram tokenizer, so any substring of at least
+    3 characters is looked up in the index instead of scanning the table. Triggers on the indexed table keep
+    the index up to date on every insert, update and delete. The 'Matches' and 'Matches prefix' operators
+    of `StringFilter` query the index, 'Matches prefix' matches the start of the whole value rather than of any word.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, database_file_path=DATABASE_PATH):
+        self._catalog = catalog
+        self.database_file_path = database_file_path
+        self._lock = threading.Lock()
+        self._schema_version: Optional[int] = None
+        self._indexed_columns: Dict[str, Tuple[str, ...]] = dict()
+
+    def get_indexed_columns(self, table_name: str) -> Sequence[str]:
+        """ The columns of `table_name` that are indexed, empty if the table has no index """
+        return self._get_indexes().get(table_name, ())
+
+    def is_indexed(self, column_full_name: str) -> bool:
+        table_name, _, column_name = column_full_name.partition('.')
+        return column_name in self.get_indexed_columns(table_name)
+
+    def validate_filters(self, filters: Iterable[Filter]) -> None:
+        """ Raises ValueError if a filter uses a full-text operator on a column without a full-text index """
+        for table_filter in filters:
+            if table_filter.operator in operators.FULL_TEXT_OPERATORS and not self.is_indexed(table_filter.column_name):
+                raise ValueError(f'{table_filter.column_name} has no full-text index, '
+                                 f'create one to use the {table_filter.operator.name!r} operator')
+
+    def create(self, table_name: str, column_names: Sequence[str]) -> None:
+        """
+        Indexes `column_names` of `table_name`, replacing the previous index of the table.
+
+        :raise ValueError: If a column is not a text column or the table has no rowid.
+        """
+        self._catalog.validate()
+        if table_name not in self._catalog.table_names:
+            raise ValueError(f'Unknown table {table_name!r}')
+        text_columns = {column.title for column in self._catalog.get_columns(table_name)
+                        if column.column_type is ColumnType.Text}
+        invalid_columns = [column_name for column_name in column_names if column_name not in text_columns]
+        if len(column_names) == 0 or invalid_columns:
+            raise ValueError(f'Only text columns can be indexed, invalid columns: {invalid_columns}')
+
+        index_table = quote_identifier(get_full_text_table_name(table_name))
+        table = quote_identifier(table_name)
+        columns = ', '.join(quote_identifier(column_name) for column_name in column_names)
+        new_values = ', '.join(f'new.{quote_identifier(column_name)}' for column_name in column_names)
+        old_values = ', '.join(f'old.{quote_identifier(column_name)}' for column_name in column_names)
+        insert = f'INSERT INTO {index_table} (rowid, {columns}) VALUES (new.rowid, {new_values});'
+        delete = (f"INSERT INTO {index_table} ({index_table}, rowid, {columns}) "
+                  f"VALUES ('delete', old.rowid, {old_values});")
+
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            try:
+                cursor.execute('BEGIN')
+                self._drop(cursor, table_name)
+                cursor.execute(f"""
+                    CREATE VIRTUAL TABLE {index_table} USING fts5(
+                        {columns}, content={quote_identifier(table_name)}, content_rowid='rowid',
+                        tokenize='trigram')
+                """)
+                triggers = (f'AFTER INSERT ON {table} BEGIN {insert} END',
+                            f'AFTER DELETE ON {table} BEGIN {delete} END',
+                            f'AFTER UPDATE ON {table} BEGIN {delete} {insert} END')
+                for suffix, trigger in zip(_TRIGGER_SUFFIXES, triggers):
+                    cursor.execute(f'CREATE TRIGGER {self._get_trigger_name(table_name, suffix)} {trigger}')
+                # Index the existing rows.
+                cursor.execute(f"INSERT INTO {index_table} ({index_table}) VALUES ('rebuild')")
+                cursor.execute('COMMIT')
+            except sqlite3.OperationalError as e:
+                cursor.execute('ROLLBACK')
+                if 'trigram' in str(e) or 'fts5' in str(e):
+                    raise ValueError(f'Full-text indexes require SQLite 3.34 or newer with FTS5: {e}') from e
+                raise ValueError(f'Can not index {table_name!r}: {e}') from e
+        self._catalog.validate()
+
+    def drop(self, table_name: str) -> None:
+        """ Drops the index of `table_name` and its triggers """
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            cursor.execute('BEGIN')
+            self._drop(cursor, table_name)
+            cursor.execute('COMMIT')
+        self._catalog.validate()
+
+    def optimize(self, table_name: str) -> None:
+        """ Merges the segments of the index, which makes the lookups faster after many changes """
+        index_table = quote_identifier(get_full_text_table_name(table_name))
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            cursor.execute(f"INSERT INTO {index_table} ({index_table}) VALUES ('optimize')")
+            cursor.connection.commit()
+
+    def _drop(self, cursor: sqlite3.Cursor, table_name: str) -> None:
+        for suffix in _TRIGGER_SUFFIXES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {self._get_trigger_name(table_name, suffix)}')
+        cursor.execute(f'DROP TABLE IF EXISTS {quote_identifier(get_full_text_table_name(table_name))}')
+
+    @staticmethod
+    def _get_trigger_name(table_name: str, suffix: str) -> str:
+        return quote_identifier(f'{get_full_text_table_name(table_name)}{suffix}')
+
+    def _get_indexes(self) -> Dict[str, Tuple[str, ...]]:
+        # The indexes are part of the schema, so they are loaded again whenever the catalog is.
+        schema_version = self._catalog.schema_version
+        with self._lock:
+            if schema_version == self._schema_version:
+                return self._indexed_columns
+
+        indexed_columns = dict()
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            for index_table, in cursor.execute(_INDEXES_QUERY).fetchall():
+                columns = tuple(name for _, name, *_ in cursor.execute('SELECT * FROM pragma_table_info(?)',
+                                                                      (index_table,)))
+                indexed_columns[index_table[len(FULL_TEXT_TABLE_PREFIX):]] = columns
+        with self._lock:
+            self._indexed_columns = indexed_columns
+            self._schema_version = schema_version
+        return indexed_columns
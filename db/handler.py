@@ -1,19 +1,89 @@
 __all__ = ['SqlLiteHandler']
 
-from typing import Iterable, Iterator, List, Sequence, Tuple
+from contextlib import closing
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from db import utilities
-from db.data_structures import ColumnData, RelatedTable
+from db import aggregation, export, utilities
+from db.columnar import ColumnarResult
+from db.context_manager import DATABASE_PATH, SqlConnectionPool, get_state_file_path
+from db.data_structures import Aggregate, ColumnData, ConnectionProfile, FilterSpec, JoinPlan, Query, QuerySpec, \
+    RelatedTable, RowEstimate
 from db.filters import Filter
+from db.full_text import FullTextIndex
+from db.engine import create_filter
+from db.estimation import RowEstimator
+from db.index_advisor import IndexAdvisor
+from db.join_planner import JoinPlanner, build_plan_query
+from db.parallel_scan import ParallelScanner
+from db.profiling import QueryProfiler
+from db.refinement import RefinementCache
+from db.result_cache import ResultCache
+from db.saved_queries import MaterializedViewCache, SavedQueryStore
+from db.schema import SchemaCatalog
+from db.workspace import Workspace
 
 
 class SqlLiteHandler:
     """ Singleton class that provides methods to retrieve data from sqlite database """
     _instance: 'SqlLiteHandler' = None
 
-    def __init__(self):
-        self._tables_names = utilities.get_all_tables_in_database()
+    def __init__(self, database_file_path=DATABASE_PATH, connection_profile: ConnectionProfile = None,
+                 schema_snapshot: bool = True):
+        """
+        :param database_file_path: The database.
+        :param connection_profile: How the database is opened (see `CONNECTION_PROFILES`), the profile of its
+                                   connection pool is kept if it is not given.
+        :param schema_snapshot: Keep the schema of the database in the state directory, so the next start
+                                reads it from there rather than introspecting the database.
+        """
+        self.database_file_path = database_file_path
+        if connection_profile is not None:
+            self.set_connection_profile(connection_profile)
+        self._catalog = SchemaCatalog(
+            database_file_path, get_state_file_path(database_file_path, '.schema.json') if schema_snapshot else None)
+        self._refinement = RefinementCache(database_file_path)
+        self.index_advisor = IndexAdvisor(self._catalog, database_file_path)
+        self.join_planner = JoinPlanner(self._catalog, database_file_path)
+        self.full_text = FullTextIndex(self._catalog, database_file_path)
+        self.result_cache = ResultCache(database_file_path)
+        self.row_estimator = RowEstimator(database_file_path)
+        self.saved_queries = SavedQueryStore(database_file_path)
+        self.materialized_views = MaterializedViewCache(self.saved_queries, database_file_path)
+        self.workspace = Workspace(self._catalog, database_file_path)
+        self.parallel_scan = ParallelScanner(database_file_path)
+        self.profiler = QueryProfiler()
         self.last_data_retrieve_query = ''
+        # The tables that were joined to build `last_data_retrieve_query`, filters are planned into its joins.
+        self._join_plan: Optional[JoinPlan] = None
+        self._joined_tables: Tuple[str, ...] = ()
+        # The table of `last_data_retrieve_query` when no tables were joined to it, and the filters applied to it.
+        self._table_name: Optional[str] = None
+        self._current_filters: Tuple[Filter, ...] = ()
+        # In the preview mode the current result is limited to its first rows, or the last data query is a sample
+        # of the table and the query of the whole table is kept until the preview is promoted.
+        self._preview_rows: Optional[int] = None
+        self._unsampled_query: Optional[str] = None
+        # The saved query whose materialized result is `last_data_retrieve_query`, its columns are named by their
+        # full names like the columns of a materialized filtered result.
+        self._materialized_query: Optional[QuerySpec] = None
+        # The table whose rows in all the shards of the workspace are `last_data_retrieve_query`, its columns are
+        # named by their full names and the shards are read in parallel (see `Workspace.stream`).
+        self._shard_table: Optional[str] = None
+        # The last executed query including its filters, used to page through the current result.
+        self.current_query = ''
+        self.current_parameters: Sequence[Any] = ()
+        self._current_case_sensitive = False
+        # The current query before it was limited to the preview and sorted, the current query before it was sorted,
+        # and the columns of its result by their full names.
+        self._filtered_query = ''
+        self._unsorted_query = ''
+        # `_filtered_query` and its parameters reading the tables of the database rather than a refined result.
+        self._source_query: Query = ('', ())
+        self._current_columns: Dict[str, ColumnData] = dict()
+        self._sort_keys: Tuple[Tuple[str, bool], ...] = ()
+        self._order_by = ''
+        # The current query, its parameters, case sensitivity, columns and source query before the result was grouped.
+        self._ungrouped: Optional[Tuple[str, Sequence[Any], bool, Dict[str, ColumnData], Query]] = None
 
     @staticmethod
     def get_instance() -> 'SqlLiteHandler':
@@ -26,7 +96,21 @@ class SqlLiteHandler:
     @property
     def table_names(self) -> Sequence[str]:
         """ The names of all the tables in the database """
-        return self._tables_names
+        return self._catalog.table_names
+
+    @property
+    def connection_profile(self) -> ConnectionProfile:
+        """ How the connections to the database are opened """
+        return SqlConnectionPool.get_pool(self.database_file_path).profile
+
+    def set_connection_profile(self, connection_profile: ConnectionProfile) -> None:
+        """ Opens the connections to the database with `connection_profile` from now on """
+        SqlConnectionPool.get_pool(self.database_file_path).set_profile(connection_profile)
+
+    @property
+    def catalog(self) -> SchemaCatalog:
+        """ The cached metadata of the database """
+        return self._catalog
 
     def get_columns_for(self, table_name: str) -> Sequence[ColumnData]:
         """
@@ -36,28 +120,89 @@ class SqlLiteHandler:
         :return: Sequence of `ColumnData` for every column in the table.
         """
         assert table_name in self.table_names
-        query = f"PRAGMA table_info({table_name})"
-        return [ColumnData(table_name, utilities.sql_type_to_enum_type(tpe), name, primary_key == 1)
-                for _, name, tpe, _, _, primary_key in utilities.execute_query(query)]
+        return self._catalog.get_columns(table_name)
 
-    def get_data_from_table(self, table_name, columns_names: Iterable[str] = None) \
-            -> Iterator[Iterable[str]]:
+    def get_data_from_table(self, table_name, columns_names: Iterable[str] = None, preview_rows: int = None,
+                            sample: bool = False) -> Iterator[Iterable[str]]:
         """
         Retrieves the data in `table_name` for the given `columns_names`.
         The function would yield the columns names first, and then every row that applies to the given `filter`.
 
+        A preview only reads a bounded number of rows however large the table is, its filters and sort apply to
+        the previewed rows until it is promoted to the whole table by `promote_preview`.
+
         :param table_name: The table from which data would be retrieved.
         :param columns_names: The name of the columns to retrieve, default is all the columns.
+        :param preview_rows: Preview only the first `preview_rows` rows of the table (or of the filtered table).
+        :param sample: Preview a sample of about `preview_rows` rows spread over the whole table instead,
+                       the sample is the same every time (see `RowEstimator.get_sample_source`).
         :return: Yields the names of the columns and after that yields every row in the table.
         """
+        self._catalog.validate()
         assert table_name in self.table_names
         # If columns was not specified, select all the columns in the table
         if columns_names is None:
             columns_names = [col.get_full_name() for col in self.get_columns_for(table_name)]
+        columns_full_names = [name if '.' in name else f'{table_name}.{name}' for name in columns_names]
+
+        query = f"SELECT {utilities.select_columns(columns_full_names)} FROM {table_name}"
+        self._preview_rows, self._unsampled_query = None, None
+        # The sample is a subquery aliased as the table, which a table of a shard qualified by its schema can not
+        # be, so a table of a shard is previewed by its first rows.
+        if sample and '.' not in table_name:
+            self._unsampled_query = query
+            query = f"SELECT {utilities.select_columns(columns_full_names)} " \
+                    f"FROM {self.row_estimator.get_sample_source(table_name, preview_rows)}"
+        elif preview_rows is not None:
+            self._preview_rows = preview_rows
+        self.last_data_retrieve_query = query
+        self._refinement.reset()
+        self._join_plan = None
+        self._materialized_query = None
+        self._shard_table = None
+        self._table_name = table_name
+        self._current_filters = ()
+        self._ungrouped = None
+        self._set_current_columns(self.get_columns_for(table_name), columns_full_names)
+        self._set_current_query(query)
+
+        return self._execute(self.current_query, label='preview' if self.is_preview else 'table')
+
+    def get_data_from_shards(self, table_name: str, columns_names: Iterable[str] = None) \
+            -> Tuple[Sequence[ColumnData], Iterator[Iterable[str]]]:
+        """
+        Retrieves the rows of `table_name` in all the shards of the workspace that have it, as a single result.
+        The shards are read in parallel and their rows are yielded as they come, filters are applied on every
+        shard in parallel as well. Sorting and paging read the UNION ALL of the shards, which has a stable order,
+        and the rows of the result are counted on every shard in parallel.
 
-        self.last_data_retrieve_query = query = f"SELECT {','.join(columns_names)} FROM {table_name}"
+        :param table_name: The table, not qualified by a shard.
+        :param columns_names: The name of the columns to retrieve, default is all the columns.
+        :return: The columns of the result, qualified by the table name, and yields every row in the result.
+        :raise ValueError: If no shard has the table or the shards do not have the same columns.
+        """
+        self._catalog.validate()
+        shard_columns = self.workspace.get_columns(table_name)
+        columns = [ColumnData(table_name, column.column_type, column.title, column.is_primary, column.is_nullable)
+                   for column in shard_columns]
+        if columns_names is None:
+            columns_names = [column.get_full_name() for column in columns]
+        columns_full_names = [name if '.' in name else f'{table_name}.{name}' for name in columns_names]
 
-        yield from utilities.execute_query(query)
+        union_query = self.workspace.build_union_query(table_name, columns_full_names)
+        self.last_data_retrieve_query = f'SELECT * FROM ({union_query})'
+        self._refinement.reset()
+        self._join_plan = None
+        self._joined_tables = ()
+        self._materialized_query = None
+        self._shard_table = table_name
+        self._table_name = None
+        self._current_filters = ()
+        self._preview_rows, self._unsampled_query = None, None
+        self._ungrouped = None
+        self._set_current_columns(columns, columns_full_names)
+        self._set_current_query(self.last_data_retrieve_query)
+        return list(self._current_columns.values()), self._stream_shards((), False)
 
     def get_related_tables(self, main_table_name: str) -> Sequence[RelatedTable]:
         """
@@ -67,54 +212,448 @@ class SqlLiteHandler:
         :return: Sequence of `RelatedTable` instances for every table related to the given table.
         """
         assert main_table_name in self.table_names
-        # Source: https://stackoverflow.com/a/54422806
-        query = f"PRAGMA foreign_key_list({main_table_name})"
-        return [RelatedTable(table_name, from_, to)
-                for _, _, table_name, from_, to, *_ in utilities.execute_query(query)
-                if table_name != main_table_name]
+        return self._catalog.get_foreign_keys(main_table_name)
 
-    def join_tables(self, main_table: str, *related_tables: RelatedTable) \
+    def get_joinable_tables(self, main_table_name: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        Finds all the tables that can be joined to `main_table_name`, directly or through other tables.
+
+        :param main_table_name: The table to which we search related tables.
+        :return: (table name, the tables it is joined through) pairs, the nearest tables first.
+        """
+        self._catalog.validate()
+        assert main_table_name in self.table_names
+        return self.join_planner.get_reachable_tables(main_table_name)
+
+    def join_tables(self, main_table: str, *table_names: str) \
             -> Tuple[Iterable[ColumnData], Iterable[str]]:
         """
-        Retrieves all the data from `main_table` and the related tables.
+        Retrieves all the data from `main_table` and the given tables.
+        Tables that are not related to `main_table` directly are joined through the shortest foreign-key path.
 
         :param main_table: The table from which data would be retrieved.
-        :param related_tables: The tables from which we would join the data.
-        :return: Yields the columns names and then yields every row in the table
+        :param table_names: The tables from which we would join the data.
+        :return: The columns of the result, and yields every row in the result.
         """
         # Make sure the table is in the database.
+        self._catalog.validate()
         assert main_table in self.table_names
 
-        # Get the info about the columns in the main table.
-        table_columns_data = self.get_columns_for(main_table)
-
-        # A list of the join queries for every table.
-        join_queries: List[str] = []
-
-        for related_table in related_tables:
-            related_table_name = related_table.table_name
-            # Get the info about the columns in the related table and append them to the columns list.
-            related_table_columns = self.get_columns_for(related_table.table_name)
-            related_table_columns_data = [column for column in related_table_columns  # For every column in the table
-                                           if column.title != related_table.to_column]  # Except the foreign-key
-
-            # Add the JOIN query for the table.
-            join_queries.append(f"""
-                    JOIN {related_table.table_name}
-                    ON {main_table}.{related_table.from_column} = {related_table_name}.{related_table.to_column}
-                    """)
-            # Add the table's columns to the columns list.
-            table_columns_data += related_table_columns_data
-
-        # And finally create the query.
-        self.last_data_retrieve_query = final_query = f"""
-                SELECT {','.join((column.get_full_name() for column in table_columns_data))}
-                FROM {main_table}
-                {' '.join(join_queries)}
-            """
-        return table_columns_data, utilities.execute_query(final_query)
-
-    def filter_last_executed_query(self, filters: Iterable[Filter], case_sensitive: bool = False):
+        plan = self.join_planner.plan(main_table, table_names)
+        table_columns_data, (final_query, _) = build_plan_query(plan, self.get_columns_for)
+        for step in plan.steps:
+            self.index_advisor.record_join(step.parent_table, step.related_table)
+        self.last_data_retrieve_query = final_query
+        self._join_plan = plan
+        self._joined_tables = tuple(table_names)
+        self._materialized_query = None
+        self._shard_table = None
+        self._table_name = None
+        self._current_filters = ()
+        self._preview_rows, self._unsampled_query = None, None
+        self._refinement.reset()
+        self._ungrouped = None
+        self._set_current_columns(table_columns_data)
+        self._set_current_query(final_query)
+        if len(plan.steps) > 0:
+            self.index_advisor.record_query(final_query)
+        return table_columns_data, self._execute(final_query, label='join')
+
+    def filter_last_executed_query(self, filters: Iterable[Filter], case_sensitive: bool = False) \
+            -> Iterator[Iterable[str]]:
+        """
+        Retrieves the result of the last data query filtered by `filters`.
+        When filters are only added to the previous ones, the new filters are evaluated on the cached previous result.
+
+        :param filters: The filters to apply on the last query.
+        :param case_sensitive: Are the filters case sensitive.
+        :return: Yields every row that applies to the filters.
+        """
+        assert len(self.last_data_retrieve_query) > 0
+        filters = list(filters)
+        self.full_text.validate_filters(filters)
+        if self._ungrouped is not None:
+            # Filtering replaces the grouped result with the filtered rows.
+            self._set_current_columns(self._ungrouped[3].values())
+            self._ungrouped = None
+        self._current_filters = tuple(filters)
+        if self._shard_table is not None:
+            # Every shard is filtered on its own, the filtered union is kept for sorting and paging.
+            self._set_current_query(*self._filter_base_query(filters, case_sensitive), case_sensitive)
+            if not self._order_by:
+                return self._stream_shards(filters, case_sensitive)
+            return self._execute_current(self.current_query, self.current_parameters, 'filter')
+        scan_ranges = self._get_scan_ranges()
+        # The filtered query reading the tables of the database, if the result is read from the refinement cache.
+        source = None
+        if len(filters) == 0:
+            self._refinement.reset()
+            query, parameters = self.last_data_retrieve_query, ()
+        elif self.is_preview:
+            # A preview only reads its first rows, so the filtered table is not materialized for refinements.
+            query, parameters = self._filter_base_query(filters, case_sensitive)
+        elif scan_ranges:
+            # A large table is scanned in parallel every time, the filtered table is not materialized either.
+            self._set_current_query(*self._filter_base_query(filters, case_sensitive), case_sensitive)
+            self.index_advisor.record_filters(filters)
+            return self._scan_in_parallel(scan_ranges, 'filter')
+        else:
+            filter_base_query = self._filter_joined_query if self._join_plan is not None else self._filter_base_query
+            query, parameters = self._refinement.refine(self.last_data_retrieve_query, filters, case_sensitive,
+                                                        filter_base_query)
+            source = filter_base_query(filters, case_sensitive)
+            self.index_advisor.record_filters(filters)
+            self.index_advisor.record_query(*source)
+        self._set_current_query(query, parameters, case_sensitive, source)
+        return self._execute_current(self.current_query, self.current_parameters, 'filter')
+
+    def open_saved_query(self, name: str) -> Tuple[List[ColumnData], Iterator[Iterable[str]]]:
+        """
+        Retrieves the result of a saved query (see `saved_queries`). The precomputed result is read if the query
+        is materialized, further filters are applied on it, otherwise its tables are joined and filtered.
+
+        :param name: The name of the saved query.
+        :return: The columns of the result, and yields every row in the result.
+        :raise ValueError: If there is no such saved query or its tables, columns or operators do not exist.
+        """
+        saved_query = self.saved_queries.get(name)
+        if saved_query is None:
+            raise ValueError(f'Unknown saved query {name!r}')
+        spec = saved_query.spec
+        self._catalog.validate()
+        unknown_tables = [table_name for table_name in (spec.main_table, *spec.related_tables)
+                          if table_name not in self.table_names]
+        if unknown_tables:
+            raise ValueError(f'The saved query {name!r} uses unknown tables {unknown_tables}')
+
+        table = self.materialized_views.get_table(name) if saved_query.materialize else None
+        if table is None:
+            columns, rows = self.join_tables(spec.main_table, *spec.related_tables)
+            columns_by_name = {column.get_full_name(): column for column in columns}
+            filters = [create_filter(filter_spec, columns_by_name) for filter_spec in spec.filters]
+            if filters:
+                rows = self.filter_last_executed_query(filters, spec.case_sensitive)
+        else:
+            plan = self.join_planner.plan(spec.main_table, spec.related_tables)
+            columns, _ = build_plan_query(plan, self.get_columns_for)
+            self.last_data_retrieve_query = f'SELECT * FROM {table}'
+            self._refinement.reset()
+            self._join_plan = None
+            self._joined_tables = ()
+            self._materialized_query = spec
+            self._shard_table = None
+            self._table_name = None
+            self._current_filters = ()
+            self._preview_rows, self._unsampled_query = None, None
+            self._ungrouped = None
+            self._set_current_columns(columns)
+            self._set_current_query(self.last_data_retrieve_query)
+            rows = self._execute(self.current_query, label='saved')
+        if spec.sort_keys:
+            rows = self.sort_current_result(spec.sort_keys)
+        return columns, rows
+
+    @property
+    def current_filters(self) -> Sequence[Filter]:
+        """ The filters of the current result, without the filters a materialized saved query was computed with """
+        return self._current_filters
+
+    def get_current_query_spec(self) -> QuerySpec:
+        """
+        The spec of the current result, its tables, filters and sort, e.g. to save it.
+
+        :raise ValueError: If the current result is grouped or of the shards, which a spec can not describe.
+        """
         assert len(self.last_data_retrieve_query) > 0
-        query = utilities.add_filters_to_query(self.last_data_retrieve_query, filters, case_sensitive)
-        yield from utilities.execute_queries((f'PRAGMA case_sensitive_like = {case_sensitive}', query))
+        if self._ungrouped is not None:
+            raise ValueError('A grouped result can not be saved, save it before grouping')
+        if self._shard_table is not None:
+            raise ValueError('A result of all the shards can not be saved, save the result of a single shard')
+        filter_specs = tuple(FilterSpec(table_filter.column_name, table_filter.operator.name, table_filter.value)
+                             for table_filter in self._current_filters)
+        if self._materialized_query is not None:
+            # The filters of the materialized result are applied on top of the saved query's filters.
+            base = self._materialized_query
+            return QuerySpec(base.main_table, base.related_tables, base.filters + filter_specs,
+                             self._current_case_sensitive if filter_specs else base.case_sensitive, self._sort_keys)
+        main_table = self._join_plan.main_table if self._join_plan is not None else self._table_name
+        return QuerySpec(main_table, self._joined_tables if self._join_plan is not None else (), filter_specs,
+                         self._current_case_sensitive, self._sort_keys)
+
+    @property
+    def is_grouped(self) -> bool:
+        """ Whether the current result is grouped by `group_current_result` """
+        return self._ungrouped is not None
+
+    def group_current_result(self, group_by: Sequence[str], aggregates: Sequence[Aggregate],
+                             having: Iterable[Filter] = ()) -> Tuple[List[ColumnData], Iterator[Iterable[str]]]:
+        """
+        Groups the current result (the last query with its filters) and computes aggregates of every group,
+        the grouping and the aggregates are computed by the database, so only the groups are fetched.
+        Grouping again replaces the previous grouping, the grouped result can be sorted, paged and exported
+        like any other result.
+
+        :param group_by: The full names of the columns to group by, all the rows are a single group if it is empty.
+        :param aggregates: The aggregates to compute, see `aggregation.AGGREGATE_FUNCTIONS`.
+        :param having: Filters on the groups, on the grouped columns or on the aggregates by their full names.
+        :return: The columns of the grouped result, and yields every group.
+        :raise ValueError: If a column, an aggregate or a filter is invalid.
+        """
+        assert len(self.current_query) > 0
+        having = list(having)
+        self.full_text.validate_filters(having)
+        query, parameters, case_sensitive, columns, source = self._ungrouped or \
+            (self._filtered_query, self.current_parameters, self._current_case_sensitive, self._current_columns,
+             self._source_query)
+        # The filters of the groups use the same case sensitivity as the filters of the rows.
+        group_columns, (group_query, group_parameters) = aggregation.build_group_query(
+            self._limit_to_preview(query), parameters, columns, group_by, aggregates, having, case_sensitive)
+        _, group_source = aggregation.build_group_query(
+            self._limit_to_preview(source[0]), source[1], columns, group_by, aggregates, having, case_sensitive)
+
+        self._ungrouped = query, parameters, case_sensitive, columns, source
+        self._set_current_columns(group_columns)
+        self._set_current_query(group_query, group_parameters, case_sensitive, group_source)
+        return group_columns, self._execute_current(self.current_query, self.current_parameters, 'group')
+
+    def ungroup_current_result(self) -> Iterator[Iterable[str]]:
+        """ Drops the grouping of the current result, and yields every row of the result before it was grouped """
+        if self._ungrouped is not None:
+            query, parameters, case_sensitive, columns, source = self._ungrouped
+            self._ungrouped = None
+            self._set_current_columns(columns.values())
+            self._set_current_query(query, parameters, case_sensitive, source)
+        return self.execute_current_query()
+
+    @property
+    def sort_keys(self) -> Sequence[Tuple[str, bool]]:
+        """ The (column full name, is descending) pairs the current result is sorted by """
+        return self._sort_keys
+
+    def sort_current_result(self, sort_keys: Sequence[Tuple[str, bool]]) -> Iterator[Iterable[str]]:
+        """
+        Sorts the current result in the database with ORDER BY, the sort is kept when filters are applied.
+        Numeric columns are compared by their values (dates as their texts), text columns case insensitively
+        and NULLs are always last.
+
+        :param sort_keys: (column full name, is descending) pairs, the first pair is the primary sort key.
+        :return: Yields every row of the sorted result.
+        """
+        assert len(self.current_query) > 0
+        self._order_by = utilities.build_order_by(sort_keys, self._current_columns)
+        self._sort_keys = tuple(sort_keys)
+        self._set_current_query(self._filtered_query, self.current_parameters, self._current_case_sensitive,
+                                self._source_query)
+        ranges = self._get_scan_ranges()
+        if ranges:
+            # Every range is sorted on its own and the sorted ranges are merged.
+            return self._scan_in_parallel(ranges, 'sort')
+        return self._execute_current(self.current_query, self.current_parameters, 'sort')
+
+    @property
+    def is_preview(self) -> bool:
+        """ Whether the current result is a preview of the table, see `get_data_from_table` """
+        return self._preview_rows is not None or self._unsampled_query is not None
+
+    def promote_preview(self) -> Iterator[Iterable[str]]:
+        """
+        Replaces the preview of the current table by the whole table, with the same filters and sort.
+        A grouped preview is ungrouped.
+
+        :return: Yields every row of the whole result.
+        """
+        if not self.is_preview:
+            return self.execute_current_query()
+        self._preview_rows = None
+        if self._unsampled_query is not None:
+            self.last_data_retrieve_query, self._unsampled_query = self._unsampled_query, None
+        self._refinement.reset()
+        return self.filter_last_executed_query(self._current_filters, self._current_case_sensitive)
+
+    def estimate_current_rows(self) -> Optional[RowEstimate]:
+        """
+        Estimates the number of rows of the whole current table with its filters without scanning it,
+        which is how many rows a preview stands for (see `RowEstimator`).
+
+        :return: The estimate, or None if the current result is joined or grouped.
+        """
+        if self._table_name is None or self._ungrouped is not None:
+            return None
+        return self.row_estimator.estimate(self._table_name, self._current_filters, self._current_case_sensitive)
+
+    def execute_current_query(self) -> Iterator[Iterable[str]]:
+        """ Runs the current query (the last query with its filters) again and yields its rows """
+        assert len(self.current_query) > 0
+        return self._execute_current(self.current_query, self.current_parameters)
+
+    def stream_current_result(self, batch_size: int = 1000) -> Iterator:
+        """
+        Runs the current query again and yields its rows in batches, without holding the whole result in memory.
+        The query reads the tables of the database with the bound filters rather than a refined result, which is
+        a copy of the result that the refinement cache may replace while the result is streamed.
+
+        :param batch_size: The maximal number of rows in every batch.
+        :return: Yields the names of the columns and after that yields every batch of rows.
+        """
+        assert len(self.current_query) > 0
+        # Capture the current query now, the result may be streamed after the current query was changed.
+        query, parameters = self._source_query
+        query = self._limit_to_preview(query)
+        if self._order_by:
+            query = f'SELECT * FROM ({query}) {self._order_by}'
+        case_sensitive = self._current_case_sensitive
+
+        def stream():
+            yield from utilities.execute_query_in_batches(query, parameters, batch_size,
+                                                          (f'PRAGMA case_sensitive_like = {case_sensitive}',),
+                                                          self.database_file_path)
+
+        return stream()
+
+    def export_current_result(self, file_path, export_format: str = None, batch_size: int = 1000) -> Iterator[int]:
+        """
+        Writes the current result (the last query with its filters) to a file, streaming it batch by batch.
+
+        :param file_path: The file to write.
+        :param export_format: One of `export.EXPORT_FORMATS`, defaults to the format that matches the file extension.
+        :param batch_size: The number of rows fetched and written at once.
+        :return: Yields the number of rows written so far after every batch.
+        """
+        return export.export_batches(self.stream_current_result(batch_size), file_path, export_format)
+
+    def count_current_rows(self) -> int:
+        """ Counts the rows in the result of the current query, the shards are counted in parallel """
+        assert len(self.current_query) > 0
+        if self._shard_table is not None and self._ungrouped is None:
+            # Every shard counts its own rows.
+            return sum(count for count, in self._stream_shards(self._current_filters, self._current_case_sensitive,
+                                                               'COUNT(*)'))
+        # Sorting does not change the count, so the unsorted query is counted.
+        (count, ), = self._execute_current(f"SELECT COUNT(*) FROM ({self._unsorted_query})", self.current_parameters,
+                                           'count')
+        return count
+
+    def fetch_current_rows(self, offset: int, limit: int) -> Sequence[Iterable[str]]:
+        """
+        Retrieves a single window of rows from the result of the current query.
+
+        :param offset: The index of the first row to retrieve.
+        :param limit: The maximal number of rows to retrieve.
+        :return: The rows of the window.
+        """
+        assert len(self.current_query) > 0
+        return list(self._execute_current(f"SELECT * FROM ({self._unsorted_query}) {self._order_by} LIMIT ? OFFSET ?",
+                                          (*self.current_parameters, int(limit), int(offset)), 'page'))
+
+    def load_columnar_result(self, batch_size: int = 1000) -> ColumnarResult:
+        """
+        Loads the result of the last data query, without its filters, into memory column by column,
+        so it can be filtered and sorted again without querying the database (see `ColumnarResult`).
+
+        :param batch_size: The number of rows fetched at once.
+        :raise ValueError: If NumPy is not installed.
+        """
+        assert len(self.last_data_retrieve_query) > 0
+        batches = utilities.execute_query_in_batches(self.last_data_retrieve_query, (), batch_size,
+                                                     database_file_path=self.database_file_path)
+        next(batches)  # The names of the columns, the current columns are already known.
+        columns = self._ungrouped[3] if self._ungrouped is not None else self._current_columns
+        return ColumnarResult.load(list(columns.values()), batches)
+
+    def _filter_joined_query(self, filters: Sequence[Filter], case_sensitive: bool) -> Query:
+        # Plan the joins again, the filters may turn LEFT joins to INNER joins and are pushed into the joins.
+        plan = self.join_planner.plan(self._join_plan.main_table, self._joined_tables, filters)
+        _, query = build_plan_query(plan, self.get_columns_for, filters, case_sensitive)
+        return query
+
+    def _filter_base_query(self, filters: Sequence[Filter], case_sensitive: bool) -> Query:
+        return utilities.add_filters_to_query(self.last_data_retrieve_query, filters, case_sensitive,
+                                              quote_columns=self._materialized_query is not None or
+                                              self._shard_table is not None)
+
+    def _get_scan_ranges(self) -> List[Tuple[int, int]]:
+        """ The rowid ranges the current table is scanned in, empty if the current result is not scanned in parallel """
+        if self._table_name is None or self.is_preview or self._ungrouped is not None:
+            return []
+        return self.parallel_scan.get_rowid_ranges(self._table_name)
+
+    def _scan_in_parallel(self, ranges: Sequence[Tuple[int, int]], label: str) -> Iterator[Iterable[str]]:
+        profile = self.profiler.start(self.current_query, self.current_parameters, f'parallel {label}')
+        rows = self.parallel_scan.scan(self._table_name, self._current_columns, self._current_filters,
+                                       self._current_case_sensitive, self._sort_keys, ranges)
+        return rows if profile is None else self.profiler.profile_rows(profile, rows)
+
+    def _stream_shards(self, filters: Sequence[Filter], case_sensitive: bool, select: str = None) \
+            -> Iterator[Iterable[str]]:
+        select = f'SELECT {select or utilities.select_columns(self._current_columns)} FROM {self._shard_table}'
+        query, parameters = utilities.add_filters_to_query(select, filters, case_sensitive)
+        profile = self.profiler.start(query, parameters, 'shards')
+        rows = _flatten_batches(self.workspace.stream(
+            query, parameters, self.workspace.get_shards(self._shard_table),
+            setup_queries=(f'PRAGMA case_sensitive_like = {case_sensitive}',)))
+        return rows if profile is None else self.profiler.profile_rows(profile, rows)
+
+    def _set_current_columns(self, columns: Iterable[ColumnData], full_names: Iterable[str] = None) -> None:
+        # A new base query starts unsorted.
+        columns_by_name = {column.get_full_name(): column for column in columns}
+        if full_names is not None:
+            columns_by_name = {full_name: columns_by_name[full_name] for full_name in full_names}
+        self._current_columns = columns_by_name
+        self._sort_keys = ()
+        self._order_by = ''
+
+    def _limit_to_preview(self, query: str) -> str:
+        return f'SELECT * FROM ({query}) LIMIT {int(self._preview_rows)}' if self._preview_rows is not None else query
+
+    def _set_current_query(self, query: str, parameters: Sequence[Any] = (), case_sensitive: bool = False,
+                           source: Query = None) -> None:
+        # `source` is the same query reading the tables of the database, when `query` reads a refined result.
+        self._source_query = source if source is not None else (query, tuple(parameters))
+        self._filtered_query = query
+        query = self._limit_to_preview(query)
+        self._unsorted_query = query
+        self.current_query = f'SELECT * FROM ({query}) {self._order_by}' if self._order_by else query
+        self.current_parameters = tuple(parameters)
+        self._current_case_sensitive = case_sensitive
+
+    def _execute(self, query: str, parameters: Sequence[Any] = (), label: str = 'query') -> Iterator[Iterable[str]]:
+        profile = self.profiler.start(query, parameters, label)
+        if profile is None:
+            return utilities.execute_query(query, parameters, self.database_file_path)
+        return self.profiler.profile_rows(profile, self.profiler.execute(((query, parameters),), profile,
+                                                                         self.database_file_path))
+
+    def _execute_current(self, query: str, parameters: Sequence[Any] = (), label: str = 'query') \
+            -> Iterator[Iterable[str]]:
+        profile = self.profiler.start(query, parameters, label)
+        if profile is None:
+            # The filtered result is materialized lazily, on the thread that reads it first.
+            self._refinement.materialize_pending()
+        else:
+            with profile.span('materialize'):
+                self._refinement.materialize_pending()
+        # `case_sensitive_like` is a connection setting, so it is set again for every query on the current result.
+        case_sensitive = self._current_case_sensitive
+        queries = (f'PRAGMA case_sensitive_like = {case_sensitive}', (query, parameters))
+
+        if profile is None:
+            yield from self.result_cache.execute(
+                query, (case_sensitive, *parameters),
+                lambda: utilities.execute_queries(queries, self.database_file_path))
+            return
+
+        def execute():
+            profile.cache_hit = False
+            return self.profiler.execute(queries, profile, self.database_file_path)
+
+        profile.cache_hit = True
+        yield from self.profiler.profile_rows(
+            profile, self.result_cache.execute(query, (case_sensitive, *parameters), execute))
+
+
+def _flatten_batches(batches: Iterator) -> Iterator[Iterable[str]]:
+    """ Yields the rows of batches that start with the names of their columns, like `Workspace.stream` yields """
+    with closing(batches):
+        next(batches, None)
+        for batch in batches:
+            yield from batch
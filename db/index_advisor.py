@@ -0,0 +1,164 @@
+__all__ = ['IndexAdvisor']
+
+import json
+import threading
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Sequence, Set, Tuple
+
+from db import operators
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager, get_state_file_path
+from db.data_structures import IndexRecommendation, RelatedTable
+from db.filters import Filter
+from db.schema import SchemaCatalog
+
+# Operators that can not use an index, filtering on them does not count as a use of the column.
+_NON_INDEXABLE_OPERATORS = frozenset(operator.name for operator in (
+    operators.NOT_EQUALS_OPERATOR, operators.ENDS_WITH_OPERATOR, operators.CONTAINS_OPERATOR,
+    operators.LIKE_OPERATOR, operators.NOT_LIKE_OPERATOR, operators.NONE_OPERATOR, operators.NOT_NONE_OPERATOR))
+
+_FILTER_USE = 'filter'
+_JOIN_USE = 'join'
+_MAX_RECENT_QUERIES = 50
+# The statistics are written to the state directory once every that many recorded uses, and when the advisor is
+# garbage collected or the interpreter exits.
+_SAVE_INTERVAL = 20
+DEFAULT_MIN_USES = 2
+
+
+def explain_query_plan(query: str, parameters: Sequence[Any] = (), database_file_path=DATABASE_PATH) -> List[str]:
+    """ Returns the details of every step of the query plan of `query` """
+    with SqlLocalDatabaseContextManager(database_file_path) as cursor:
+        return [detail for *_, detail in cursor.execute(f'EXPLAIN QUERY PLAN {query}', parameters)]
+
+
+def get_scanned_tables(query_plan: Iterable[str]) -> Set[str]:
+    """ Returns the tables a query plan reads entirely, without the help of an index """
+    scanned_tables = set()
+    for detail in query_plan:
+        words = detail.split()
+        # e.g. 'SCAN tracks' or 'SCAN TABLE tracks' on older sqlite versions
+        if len(words) >= 2 and words[0] == 'SCAN' and 'USING' not in words:
+            scanned_tables.add(words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1])
+    return scanned_tables
+
+
+class IndexAdvisor:
+    """
+    Collects which columns are used to filter and join tables and advises which of them should be indexed.
+
+    A column is advised once it was used at least `min_uses` times and a lookup on it has to scan the whole table.
+    The usage statistics are saved in the state directory, so they keep improving between sessions. They are saved
+    every `_SAVE_INTERVAL` recorded uses and on exit rather than on every use, to keep the disk out of the query path.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, database_file_path=DATABASE_PATH, min_uses: int = DEFAULT_MIN_USES):
+        self._catalog = catalog
+        self.database_file_path = database_file_path
+        self.min_uses = min_uses
+        self._statistics_path = get_state_file_path(database_file_path, '.index_stats.json')
+        self._lock = threading.Lock()
+        # Number of uses by kind ('filter' / 'join') for every 'table.column'
+        self._uses: Dict[str, Dict[str, int]] = self._load_statistics()
+        self._recent_queries: Deque[Tuple[str, Tuple[Any, ...]]] = deque(maxlen=_MAX_RECENT_QUERIES)
+        self._unsaved_uses = 0
+        weakref.finalize(self, _save_statistics, self._statistics_path, self._uses, self._lock)
+
+    def record_filters(self, filters: Iterable[Filter]) -> None:
+        self._record((table_filter.column_name for table_filter in filters
+                      if table_filter.operator.name not in _NON_INDEXABLE_OPERATORS), _FILTER_USE)
+
+    def record_join(self, main_table: str, related_table: RelatedTable) -> None:
+        self._record((f'{main_table}.{related_table.from_column}',
+                      f'{related_table.table_name}.{related_table.to_column}'), _JOIN_USE)
+
+    def record_query(self, query: str, parameters: Sequence[Any] = ()) -> None:
+        """ Remembers a query the handler generated, its plan is checked for full scans by `get_recommendations` """
+        with self._lock:
+            if (query, tuple(parameters)) not in self._recent_queries:
+                self._recent_queries.append((query, tuple(parameters)))
+
+    def get_recommendations(self) -> List[IndexRecommendation]:
+        """
+        Returns the indexes that are advised to be created, the columns of the tables that the recent queries scanned
+        the most often first, then the most used columns.
+        """
+        with self._lock:
+            uses = {full_name: dict(kinds) for full_name, kinds in self._uses.items()}
+            recent_queries = list(self._recent_queries)
+
+        # How many of the recent queries had to scan each table entirely.
+        scans_by_table: Dict[str, int] = dict()
+        for query, parameters in recent_queries:
+            for table_name in get_scanned_tables(explain_query_plan(query, parameters, self.database_file_path)):
+                scans_by_table[table_name] = scans_by_table.get(table_name, 0) + 1
+
+        recommendations = []
+        for full_name, kinds in uses.items():
+            table_name, _, column_name = full_name.partition('.')
+            total_uses = sum(kinds.values())
+            if total_uses < self.min_uses or table_name not in self._catalog.table_names:
+                continue
+            # Probe whether sqlite can look the column up without scanning the table.
+            probe = f'SELECT 1 FROM "{table_name}" WHERE "{column_name}" = ?'
+            if table_name not in get_scanned_tables(explain_query_plan(probe, (None,), self.database_file_path)):
+                continue
+            kinds_description = ', '.join(f'{count} {kind}s' for kind, count in sorted(kinds.items()))
+            scans = scans_by_table.get(table_name, 0)
+            reason = f'used in {kinds_description}, {scans} of the recent queries scanned the whole {table_name} table'
+            recommendations.append(IndexRecommendation(table_name, column_name, total_uses, reason, scans))
+
+        return sorted(recommendations, key=lambda recommendation: (recommendation.scans, recommendation.uses),
+                      reverse=True)
+
+    def save(self) -> None:
+        """ Writes the usage statistics to the state directory """
+        with self._lock:
+            self._unsaved_uses = 0
+        _save_statistics(self._statistics_path, self._uses, self._lock)
+
+    def create_indexes(self, recommendations: Iterable[IndexRecommendation]) -> List[str]:
+        """
+        Creates the indexes of `recommendations` and updates the statistics of the query planner.
+
+        :return: The names of the created indexes.
+        """
+        created = []
+        analyzed_tables = set()
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            for recommendation in recommendations:
+                cursor.execute(recommendation.get_create_statement())
+                created.append(recommendation.index_name)
+                analyzed_tables.add(recommendation.table_name)
+            for table_name in analyzed_tables:
+                cursor.execute(f'ANALYZE "{table_name}"')
+            cursor.connection.commit()
+        return created
+
+    def _record(self, full_names: Iterable[str], kind: str) -> None:
+        with self._lock:
+            for full_name in full_names:
+                kinds = self._uses.setdefault(full_name, dict())
+                kinds[kind] = kinds.get(kind, 0) + 1
+                self._unsaved_uses += 1
+            must_save = self._unsaved_uses >= _SAVE_INTERVAL
+        if must_save:
+            self.save()
+
+    def _load_statistics(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self._statistics_path) as statistics_file:
+                return json.load(statistics_file)
+        except (OSError, ValueError):
+            return dict()
+
+
+def _save_statistics(statistics_path, uses: Dict[str, Dict[str, int]], lock: threading.Lock) -> None:
+    with lock:
+        content = json.dumps(uses)
+    try:
+        statistics_path.parent.mkdir(parents=True, exist_ok=True)
+        statistics_path.write_text(content)
+    except OSError:
+        # The statistics are only an optimization, failing to save them should not fail the query.
+        pass
@@ -0,0 +1,296 @@
+__all__ = ['JoinPlanner', 'build_plan_query']
+
+import sqlite3
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from db import operators, utilities
+from db.backends import SqliteBackend
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager
+from db.data_structures import ColumnData, JoinPlan, JoinStep, Query, RelatedTable, SqlDialect
+from db.filters import Filter
+from db.schema import SchemaCatalog
+
+_STATISTICS_QUERY = """
+    SELECT s.tbl, s.stat, i.name
+    FROM sqlite_stat1 AS s LEFT JOIN pragma_index_info(s.idx) AS i ON i.seqno = 0
+"""
+
+# The fraction of the rows a filter is assumed to keep when sqlite_stat1 has nothing better to tell.
+_DEFAULT_SELECTIVITY = 0.5
+_SELECTIVITY_BY_OPERATOR = {
+    operators.EQUALS_OPERATOR.name: 0.1,
+    operators.IN_OPERATOR.name: 0.3,
+    operators.NONE_OPERATOR.name: 0.1,
+    operators.NOT_EQUALS_OPERATOR.name: 0.9,
+    operators.NOT_NONE_OPERATOR.name: 0.9,
+    operators.LESS_THAN_OPERATOR.name: 0.25,
+    operators.LESS_THAN_OR_EQUALS_OPERATOR.name: 0.25,
+    operators.GREATER_THAN_OPERATOR.name: 0.25,
+    operators.GREATER_THAN_OR_EQUALS_OPERATOR.name: 0.25,
+    operators.STARTS_WITH_OPERATOR.name: 0.1,
+}
+_DEFAULT_ROW_COUNT = 1000
+
+# (table, related table, whether the table holds the foreign key)
+Edge = Tuple[str, RelatedTable, bool]
+
+
+def _is_null_rejecting(table_filter: Filter) -> bool:
+    """ Whether the filter drops rows whose column is NULL, e.g. the rows an outer join added """
+    return table_filter.operator is not operators.NONE_OPERATOR
+
+
+def _get_table_name(table_filter: Filter) -> str:
+    # The table of an attached database is qualified by its schema, e.g. 'shard.tracks.Name'.
+    return table_filter.column_name.rpartition('.')[0]
+
+
+class _TableStatistics:
+    """ The row count of a table and the average number of rows per value of its indexed columns """
+
+    def __init__(self, row_count: int):
+        self.row_count = max(row_count, 1)
+        self.rows_per_value: Dict[str, float] = dict()
+
+    def get_selectivity(self, table_filter: Filter) -> float:
+        column_name = table_filter.column_name.rpartition('.')[2]
+        if table_filter.operator is operators.EQUALS_OPERATOR and column_name in self.rows_per_value:
+            return min(self.rows_per_value[column_name] / self.row_count, 1.0)
+        return _SELECTIVITY_BY_OPERATOR.get(table_filter.operator.name, _DEFAULT_SELECTIVITY)
+
+
+class JoinPlanner:
+    """
+    Plans the joins from a main table to any table that is reachable over the foreign-key graph.
+
+    A table that is several relationships away is joined over the shortest path, the tables on the way
+    are joined as well. Joins that can not drop rows of the main table are INNER joins, the others are
+    LEFT joins unless a filter rejects their missing rows anyway. Joins are ordered by how much they are
+    estimated to shrink the result, using the row counts of `sqlite_stat1` (see `ANALYZE`).
+    """
+
+    def __init__(self, catalog: SchemaCatalog, database_file_path=DATABASE_PATH):
+        self._catalog = catalog
+        self.database_file_path = database_file_path
+        self._lock = threading.Lock()
+        self._schema_version: Optional[int] = None
+        self._graph: Dict[str, List[Edge]] = dict()
+        # The shortest path tree of every main table: table -> the edge it is reached by.
+        self._trees: Dict[str, Dict[str, Edge]] = dict()
+
+    def get_reachable_tables(self, main_table: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        Returns every table that can be joined to `main_table`, the nearest tables first.
+
+        :return: (table name, the tables on the way to it) pairs.
+        """
+        tree = self._get_tree(main_table)
+        return [(table_name, tuple(step.parent_table for step in self._get_path(tree, main_table, table_name)[1:]))
+                for table_name in tree]
+
+    def plan(self, main_table: str, table_names: Iterable[str], filters: Sequence[Filter] = ()) -> JoinPlan:
+        """
+        Plans the joins of `main_table` with `table_names`.
+
+        :param main_table: The table from which data would be retrieved.
+        :param table_names: The tables to join, they do not have to be related to `main_table` directly.
+        :param filters: The filters that will be applied on the result, they decide which joins may be INNER joins.
+        :raise ValueError: If a table can not be reached from `main_table`.
+        """
+        tree = self._get_tree(main_table)
+        steps_by_table: Dict[str, JoinStep] = dict()
+        for table_name in table_names:
+            if table_name == main_table:
+                continue
+            if table_name not in tree:
+                raise ValueError(f'Table {table_name!r} is not related to {main_table!r}')
+            for step in self._get_path(tree, main_table, table_name):
+                steps_by_table.setdefault(step.table_name, step)
+
+        stable_order = [table_name for table_name in tree if table_name in steps_by_table]
+        filters_by_table: Dict[str, List[Filter]] = dict()
+        for table_filter in filters:
+            filters_by_table.setdefault(_get_table_name(table_filter), []).append(table_filter)
+
+        # A table must be INNER joined if it, or a table joined through it, has a filter that rejects NULLs.
+        required: Set[str] = set()
+        for table_name, table_filters in filters_by_table.items():
+            if table_name in steps_by_table and any(_is_null_rejecting(f) for f in table_filters):
+                while table_name != main_table and table_name not in required:
+                    required.add(table_name)
+                    table_name = steps_by_table[table_name].parent_table
+
+        # Decide the join type from the main table outwards, a table joined through a LEFT join is LEFT joined too.
+        is_inner = {main_table: True}
+        for table_name in stable_order:
+            step = steps_by_table[table_name]
+            _, related_table, holds_foreign_key = tree[table_name]
+            cannot_drop_rows = holds_foreign_key and self._is_not_null(step.parent_table, related_table.from_column)
+            is_inner[table_name] = table_name in required or (cannot_drop_rows and is_inner[step.parent_table])
+            steps_by_table[table_name] = JoinStep(step.parent_table, step.related_table, not is_inner[table_name])
+
+        ordered_steps = self._order_steps(main_table, steps_by_table, filters_by_table)
+        return JoinPlan(main_table, tuple(ordered_steps), tuple(stable_order))
+
+    def _order_steps(self, main_table: str, steps_by_table: Dict[str, JoinStep],
+                     filters_by_table: Dict[str, List[Filter]]) -> List[JoinStep]:
+        """ Orders the joins greedily, the join that is estimated to keep the fewest rows first """
+        statistics = self._load_statistics(main_table, *steps_by_table)
+
+        def estimate_growth(step: JoinStep) -> float:
+            if step.is_left:
+                return float('inf')  # LEFT joins never shrink the result, they are joined last.
+            table_statistics = statistics[step.table_name]
+            selectivity = 1.0
+            for table_filter in filters_by_table.get(step.table_name, ()):
+                selectivity *= table_statistics.get_selectivity(table_filter)
+            rows_per_parent_row = 1.0
+            if self._get_primary_key(step.table_name) != {step.related_table.to_column}:
+                # One-to-many, every parent row is joined with all of its rows.
+                rows_per_parent_row = table_statistics.row_count / statistics[step.parent_table].row_count
+            return rows_per_parent_row * selectivity
+
+        joined = {main_table}
+        remaining = dict(steps_by_table)
+        ordered_steps = []
+        while remaining:
+            available = [step for step in remaining.values() if step.parent_table in joined]
+            step = min(available, key=lambda s: (s.is_left, estimate_growth(s), s.table_name))
+            ordered_steps.append(step)
+            joined.add(step.table_name)
+            del remaining[step.table_name]
+        return ordered_steps
+
+    def _get_tree(self, main_table: str) -> Dict[str, Edge]:
+        """ Breadth first search over the foreign-key graph, the tree holds the shortest path to every table """
+        with self._lock:
+            if self._schema_version != self._catalog.schema_version:
+                self._build_graph()
+            tree = self._trees.get(main_table)
+        if tree is not None:
+            return tree
+        if main_table not in self._graph:
+            raise ValueError(f'Unknown table {main_table!r}')
+
+        tree = dict()
+        queue = deque([main_table])
+        while queue:
+            table_name = queue.popleft()
+            for edge in self._graph[table_name]:
+                related_table_name = edge[1].table_name
+                if related_table_name != main_table and related_table_name not in tree:
+                    tree[related_table_name] = edge
+                    queue.append(related_table_name)
+        with self._lock:
+            self._trees[main_table] = tree
+        return tree
+
+    @staticmethod
+    def _get_path(tree: Dict[str, Edge], main_table: str, table_name: str) -> List[JoinStep]:
+        path = []
+        while table_name != main_table:
+            parent_table, related_table, _ = tree[table_name]
+            path.append(JoinStep(parent_table, related_table))
+            table_name = parent_table
+        return path[::-1]
+
+    def _build_graph(self) -> None:
+        # Following a foreign key (many-to-one) comes before following a reference to the table (one-to-many).
+        self._schema_version = self._catalog.schema_version
+        self._graph = {table_name: [(table_name, related_table, True)
+                                    for related_table in self._catalog.get_foreign_keys(table_name)] +
+                                   [(table_name, related_table, False)
+                                    for related_table in self._catalog.get_referencing_tables(table_name)]
+                       for table_name in self._catalog.table_names}
+        self._trees = dict()
+
+    def _is_not_null(self, table_name: str, column_name: str) -> bool:
+        return any(column.title == column_name and not column.is_nullable
+                   for column in self._catalog.get_columns(table_name))
+
+    def _get_primary_key(self, table_name: str) -> Set[str]:
+        return {column.title for column in self._catalog.get_table(table_name).primary_keys}
+
+    def _load_statistics(self, *table_names: str) -> Dict[str, _TableStatistics]:
+        statistics: Dict[str, _TableStatistics] = dict()
+        if not isinstance(self._catalog.backend, SqliteBackend):
+            # Only sqlite has statistics the planner understands, the joins are ordered by the filters alone.
+            return {table_name: _TableStatistics(_DEFAULT_ROW_COUNT) for table_name in table_names}
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            try:
+                rows = cursor.execute(_STATISTICS_QUERY).fetchall()
+            except sqlite3.OperationalError:
+                rows = []  # The database was never analyzed.
+            for table_name, stat, column_name in rows:
+                if table_name not in table_names or not stat:
+                    continue
+                counts = [int(count) for count in stat.split() if count.isdigit()]
+                table_statistics = statistics.setdefault(table_name, _TableStatistics(counts[0]))
+                if column_name is not None and len(counts) > 1:
+                    table_statistics.rows_per_value[column_name] = counts[1]
+
+            for table_name in table_names:
+                if table_name not in statistics:
+                    # Without statistics the largest rowid is a cheap estimation of the row count.
+                    try:
+                        row_count, = cursor.execute(
+                            f'SELECT max(_rowid_) FROM {utilities.quote_table_name(table_name)}').fetchone()
+                    except sqlite3.OperationalError:  # WITHOUT ROWID tables
+                        row_count = None
+                    statistics[table_name] = _TableStatistics(row_count or _DEFAULT_ROW_COUNT)
+        return statistics
+
+
+def build_plan_query(plan: JoinPlan, get_columns: Callable[[str], Sequence[ColumnData]],
+                     filters: Sequence[Filter] = (), case_sensitive: bool = False,
+                     dialect: SqlDialect = operators.SQLITE_DIALECT) -> Tuple[List[ColumnData], Query]:
+    """
+    Builds the query of a join plan.
+    Every filter is pushed into the join of its table, filters of the main table and of
+    LEFT joined tables (which would change the result in the join condition) are in the WHERE statement.
+
+    :param plan: The join plan.
+    :param get_columns: Returns the columns of a table.
+    :param filters: The filters to apply.
+    :param case_sensitive: Are the filters case sensitive.
+    :param dialect: How the database engine compares texts case insensitively.
+    :return: The columns of the result and the query with its parameters.
+    """
+    steps_by_table = {step.table_name: step for step in plan.steps}
+    columns = list(get_columns(plan.main_table))
+    for table_name in plan.table_names:
+        to_column = steps_by_table[table_name].related_table.to_column
+        columns += [column for column in get_columns(table_name) if column.title != to_column]
+
+    filters_by_table: Dict[str, List[Filter]] = dict()
+    where_filters: List[Filter] = []
+    for table_filter in filters:
+        step = steps_by_table.get(_get_table_name(table_filter))
+        if step is None or step.is_left:
+            where_filters.append(table_filter)
+        else:
+            filters_by_table.setdefault(step.table_name, []).append(table_filter)
+
+    join_queries: List[str] = []
+    parameters = []
+    for step in plan.steps:
+        related_table = step.related_table
+        conditions = [f'{step.parent_table}.{related_table.from_column} = {step.table_name}.{related_table.to_column}']
+        for table_filter in filters_by_table.get(step.table_name, ()):
+            filter_query, filter_parameters = table_filter.get_query(case_sensitive, dialect=dialect)
+            conditions.append(filter_query)
+            parameters.extend(filter_parameters)
+        join_queries.append(f"""
+                {'LEFT JOIN' if step.is_left else 'JOIN'} {step.table_name}
+                ON {' AND '.join(conditions)}
+                """)
+
+    query = f"""
+            SELECT {utilities.select_columns(column.get_full_name() for column in columns)}
+            FROM {plan.main_table}
+            {' '.join(join_queries)}
+        """
+    return columns, utilities.add_filters_to_query(query, where_filters, case_sensitive, parameters,
+                                                   dialect=dialect)
@@ -1,40 +1,115 @@
-from db.data_structures import Operator
+import json
+from typing import List
 
+from db.data_structures import Operator, Query, SqlDialect
 
-def _prepare_value_for_in_operator(value: str) -> str:
-    values = value.split(',')
-    # Wrap every value with quotes
-    prepared_values = [f'"{prepared_value.strip()}"' for prepared_value in values]
+FULL_TEXT_TABLE_PREFIX = 'sql_gui_fts_'
+# The trigram tokenizer of the full-text index can only look up values of at least 3 characters.
+FULL_TEXT_MIN_LENGTH = 3
+# IN lists of at least this many values are bound as a single JSON array (see `in_operator`).
+BULK_IN_MIN_VALUES = 100
 
-    return ', '.join(prepared_values)
+# sqlite compares with the NOCASE collation and LIKE follows `PRAGMA case_sensitive_like` (see `backends`),
+# engines without them (PostgreSQL, DuckDB, ...) compare the lowercased texts.
+SQLITE_DIALECT = SqlDialect('sqlite', has_nocase_collation=True)
+GENERIC_DIALECT = SqlDialect('generic', has_nocase_collation=False)
 
 
-def simple_operator(column: str, value: str, case_sensitive: bool, operator: str):
-    x = f'{column} {operator} {value!r}'
-    if not case_sensitive:
-        x += ' COLLATE NOCASE'
-    return x
+def split_in_values(value: str) -> List[str]:
+    """ The comma separated values of the value of an IN filter """
+    return [prepared_value.strip() for prepared_value in value.split(',')]
 
 
-def like_operator(column: str, case_sensitive: bool, pattern: str):
-    x = f'{column} LIKE "{pattern}"'
-    return x
+def simple_operator(column: str, value: str, case_sensitive: bool, operator: str,
+                    dialect: SqlDialect = SQLITE_DIALECT) -> Query:
+    if case_sensitive:
+        return f'{column} {operator} ?', [value]
+    if dialect.has_nocase_collation:
+        return f'{column} {operator} ? COLLATE NOCASE', [value]
+    return f'LOWER({column}) {operator} LOWER(?)', [value]
+
+
+def in_operator(column: str, value: str, case_sensitive: bool, dialect: SqlDialect = SQLITE_DIALECT) -> Query:
+    values = split_in_values(value)
+    collation = ""
+    if not case_sensitive and dialect.has_nocase_collation:
+        collation = "COLLATE NOCASE"
+    elif not case_sensitive:
+        column = f'LOWER({column})'
+        values = [in_value.lower() for in_value in values]
+    if len(values) >= BULK_IN_MIN_VALUES:
+        # Long lists are looked up in a single JSON array parameter: the statement is the same for any number of
+        # values, so it is prepared once, and the list is not limited by the maximal number of parameters.
+        return f'{column} {collation} IN (SELECT value FROM json_each(?))', [json.dumps(values)]
+    # Every comma separated value is bound as a separate parameter
+    placeholders = ', '.join('?' * len(values))
+    return f'{column} {collation} IN ({placeholders})', values
+
+
+def get_full_text_table_name(table_name: str) -> str:
+    """ The name of the FTS5 table that indexes the text columns of `table_name` (see `full_text.FullTextIndex`) """
+    return f'{FULL_TEXT_TABLE_PREFIX}{table_name}'
+
+
+def quote_full_text_terms(value: str) -> str:
+    """
+    Quotes every whitespace separated term of `value` as an FTS5 string, so the terms are looked up as they are
+    (e.g. 'AC/DC', 'AND') rather than parsed as FTS5 query syntax. The row must contain all the terms.
+    """
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in value.split())
+
+
+def full_text_operator(column: str, condition: str, value: str) -> Query:
+    """
+    Looks the rows up in the full-text index of the column's table instead of scanning the table.
+
+    :param column: 'table.column', or the quoted full name of a column of a materialized result.
+    :param condition: The condition on the indexed column, with a single placeholder.
+    :param value: The value to bind to the placeholder.
+    """
+    is_quoted = column.startswith('"')
+    table_name, _, column_name = column.strip('"').partition('.')
+    index_table = get_full_text_table_name(table_name)
+    indexed_column = f'"{column_name}"'
+    if is_quoted:
+        # A materialized result has no rowid of the indexed table, so the matching values are looked up instead.
+        return (f'{column} IN (SELECT {indexed_column} FROM "{index_table}" '
+                f'WHERE {indexed_column} {condition})', [value])
+    return f'{table_name}.rowid IN (SELECT rowid FROM "{index_table}" WHERE {indexed_column} {condition})', [value]
+
+
+def like_operator(column: str, case_sensitive: bool, pattern: str, dialect: SqlDialect = SQLITE_DIALECT,
+                  operator: str = 'LIKE') -> Query:
+    """
+    Compares the column to a LIKE pattern.
+    sqlite's LIKE follows `PRAGMA case_sensitive_like`, which the backend sets by `case_sensitive`,
+    other engines' LIKE is case sensitive so the texts are lowercased to compare them case insensitively.
+    """
+    if case_sensitive or dialect.has_nocase_collation:
+        return f'{column} {operator} ?', [pattern]
+    return f'LOWER({column}) {operator} LOWER(?)', [pattern]
 
 
 # Common operators
-EQUALS_OPERATOR = Operator('Equals', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '='))
-NOT_EQUALS_OPERATOR = Operator('Not equals', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '!='))
-IN_OPERATOR = Operator('In', lambda column, value, case_sensitive: f'{column} {"COLLATE NOCASE" if not case_sensitive else ""} IN ({_prepare_value_for_in_operator(value)})')
-NONE_OPERATOR = Operator('Is None', lambda column, value, _: f'{column} is NULL')
-NOT_NONE_OPERATOR = Operator('Is not None', lambda column, value, _: f'{column} is not NULL')
+EQUALS_OPERATOR = Operator('Equals', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '=', dialect))
+NOT_EQUALS_OPERATOR = Operator('Not equals', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '!=', dialect))
+IN_OPERATOR = Operator('In', in_operator)
+NONE_OPERATOR = Operator('Is None', lambda column, value, *_: (f'{column} is NULL', []))
+NOT_NONE_OPERATOR = Operator('Is not None', lambda column, value, *_: (f'{column} is not NULL', []))
 # Numerical operators
-LESS_THAN_OPERATOR = Operator('Less than', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '<'))
-LESS_THAN_OR_EQUALS_OPERATOR = Operator('Less than or equals', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '<='))
-GREATER_THAN_OPERATOR = Operator('Greater than', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '>'))
-GREATER_THAN_OR_EQUALS_OPERATOR = Operator('Greater than or equals', lambda column, value, case_sensitive: simple_operator(column, value, case_sensitive, '>='))
+LESS_THAN_OPERATOR = Operator('Less than', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '<', dialect))
+LESS_THAN_OR_EQUALS_OPERATOR = Operator('Less than or equals', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '<=', dialect))
+GREATER_THAN_OPERATOR = Operator('Greater than', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '>', dialect))
+GREATER_THAN_OR_EQUALS_OPERATOR = Operator('Greater than or equals', lambda column, value, case_sensitive, dialect: simple_operator(column, value, case_sensitive, '>=', dialect))
 # Text operators
-STARTS_WITH_OPERATOR = Operator('Starts with', lambda column, value, case_sensitive: like_operator(column, case_sensitive, f'{value}%'))
-ENDS_WITH_OPERATOR = Operator('Ends with', lambda column, value, case_sensitive: like_operator(column, case_sensitive, f'%{value}'))
-CONTAINS_OPERATOR = Operator('Contains', lambda column, value, case_sensitive: like_operator(column, case_sensitive, f'%{value}%'))
-LIKE_OPERATOR = Operator('Like', lambda column, value, case_sensitive: like_operator(column, case_sensitive, value))
-NOT_LIKE_OPERATOR = Operator('Not Like', lambda column, value, _: f'{column} NOT LIKE "{value}"')
+STARTS_WITH_OPERATOR = Operator('Starts with', lambda column, value, case_sensitive, dialect: like_operator(column, case_sensitive, f'{value}%', dialect))
+ENDS_WITH_OPERATOR = Operator('Ends with', lambda column, value, case_sensitive, dialect: like_operator(column, case_sensitive, f'%{value}', dialect))
+CONTAINS_OPERATOR = Operator('Contains', lambda column, value, case_sensitive, dialect: like_operator(column, case_sensitive, f'%{value}%', dialect))
+LIKE_OPERATOR = Operator('Like', lambda column, value, case_sensitive, dialect: like_operator(column, case_sensitive, value, dialect))
+NOT_LIKE_OPERATOR = Operator('Not Like', lambda column, value, case_sensitive, dialect: like_operator(column, case_sensitive, value, dialect, 'NOT LIKE'))
+# Full-text operators, for text columns with a full-text index.
+# 'Matches prefix' matches the values that start with the value, like 'Starts with' but looked up in the index:
+# the trigram tokenizer has no tokens, so unlike an FTS5 prefix query it does not match the start of any word.
+MATCHES_OPERATOR = Operator('Matches', lambda column, value, *_: full_text_operator(column, 'MATCH ?', quote_full_text_terms(value)))
+MATCHES_PREFIX_OPERATOR = Operator('Matches prefix', lambda column, value, *_: full_text_operator(column, 'LIKE ?', f'{value}%'))
+FULL_TEXT_OPERATORS = (MATCHES_OPERATOR, MATCHES_PREFIX_OPERATOR)
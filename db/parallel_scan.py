@@ -0,0 +1,265 @@
+__all__ = ['ParallelScanner', 'get_sort_key']
+
+import heapq
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from db import utilities
+from db.context_manager import DATABASE_PATH, SqlConnectionPool, to_uri
+from db.data_structures import ColumnData, ColumnType
+from db.filters import Filter
+
+DEFAULT_BATCH_SIZE = 1000
+# Tables with fewer rows are scanned by a single query, starting the threads would cost more than it saves.
+DEFAULT_MIN_ROWS = 200_000
+# The number of batches every range may fetch ahead of the reader before it waits.
+_QUEUED_BATCHES_PER_RANGE = 8
+# How often a range that waits for the reader checks whether the reader stopped, in seconds.
+_PUT_TIMEOUT = 0.1
+_DONE = object()
+
+# NOCASE only folds the ASCII letters.
+_ASCII_LOWERCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+class _Descending:
+    """ Reverses the order of a sort key, so keys of ascending and descending columns are compared together """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other: '_Descending') -> bool:
+        return self.key == other.key
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.key < self.key
+
+
+def _get_value_key(value, column_type: ColumnType) -> Tuple[int, Any]:
+    # Like sqlite: numbers sort before texts, and texts before blobs. The texts of numeric columns (e.g. dates)
+    # are compared as they are, the texts of text columns case insensitively.
+    if isinstance(value, (int, float)):
+        return 0, value
+    if isinstance(value, str):
+        return 1, value if column_type is ColumnType.Numeric else value.translate(_ASCII_LOWERCASE)
+    return 2, value
+
+
+def get_sort_key(sort_keys: Sequence[Tuple[str, bool]], columns: Mapping[str, ColumnData]) \
+        -> Callable[[Sequence[Any]], Tuple]:
+    """
+    Builds the key that orders rows like the ORDER BY of `utilities.build_order_by` orders them:
+    numbers before texts, the texts of text columns case insensitively and NULLs are always last.
+
+    :param sort_keys: (column full name, is descending) pairs, the first pair is the primary sort key.
+    :param columns: The columns of the rows by their full names, in the order of the values in a row.
+    :return: A function that returns the sort key of a row.
+    """
+    indices = {full_name: index for index, full_name in enumerate(columns)}
+    keys = [(indices[column_name], columns[column_name].column_type, descending)
+            for column_name, descending in sort_keys]
+
+    def get_key(row: Sequence[Any]) -> Tuple:
+        key = []
+        for index, column_type, descending in keys:
+            value = row[index]
+            if value is None:
+                key.append((1, None))
+                continue
+            value_key = _get_value_key(value, column_type)
+            key.append((0, _Descending(value_key) if descending else value_key))
+        return tuple(key)
+
+    return get_key
+
+
+class ParallelScanner:
+    """
+    Scans a large table with several queries at once, each on a range of the table's rowids.
+
+    Every range runs on its own thread on a read-only connection (sqlite releases the GIL while it executes
+    a statement), so a filter that scans the table uses as many cores as there are ranges. The rows of the
+    ranges are yielded in the order of the ranges, which is the order of a single scan, or merged by the sort
+    key of the rows when the result is sorted: every range is sorted by sqlite and the sorted ranges are merged.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH, workers: int = None, min_rows: int = DEFAULT_MIN_ROWS,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param database_file_path: The database of the scanned tables.
+        :param workers: The number of ranges a table is split into, defaults to the number of CPUs.
+        :param min_rows: Tables with fewer rows are not split.
+        :param batch_size: The maximal number of rows every range fetches at once.
+        """
+        self.database_file_path = database_file_path
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.batch_size = batch_size
+        self.enabled = True
+        self._read_only_uri = to_uri(database_file_path, read_only=True)
+
+    def get_rowid_ranges(self, table_name: str) -> List[Tuple[int, int]]:
+        """
+        Splits the rowids of `table_name` into a range for every worker.
+
+        :return: (first rowid, last rowid) of every range, empty if the table should not be split, since it is
+                 small, it has no rowid or the scanner is disabled.
+        """
+        if not self.enabled or self.workers < 2:
+            return []
+        connection = self._get_pool().acquire()
+        try:
+            (min_rowid, max_rowid), = connection.execute(
+                f'SELECT MIN(rowid), MAX(rowid) FROM {utilities.quote_table_name(table_name)}').fetchall()
+        except sqlite3.OperationalError:  # WITHOUT ROWID tables
+            return []
+        finally:
+            self._get_pool().release(connection)
+        if min_rowid is None or max_rowid - min_rowid + 1 < self.min_rows:
+            return []
+        # The ranges are of equal rowids rather than equal rows, deleted rows leave them unbalanced.
+        step = -(-(max_rowid - min_rowid + 1) // self.workers)
+        return [(first, min(first + step - 1, max_rowid)) for first in range(min_rowid, max_rowid + 1, step)]
+
+    def scan(self, table_name: str, columns: Mapping[str, ColumnData], filters: Sequence[Filter] = (),
+             case_sensitive: bool = False, sort_keys: Sequence[Tuple[str, bool]] = (),
+             ranges: Sequence[Tuple[int, int]] = None, limit: int = None) -> Iterator[Sequence[Any]]:
+        """
+        Selects the rows of `table_name` that apply to `filters`, with a query on every range of the table.
+        With a limit every range query selects at most `limit` rows, so sqlite keeps only the first rows of a
+        sorted range rather than sorting all of them.
+
+        :param table_name: The table, it must have a rowid.
+        :param columns: The selected columns by their full names, they are selected with `select_columns`.
+        :param filters: The filters of the table's columns.
+        :param case_sensitive: Are the filters case sensitive.
+        :param sort_keys: (column full name, is descending) pairs to sort the rows by, as in `build_order_by`.
+        :param ranges: The rowid ranges to scan, defaults to `get_rowid_ranges`.
+        :param limit: The maximal number of rows to yield, default is all of them.
+        :return: Yields every row that applies to the filters.
+        """
+        ranges = self._get_ranges(table_name, ranges)
+        query, parameters = self._build_range_query(table_name, utilities.select_columns(columns), filters,
+                                                    case_sensitive, ranges)
+        order_by = utilities.build_order_by(sort_keys, columns)
+        if order_by:
+            query = f'SELECT * FROM ({query}) {order_by}'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters = [(*range_parameters, int(limit)) for range_parameters in parameters]
+
+        scan = _RangeScan(self._get_pool(), query, parameters, f'PRAGMA case_sensitive_like = {case_sensitive}',
+                          self.batch_size)
+        scan.start()
+        try:
+            if order_by:
+                rows = heapq.merge(*(scan.get_rows(index) for index in range(len(ranges))),
+                                   key=get_sort_key(sort_keys, columns))
+            else:
+                rows = itertools.chain.from_iterable(scan.get_rows(index) for index in range(len(ranges)))
+            yield from rows if limit is None else itertools.islice(rows, int(limit))
+        finally:
+            scan.stop()
+
+    def _get_ranges(self, table_name: str, ranges: Optional[Sequence[Tuple[int, int]]]) -> Sequence[Tuple[int, int]]:
+        ranges = self.get_rowid_ranges(table_name) if ranges is None else ranges
+        # A table that is not split is scanned by a single query.
+        return ranges if len(ranges) > 0 else [(-2 ** 63, 2 ** 63 - 1)]
+
+    @staticmethod
+    def _build_range_query(table_name: str, select: str, filters: Sequence[Filter], case_sensitive: bool,
+                           ranges: Sequence[Tuple[int, int]]) -> Tuple[str, List[Sequence[Any]]]:
+        """ The query of a single range, with the parameters of every range """
+        conditions, filters_parameters = [], []
+        for table_filter in filters:
+            filter_query, filter_parameters = table_filter.get_query(case_sensitive)
+            conditions.append(filter_query)
+            filters_parameters.extend(filter_parameters)
+        query = f'SELECT {select} FROM {table_name} ' \
+                f'WHERE {" AND ".join((f"{table_name}.rowid BETWEEN ? AND ?", *conditions))}'
+        return query, [(first, last, *filters_parameters) for first, last in ranges]
+
+    def _get_pool(self) -> SqlConnectionPool:
+        # The connections of the ranges are kept open for the next scan.
+        return SqlConnectionPool.get_pool(self._read_only_uri, self.workers)
+
+
+class _RangeScan:
+    """ The queries of the ranges of a single scan, every range is read on its own thread into its own queue """
+
+    def __init__(self, pool: SqlConnectionPool, query: str, parameters: Sequence[Sequence[Any]], setup_query: str,
+                 batch_size: int):
+        self._pool = pool
+        self._query = query
+        self._parameters = parameters
+        self._setup_query = setup_query
+        self._batch_size = batch_size
+        self._results: List[queue.Queue] = [queue.Queue(maxsize=_QUEUED_BATCHES_PER_RANGE) for _ in parameters]
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # The threads that are reading a range, their queries are interrupted when the reader stops.
+        self._readers: Dict[int, int] = dict()
+
+    def start(self) -> None:
+        # A thread for every range rather than a shared pool of threads: a sorted scan reads all its ranges
+        # at once, so a range that waits for a thread would never be read.
+        for index in range(len(self._parameters)):
+            threading.Thread(target=self._read, args=(index,), name=f'range-scan-{index}', daemon=True).start()
+
+    def get_rows(self, index: int) -> Iterator[Sequence[Any]]:
+        """ Yields the rows of the range `index` as they are fetched """
+        results = self._results[index]
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    def stop(self) -> None:
+        """ Stops the ranges that are still read, the queries they run are aborted """
+        self._stopped.set()
+        with self._lock:
+            for thread_id in self._readers.values():
+                self._pool.interrupt(thread_id)
+
+    def _read(self, index: int) -> None:
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._readers[index] = threading.get_ident()
+        connection: Optional[sqlite3.Connection] = None
+        try:
+            connection = self._pool.acquire()
+            cursor = connection.execute(self._setup_query)
+            cursor.execute(self._query, self._parameters[index])
+            while True:
+                batch = cursor.fetchmany(self._batch_size)
+                if len(batch) == 0 or not self._put(index, batch):
+                    break
+            cursor.close()
+        except Exception as e:
+            if not self._stopped.is_set():
+                self._put(index, e)
+        finally:
+            with self._lock:
+                self._readers.pop(index, None)
+            if connection is not None:
+                self._pool.release(connection)
+            self._put(index, _DONE)
+
+    def _put(self, index: int, item) -> bool:
+        # A range waits while the reader is behind, and gives up once the reader stopped.
+        while not self._stopped.is_set():
+            try:
+                self._results[index].put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
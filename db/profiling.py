@@ -0,0 +1,221 @@
+__all__ = ['QueryProfile', 'QueryProfiler', 'JsonLinesSink']
+
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager
+from db.data_structures import Query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_THRESHOLD = 1.0
+# The number of sqlite virtual machine instructions between calls of the progress handler.
+DEFAULT_PROGRESS_STEPS = 1000
+DEFAULT_HISTORY_SIZE = 100
+_FETCH_SIZE = 256
+
+# Receives every finished profile (and every rendering time reported later) as a JSON serializable record.
+ProfileSink = Callable[[Dict[str, Any]], None]
+
+
+class QueryProfile:
+    """
+    The measurements of a single query: the time spent in every phase, the number of rows, the query plan and
+    the number of virtual machine steps sqlite executed.
+
+    The phases are 'materialize' (creating a pending refinement table), 'connect' (acquiring a pooled connection),
+    'execute' (preparing the statement and computing the first row), 'fetch' (reading the rest of the rows)
+    and 'render' (showing the rows, reported by the UI).
+    """
+
+    def __init__(self, profile_id: int, query: str, parameters: Sequence[Any], label: str):
+        self.id = profile_id
+        self.query = query
+        self.parameters = tuple(parameters)
+        self.label = label
+        self.started_at = time.time()
+        self.elapsed = 0.0
+        self.spans: Dict[str, float] = dict()
+        self.rows = 0
+        self.vm_steps: Optional[int] = None
+        self.query_plan: List[str] = []
+        self.cache_hit = False
+        self.error: Optional[str] = None
+
+    def add_span(self, phase: str, seconds: float) -> None:
+        self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def span(self, phase: str):
+        """ Adds the time spent in the block to `phase` """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(phase, time.perf_counter() - start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'label': self.label, 'query': ' '.join(self.query.split()),
+                'parameters': [value if isinstance(value, (int, float, str)) or value is None else str(value)
+                               for value in self.parameters],
+                'started_at': self.started_at, 'elapsed_s': self.elapsed, 'spans_s': dict(self.spans),
+                'rows': self.rows, 'vm_steps': self.vm_steps, 'query_plan': list(self.query_plan),
+                'cache_hit': self.cache_hit, 'error': self.error}
+
+
+class QueryProfiler:
+    """
+    Records a `QueryProfile` for the queries of the handler and keeps the most recent ones.
+
+    Finished profiles are passed to the sinks (see `JsonLinesSink`), and queries that take longer than
+    `slow_query_threshold` seconds are logged as warnings with their query plan.
+    """
+
+    def __init__(self, slow_query_threshold: Optional[float] = DEFAULT_SLOW_QUERY_THRESHOLD,
+                 progress_steps: int = DEFAULT_PROGRESS_STEPS, capture_plan: bool = True,
+                 history_size: int = DEFAULT_HISTORY_SIZE):
+        """
+        :param slow_query_threshold: Queries that take longer (in seconds) are logged, None disables the log.
+        :param progress_steps: The resolution of the virtual machine steps count, 0 disables the count.
+        :param capture_plan: Whether to capture `EXPLAIN QUERY PLAN` of every profiled query.
+        :param history_size: The number of recent profiles to keep.
+        """
+        self.enabled = True
+        self.slow_query_threshold = slow_query_threshold
+        self.progress_steps = progress_steps
+        self.capture_plan = capture_plan
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._profiles: Deque[QueryProfile] = deque(maxlen=history_size)
+        self._sinks: List[ProfileSink] = []
+
+    @property
+    def recent_profiles(self) -> List[QueryProfile]:
+        """ The recent profiles, the newest last """
+        with self._lock:
+            return list(self._profiles)
+
+    @property
+    def last_profile(self) -> Optional[QueryProfile]:
+        with self._lock:
+            return self._profiles[-1] if self._profiles else None
+
+    def add_sink(self, sink: ProfileSink) -> None:
+        with self._lock:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink: ProfileSink) -> None:
+        with self._lock:
+            self._sinks.remove(sink)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+    def start(self, query: str, parameters: Sequence[Any] = (), label: str = 'query') -> Optional[QueryProfile]:
+        """ Creates the profile of a query that is about to run, or returns None if profiling is disabled """
+        if not self.enabled:
+            return None
+        profile = QueryProfile(next(self._ids), query, parameters, label)
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def execute(self, queries: Iterable[Union[str, Query]], profile: QueryProfile,
+                database_file_path=DATABASE_PATH) -> Iterator[Sequence[Any]]:
+        """
+        Runs `queries` one after the other on the same connection like `utilities.execute_queries`,
+        and measures the last of them into `profile`.
+        """
+        queries = [(query, ()) if isinstance(query, str) else query for query in queries]
+        start = time.perf_counter()
+        with SqlLocalDatabaseContextManager(database_file_path) as cursor:
+            profile.add_span('connect', time.perf_counter() - start)
+            for query, parameters in queries[:-1]:
+                cursor.execute(query, parameters)
+            query, parameters = queries[-1]
+
+            if self.capture_plan:
+                try:
+                    profile.query_plan = [detail for *_, detail in
+                                          cursor.execute(f'EXPLAIN QUERY PLAN {query}', parameters)]
+                except Exception as e:  # The plan is only informative, the query itself reports its errors.
+                    profile.query_plan = [f'Could not explain the query: {e}']
+
+            steps = [0]
+            if self.progress_steps > 0:
+                def count_steps():
+                    steps[0] += self.progress_steps
+                    return 0
+                cursor.connection.set_progress_handler(count_steps, self.progress_steps)
+            try:
+                with profile.span('execute'):
+                    cursor.execute(query, parameters)
+                    batch = cursor.fetchmany(_FETCH_SIZE)
+                while batch:
+                    yield from batch
+                    with profile.span('fetch'):
+                        batch = cursor.fetchmany(_FETCH_SIZE)
+            finally:
+                if self.progress_steps > 0:
+                    # The connection returns to the pool, it must not count the steps of other queries.
+                    cursor.connection.set_progress_handler(None, 0)
+                    profile.vm_steps = steps[0]
+
+    def profile_rows(self, profile: QueryProfile, rows: Iterable[Sequence[Any]]) -> Iterator[Sequence[Any]]:
+        """ Yields `rows` while counting them, the profile is finished when the rows end, fail or are closed """
+        start = time.perf_counter()
+        try:
+            for row in rows:
+                profile.rows += 1
+                yield row
+        except Exception as e:
+            profile.error = str(e)
+            raise
+        finally:
+            profile.elapsed = time.perf_counter() - start
+            self._finish(profile)
+
+    def record_render(self, profile: Optional[QueryProfile], seconds: float) -> None:
+        """ Adds the time the UI spent showing the rows of a finished query """
+        if profile is None:
+            return
+        profile.add_span('render', seconds)
+        self._emit({'event': 'render', 'id': profile.id, 'render_s': seconds})
+
+    def _finish(self, profile: QueryProfile) -> None:
+        if self.slow_query_threshold is not None and profile.elapsed >= self.slow_query_threshold:
+            logger.warning('Slow %s query (%.3fs, %d rows, %s VM steps): %s\n%s', profile.label, profile.elapsed,
+                           profile.rows, profile.vm_steps, ' '.join(profile.query.split()),
+                           '\n'.join(profile.query_plan))
+        self._emit({'event': 'query', **profile.to_dict()})
+
+    def _emit(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(record)
+            except Exception:
+                # A failing sink should not fail the query.
+                logger.exception('Profile sink %r failed', sink)
+
+
+class JsonLinesSink:
+    """ Appends every profile record to a JSON Lines file """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.file_path, 'a', encoding='utf-8') as output:
+                output.write(line + '\n')
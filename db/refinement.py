@@ -0,0 +1,206 @@
+__all__ = ['RefinementCache']
+
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from db import utilities
+from db.context_manager import DATABASE_PATH, SqlConnectionPool, to_uri
+from db.data_structures import Query
+from db.filters import Filter
+
+SCHEMA_NAME = 'refine'
+
+FilterKey = Tuple[str, str, str]
+# (PRAGMA data_version, PRAGMA schema_version) of the database.
+DatabaseVersion = Tuple[int, int]
+
+
+def _get_filter_key(table_filter: Filter) -> FilterKey:
+    return table_filter.column_name, table_filter.operator.name, table_filter.value
+
+
+def _remove_database_file(path: str) -> None:
+    for file_path in (path, f'{path}-wal', f'{path}-shm', f'{path}-journal'):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+class RefinementCache:
+    """
+    Materializes the last filtered result into a table, so a filter that is added
+    on top of the previous filters is evaluated on the previous result instead of the base tables.
+
+    The result tables live in a temporary database file that is attached to every pooled connection, so a large
+    result is paged from the disk rather than held in memory next to the database's own cache. A table is only
+    created the first time the result is read (see `materialize_pending`), and the table it replaces is dropped
+    right away.
+    A result is only refined while the database is the database it was materialized from: once any connection
+    committed a change (`PRAGMA data_version` of a connection the cache keeps for itself) or the schema changed,
+    the filters are evaluated on the base query again.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH):
+        descriptor, self._path = tempfile.mkstemp(prefix='sql_gui_refine_', suffix='.db')
+        os.close(descriptor)
+        with sqlite3.connect(self._path) as connection:
+            # Readers of a result are not blocked while the next result is created.
+            connection.execute('PRAGMA journal_mode = WAL').fetchall()
+        connection.close()
+        # The file is removed with the cache, or when the process exits.
+        weakref.finalize(self, _remove_database_file, self._path)
+        self.database_file_path = database_file_path
+        self._pool = SqlConnectionPool.get_pool(database_file_path)
+        self._pool.attach(SCHEMA_NAME, to_uri(self._path))
+        self._lock = threading.Lock()
+        self._materialize_lock = threading.Lock()
+        self._table_ids = itertools.count()
+        self._watcher = sqlite3.connect(to_uri(database_file_path), uri=True, check_same_thread=False)
+
+        # The base query, filters and case sensitivity the current table was filtered with.
+        self._base_query = ''
+        self._filter_keys: Tuple[FilterKey, ...] = ()
+        self._case_sensitive = False
+        self._table: Optional[str] = None
+        # The version of the database when the query of `_table` was run.
+        self._version: Optional[DatabaseVersion] = None
+        # The planned result: its table, query, case sensitivity and the version of the database its query reads
+        # if it reads a materialized result (None if it reads the base tables).
+        self._pending: Optional[Tuple[str, Query, bool, Optional[DatabaseVersion]]] = None
+        self._stale_tables: List[str] = []
+
+    def refine(self, base_query: str, filters: Sequence[Filter], case_sensitive: bool,
+               filter_base_query: Callable[[Sequence[Filter], bool], Query] = None) -> Query:
+        """
+        Plans the query of `base_query` filtered by `filters`.
+
+        If the previous result was filtered by a prefix of `filters` (i.e. filters were only added),
+        only the added filters are evaluated on the previous result, otherwise all of them are evaluated
+        on `base_query`. The result is materialized for the next refinement.
+
+        :param base_query: The query the filters apply to, its columns must be selected with `select_columns`.
+        :param filters: The filters to apply.
+        :param case_sensitive: Are the filters case sensitive.
+        :param filter_base_query: Builds `base_query` filtered by all the filters, when they are not applied
+                                  on the previous result. Defaults to appending them as a 'WHERE' statement.
+        :return: The query that reads the filtered result.
+        """
+        try:
+            return self._refine(base_query, filters, case_sensitive, filter_base_query)
+        finally:
+            # A result that was forgotten is not read anymore.
+            self._drop_stale_tables()
+
+    def _refine(self, base_query: str, filters: Sequence[Filter], case_sensitive: bool,
+                filter_base_query: Optional[Callable[[Sequence[Filter], bool], Query]]) -> Query:
+        filter_keys = tuple(_get_filter_key(table_filter) for table_filter in filters)
+        with self._lock:
+            if self._table is not None and self._get_database_version() != self._version:
+                # The database changed since the result was materialized, so it is not refined anymore.
+                self._forget()
+            is_refinement = ((self._table is not None or self._pending is not None)
+                             and base_query == self._base_query and case_sensitive == self._case_sensitive
+                             and filter_keys[:len(self._filter_keys)] == self._filter_keys)
+            if is_refinement and filter_keys == self._filter_keys:
+                # Nothing changed, read the same result again.
+                return self._select_from(self._pending[0] if self._pending is not None else self._table), ()
+
+            added_filters = filters[len(self._filter_keys):]
+            source_version = None
+            if is_refinement and self._pending is not None:
+                # The previous result was not created yet, so the added filters are applied on its query.
+                pending_query, pending_parameters = self._pending[1]
+                source_version = self._pending[3]
+                source = utilities.add_filters_to_query(f'SELECT * FROM ({pending_query})', added_filters,
+                                                        case_sensitive, pending_parameters, quote_columns=True)
+            elif is_refinement:
+                source = utilities.add_filters_to_query(self._select_from(self._table), added_filters,
+                                                        case_sensitive, quote_columns=True)
+                source_version = self._version
+            elif filter_base_query is not None:
+                source = filter_base_query(filters, case_sensitive)
+            else:
+                source = utilities.add_filters_to_query(base_query, filters, case_sensitive)
+
+            # A pending result that was not created yet is simply replaced.
+            table = f'result_{next(self._table_ids)}'
+            self._pending = table, source, case_sensitive, source_version
+            self._base_query = base_query
+            self._filter_keys = filter_keys
+            self._case_sensitive = case_sensitive
+            return self._select_from(table), ()
+
+    def materialize_pending(self) -> None:
+        """ Creates the table of the planned result if it was not created yet """
+        with self._materialize_lock:
+            with self._lock:
+                pending = self._pending
+                # Read before the query runs, a change that is committed while it runs makes the result stale.
+                version = self._get_database_version() if pending is not None else None
+            if pending is not None:
+                table, (query, parameters), case_sensitive, source_version = pending
+                # A result that is refined from a materialized result is as old as that result.
+                version = source_version or version
+                utilities.consume(utilities.execute_queries((
+                    f'PRAGMA case_sensitive_like = {case_sensitive}',
+                    (f'CREATE TABLE {self._qualify(table)} AS {query}', parameters)), self.database_file_path))
+                with self._lock:
+                    if self._pending is pending:
+                        # The previous table may have been the source, so it is dropped only now.
+                        self._retire(self._table)
+                        self._table = table
+                        self._version = version
+                        self._pending = None
+                    else:
+                        # Another result was planned in the meantime.
+                        self._retire(table)
+            self._drop_stale_tables()
+
+    def reset(self) -> None:
+        """ Forgets the cached result and drops its table, e.g. when the base query changes """
+        with self._lock:
+            self._forget()
+        self._drop_stale_tables()
+
+    def _forget(self) -> None:
+        self._retire(self._table)
+        self._table = None
+        self._version = None
+        self._pending = None
+        self._base_query = ''
+        self._filter_keys = ()
+
+    def _get_database_version(self) -> DatabaseVersion:
+        # Called with the lock held, the watcher is shared by the threads.
+        (data_version, ), = self._watcher.execute('PRAGMA data_version').fetchall()
+        (schema_version, ), = self._watcher.execute('PRAGMA schema_version').fetchall()
+        return data_version, schema_version
+
+    def _retire(self, table: Optional[str]) -> None:
+        if table is not None:
+            self._stale_tables.append(table)
+
+    def _drop_stale_tables(self) -> None:
+        with self._lock:
+            stale_tables, self._stale_tables = self._stale_tables, []
+        for table in stale_tables:
+            try:
+                utilities.consume(utilities.execute_query(f'DROP TABLE IF EXISTS {self._qualify(table)}',
+                                                          database_file_path=self.database_file_path))
+            except sqlite3.OperationalError:
+                # The table is still read by another connection, try again next time.
+                with self._lock:
+                    self._stale_tables.append(table)
+
+    @staticmethod
+    def _qualify(table: str) -> str:
+        return f'{SCHEMA_NAME}.{table}'
+
+    def _select_from(self, table: str) -> str:
+        return f'SELECT * FROM {self._qualify(table)}'
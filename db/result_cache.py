@@ -0,0 +1,131 @@
+__all__ = ['ResultCache']
+
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from db.context_manager import DATABASE_PATH, to_uri
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+CacheKey = Tuple[str, Tuple[Any, ...]]
+DatabaseVersion = Tuple[int, int, int]
+
+
+def normalize_query(query: str) -> str:
+    """ Collapses the whitespace of a generated query, so the same query formatted differently has the same key """
+    return ' '.join(query.split())
+
+
+def _estimate_row_size(row: Sequence[Any]) -> int:
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class ResultCache:
+    """
+    LRU cache of query results, keyed on the normalized query and its parameters.
+
+    The cache is valid as long as the database was not changed, which is checked with `PRAGMA data_version`
+    (of a connection the cache keeps for itself, so it notices commits of every other connection)
+    and the modification time of the database file. Entries are evicted by their estimated size in bytes.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 max_entry_size: Optional[int] = None):
+        """
+        :param database_file_path: The database whose results are cached.
+        :param memory_budget: The maximal estimated size in bytes of all the cached results.
+        :param max_entry_size: Results that are larger are not cached, defaults to a quarter of the budget.
+        """
+        self.database_file_path = database_file_path
+        self.memory_budget = memory_budget
+        self.max_entry_size = max_entry_size if max_entry_size is not None else memory_budget // 4
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[CacheKey, Tuple[List[Sequence[Any]], int]]' = OrderedDict()
+        self._size = 0
+        self._version: Optional[DatabaseVersion] = None
+        self._watcher = sqlite3.connect(to_uri(database_file_path), uri=True, check_same_thread=False)
+
+    @property
+    def statistics(self) -> Dict[str, int]:
+        """ The hit/miss counters and the current size of the cache, for tuning the budget """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._size,
+                    'memory_budget': self.memory_budget}
+
+    def execute(self, query: str, parameters: Sequence[Any], execute: Callable[[], Iterable[Sequence[Any]]]) \
+            -> Iterator[Sequence[Any]]:
+        """
+        Yields the cached result of `query`, or runs `execute` and caches its result if it fits the budget.
+
+        :param query: The query, used only as the cache key.
+        :param parameters: The parameters of the query and anything else that changes its result.
+        :param execute: Runs the query and returns its rows.
+        :return: Yields the rows of the result.
+        """
+        key = normalize_query(query), tuple(parameters)
+        version = self._get_database_version()
+        with self._lock:
+            if version != self._version:
+                self._clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            yield from entry[0]
+            return
+
+        rows: Optional[List[Sequence[Any]]] = []
+        size = 0
+        for row in execute():
+            if rows is not None:
+                size += _estimate_row_size(row)
+                if size > self.max_entry_size:
+                    # Too large to be cached, keep streaming without collecting the rows.
+                    rows = None
+                else:
+                    rows.append(row)
+            yield row
+
+        if rows is not None:
+            self._put(key, rows, size, version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _put(self, key: CacheKey, rows: List[Sequence[Any]], size: int, version: DatabaseVersion) -> None:
+        with self._lock:
+            if version != self._version:
+                # The database changed while the query ran.
+                return
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = rows, size
+            self._size += size
+            while self._size > self.memory_budget:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _get_database_version(self) -> DatabaseVersion:
+        with self._lock:
+            data_version, = self._watcher.execute('PRAGMA data_version').fetchone()
+        try:
+            stat = os.stat(self.database_file_path)
+            return data_version, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return data_version, 0, 0
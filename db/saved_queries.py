@@ -0,0 +1,265 @@
+__all__ = ['SavedQueryStore', 'MaterializedViewCache']
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from db.context_manager import DATABASE_PATH, SqlConnectionPool, SqlLocalDatabaseContextManager, \
+    get_state_file_path, to_uri
+from db.data_structures import SavedQuery
+from db.engine import QueryEngine, parse_query_spec, query_spec_to_mapping
+from db.utilities import quote_identifier
+
+SCHEMA_NAME = 'saved'
+_METADATA_TABLE = 'sql_gui_materialized'
+DEFAULT_POLL_INTERVAL = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def _to_mapping(saved_query: SavedQuery) -> Dict[str, Any]:
+    return {'name': saved_query.name, 'materialize': saved_query.materialize,
+            'refresh_interval': saved_query.refresh_interval, 'query': query_spec_to_mapping(saved_query.spec)}
+
+
+def _from_mapping(content: Dict[str, Any]) -> SavedQuery:
+    return SavedQuery(content['name'], parse_query_spec(content['query']), bool(content.get('materialize', False)),
+                      content.get('refresh_interval'))
+
+
+class SavedQueryStore:
+    """ The named saved queries of a database, kept as JSON in the state directory """
+
+    def __init__(self, database_file_path=DATABASE_PATH):
+        self.database_file_path = database_file_path
+        self._path = get_state_file_path(database_file_path, '.saved_queries.json')
+        self._lock = threading.Lock()
+        self._queries: Dict[str, SavedQuery] = self._load()
+
+    @property
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._queries)
+
+    @property
+    def saved_queries(self) -> List[SavedQuery]:
+        with self._lock:
+            return list(self._queries.values())
+
+    def get(self, name: str) -> Optional[SavedQuery]:
+        with self._lock:
+            return self._queries.get(name)
+
+    def save(self, saved_query: SavedQuery) -> None:
+        """ Saves `saved_query`, replacing the saved query with the same name """
+        if not saved_query.name:
+            raise ValueError('A saved query must have a name')
+        with self._lock:
+            self._queries[saved_query.name] = saved_query
+            self._write()
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            if self._queries.pop(name, None) is not None:
+                self._write()
+
+    def _load(self) -> Dict[str, SavedQuery]:
+        try:
+            with open(self._path, encoding='utf-8') as saved_queries_file:
+                content = json.load(saved_queries_file)
+            return {item['name']: _from_mapping(item) for item in content}
+        except OSError:
+            return dict()
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Ignoring the invalid saved queries file %s', self._path)
+            return dict()
+
+    def _write(self) -> None:
+        # The file is replaced at once, so it is never left half written.
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = self._path.with_name(self._path.name + '.part')
+        partial_path.write_text(json.dumps([_to_mapping(saved_query) for saved_query in self._queries.values()],
+                                           indent=2), encoding='utf-8')
+        partial_path.replace(self._path)
+
+
+class MaterializedViewCache:
+    """
+    Materializes the results of saved queries into tables of a sidecar SQLite database in the state directory,
+    so opening a heavy report reads its precomputed rows instead of joining and filtering the tables again.
+
+    The cache database is attached to every connection of the database's pool. `start` refreshes the results
+    in the background: a result is refreshed once its saved query's `refresh_interval` passed, and all of them
+    are refreshed when the database was changed by any connection, which `PRAGMA data_version` tells.
+    """
+
+    def __init__(self, store: SavedQueryStore, database_file_path=DATABASE_PATH,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.store = store
+        self.database_file_path = database_file_path
+        self.poll_interval = poll_interval
+        self.cache_path = get_state_file_path(database_file_path, '.cache.db')
+        self._engine: Optional[QueryEngine] = None
+        self._setup_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._is_attached = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._watcher: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+
+    def get_table(self, name: str) -> Optional[str]:
+        """ The qualified table of the materialized result of the saved query `name`, None if it was not created """
+        saved_query = self.store.get(name)
+        metadata = self._get_metadata(name)
+        if saved_query is None or metadata is None or metadata['spec'] != self._get_spec_key(saved_query):
+            return None
+        return f'{SCHEMA_NAME}.{quote_identifier(metadata["table_name"])}'
+
+    def get_refreshed_at(self, name: str) -> Optional[float]:
+        """ The time the materialized result of the saved query `name` was last refreshed """
+        metadata = self._get_metadata(name)
+        return metadata['refreshed_at'] if metadata is not None else None
+
+    def refresh(self, name: str) -> int:
+        """
+        Computes the result of the saved query `name` again and replaces its materialized result at once,
+        readers keep reading the previous result until the new one is committed.
+
+        :return: The number of rows of the result.
+        :raise ValueError: If there is no such saved query or its tables, columns or operators do not exist.
+        """
+        saved_query = self.store.get(name)
+        if saved_query is None:
+            raise ValueError(f'Unknown saved query {name!r}')
+        self._attach()
+        if self._engine is None:
+            self._engine = QueryEngine(self.database_file_path)
+        query, parameters, _ = self._engine.build_query(saved_query.spec)
+
+        table_name = f'mv_{hashlib.sha1(name.encode()).hexdigest()[:16]}'
+        table = f'{SCHEMA_NAME}.{quote_identifier(table_name)}'
+        partial_table = f'{SCHEMA_NAME}.{quote_identifier(table_name + "_part")}'
+        with self._refresh_lock, SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            cursor.execute(f'PRAGMA case_sensitive_like = {saved_query.spec.case_sensitive}')
+            cursor.execute('BEGIN')
+            try:
+                cursor.execute(f'DROP TABLE IF EXISTS {partial_table}')
+                cursor.execute(f'CREATE TABLE {partial_table} AS {query}', parameters)
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                cursor.execute(f'ALTER TABLE {partial_table} RENAME TO {quote_identifier(table_name)}')
+                (rows, ), = cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchall()
+                cursor.execute(f'INSERT OR REPLACE INTO {SCHEMA_NAME}.{_METADATA_TABLE} VALUES (?, ?, ?, ?, ?)',
+                               (name, table_name, time.time(), rows, self._get_spec_key(saved_query)))
+                cursor.execute('COMMIT')
+            except sqlite3.Error:
+                cursor.execute('ROLLBACK')
+                raise
+        return rows
+
+    def drop(self, name: str) -> None:
+        """ Drops the materialized result of the saved query `name` """
+        metadata = self._get_metadata(name)
+        if metadata is None:
+            return
+        with self._refresh_lock, SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            cursor.execute('BEGIN')
+            cursor.execute(f'DROP TABLE IF EXISTS {SCHEMA_NAME}.{quote_identifier(metadata["table_name"])}')
+            cursor.execute(f'DELETE FROM {SCHEMA_NAME}.{_METADATA_TABLE} WHERE name = ?', (name,))
+            cursor.execute('COMMIT')
+
+    def refresh_stale(self) -> List[str]:
+        """
+        Refreshes the materialized results that are missing, whose saved query changed, whose refresh interval
+        passed, or all of them if the database changed since the last call.
+
+        :return: The names of the refreshed saved queries.
+        """
+        data_changed = self._has_data_changed()
+        refreshed = []
+        for saved_query in self.store.saved_queries:
+            if not saved_query.materialize:
+                continue
+            refreshed_at = self.get_refreshed_at(saved_query.name)
+            is_stale = data_changed or refreshed_at is None or self.get_table(saved_query.name) is None or \
+                (saved_query.refresh_interval is not None and
+                 time.time() - refreshed_at >= saved_query.refresh_interval)
+            if not is_stale:
+                continue
+            try:
+                self.refresh(saved_query.name)
+                refreshed.append(saved_query.name)
+            except (ValueError, sqlite3.Error):
+                logger.exception('Failed to refresh the saved query %r', saved_query.name)
+        return refreshed
+
+    def start(self) -> None:
+        """ Starts refreshing the materialized results in the background, every `poll_interval` seconds """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='materialized-views', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    def _run(self) -> None:
+        while True:
+            self.refresh_stale()
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def _has_data_changed(self) -> bool:
+        # `data_version` only changes when other connections commit, so it is read on a dedicated connection
+        # that never writes. The first call only remembers the version.
+        try:
+            if self._watcher is None:
+                self._watcher = sqlite3.connect(to_uri(self.database_file_path), uri=True, check_same_thread=False)
+            (data_version, ), = self._watcher.execute('PRAGMA data_version').fetchall()
+        except sqlite3.Error:
+            return False
+        changed = self._data_version is not None and data_version != self._data_version
+        self._data_version = data_version
+        return changed
+
+    def _get_metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_path.exists():
+            return None
+        self._attach()
+        with SqlLocalDatabaseContextManager(self.database_file_path) as cursor:
+            row = cursor.execute(f'SELECT table_name, refreshed_at, rows, spec FROM {SCHEMA_NAME}.{_METADATA_TABLE} '
+                                 f'WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('table_name', 'refreshed_at', 'rows', 'spec'), row))
+
+    @staticmethod
+    def _get_spec_key(saved_query: SavedQuery) -> str:
+        # The result is stale once the saved query it was computed for changed.
+        return json.dumps(query_spec_to_mapping(saved_query.spec), sort_keys=True)
+
+    def _attach(self) -> None:
+        with self._setup_lock:
+            if self._is_attached:
+                return
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.cache_path) as connection:
+                # Readers of a result are not blocked by its refresh, and do not block it.
+                connection.execute('PRAGMA journal_mode = WAL').fetchall()
+                connection.execute(f'CREATE TABLE IF NOT EXISTS {_METADATA_TABLE} ('
+                                   f'name TEXT PRIMARY KEY, table_name TEXT, refreshed_at REAL, rows INTEGER, '
+                                   f'spec TEXT)')
+            connection.close()
+            SqlConnectionPool.get_pool(self.database_file_path).attach(SCHEMA_NAME, to_uri(self.cache_path))
+            self._is_attached = True
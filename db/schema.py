@@ -0,0 +1,269 @@
+__all__ = ['SchemaCatalog']
+
+import dataclasses
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from db.backends import DatabaseBackend, get_backend
+from db.context_manager import DATABASE_PATH
+from db.data_structures import ColumnData, ColumnType, RelatedTable, TableSchema
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCatalog:
+    """
+    In-memory catalog of the tables, columns and foreign keys of a database.
+
+    Every lookup is served from memory, `validate` reloads the catalog if the schema version of the backend
+    (`PRAGMA schema_version` in SQLite) shows the schema was changed. Backends that support it (see
+    `DatabaseBackend.supports_lazy_schema`) load only the names of the tables at first, the columns of a table
+    are loaded once the table is used and the whole schema once the tables that reference a table are needed,
+    so opening a database with many tables does not wait for all of them to be introspected.
+    The whole schema can be kept in a snapshot file, which is used instead of introspecting the database
+    as long as the schema version and the tables did not change.
+
+    The catalogs of other databases can be attached to the catalog (see `attach`), their tables are listed
+    qualified by the schema name the database is attached as, e.g. 'shard_01.tracks'.
+    """
+
+    def __init__(self, database_file_path=DATABASE_PATH, snapshot_path: Optional[Path] = None):
+        """
+        :param database_file_path: The database, anything `backends.get_backend` accepts.
+        :param snapshot_path: The file the whole schema is kept in once it was loaded, None to not keep it.
+        """
+        self.database_file_path = database_file_path
+        self.backend: DatabaseBackend = get_backend(database_file_path)
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._schema_version: Optional[Hashable] = None
+        # The schema version of the database itself, without the attached catalogs.
+        self._own_schema_version: Optional[Hashable] = None
+        self._attached: Dict[str, 'SchemaCatalog'] = dict()
+        self._tables: Dict[str, TableSchema] = dict()
+        self._referenced_by: Dict[str, List[RelatedTable]] = dict()
+        self._table_names: List[str] = []
+        # The names of the database's own tables, without the tables of the attached catalogs.
+        self._own_table_names: Sequence[str] = ()
+        # Whether all the tables and their references are loaded, rather than only the tables that were used.
+        self._is_complete = False
+
+    @property
+    def schema_version(self) -> Hashable:
+        """ The schema version the catalog was loaded at, it changes whenever the catalog is reloaded """
+        self._ensure_loaded()
+        return self._schema_version
+
+    @property
+    def table_names(self) -> Sequence[str]:
+        """ The names of all the tables in the database, sorted by name """
+        self._ensure_loaded()
+        return self._table_names
+
+    def get_table(self, table_name: str) -> TableSchema:
+        self._ensure_loaded()
+        table = self._tables.get(table_name)
+        if table is None:
+            table = self._load_table(table_name)
+        return table
+
+    def get_columns(self, table_name: str) -> Sequence[ColumnData]:
+        return self.get_table(table_name).columns
+
+    def get_foreign_keys(self, table_name: str) -> Sequence[RelatedTable]:
+        """ The tables `table_name` references, `from_column` is the column in `table_name` """
+        return self.get_table(table_name).foreign_keys
+
+    def get_referencing_tables(self, table_name: str) -> Sequence[RelatedTable]:
+        """ The tables that reference `table_name`, `from_column` is the column in `table_name` """
+        self._ensure_loaded()
+        if not self._is_complete:
+            self._load()
+        return self._referenced_by.get(table_name, [])
+
+    @property
+    def attached_schemas(self) -> Sequence[str]:
+        """ The schema names of the attached catalogs """
+        with self._lock:
+            return list(self._attached)
+
+    def attach(self, schema_name: str, catalog: 'SchemaCatalog') -> None:
+        """
+        Lists the tables of another database's catalog as well, qualified by `schema_name`.
+        The catalog only describes the tables, the database itself must be attached to the connections
+        the tables are queried on (see `SqlConnectionPool.attach`).
+        """
+        with self._lock:
+            self._attached[schema_name] = catalog
+            self._schema_version = None
+
+    def validate(self) -> bool:
+        """
+        Reloads the catalog if the schema of the database or of an attached database was changed since it was loaded.
+
+        :return: True if the catalog was reloaded.
+        """
+        with self._lock:
+            attached = list(self._attached.values())
+        # Every attached catalog is validated, even once one of them was found changed.
+        attached_changed = [catalog.validate() for catalog in attached]
+        if not any(attached_changed) and self._schema_version is not None and \
+                self.backend.get_schema_version() == self._own_schema_version:
+            return False
+
+        self._load_table_names()
+        return True
+
+    def invalidate(self) -> None:
+        """ Drops the catalog, it would be reloaded on the next lookup """
+        with self._lock:
+            self._schema_version = None
+
+    def _ensure_loaded(self) -> None:
+        if self._schema_version is None:
+            self._load_table_names()
+
+    def _load_table_names(self) -> None:
+        """ Loads the names of the tables, or the whole schema if the backend can not load a table on its own """
+        if not self.backend.supports_lazy_schema:
+            self._load()
+            return
+        own_schema_version, own_table_names = self.backend.load_table_names()
+        snapshot = self._read_snapshot(own_schema_version, own_table_names)
+        if snapshot is not None:
+            self._set_tables(own_schema_version, snapshot, own_schema_version, own_table_names)
+            return
+
+        schema_version = own_schema_version
+        table_names = list(own_table_names)
+        with self._lock:
+            attached = list(self._attached.items())
+        if attached:
+            schema_version = (own_schema_version, *(catalog.schema_version for _, catalog in attached))
+            for schema_name, catalog in attached:
+                table_names.extend(f'{schema_name}.{table_name}' for table_name in catalog.table_names)
+        with self._lock:
+            self._tables = dict()
+            self._referenced_by = dict()
+            self._table_names = sorted(table_names)
+            self._own_table_names = own_table_names
+            self._schema_version = schema_version
+            self._own_schema_version = own_schema_version
+            self._is_complete = False
+
+    def _load_table(self, table_name: str) -> TableSchema:
+        """ Loads the schema of a single table, before the whole schema was loaded """
+        with self._lock:
+            table_names, own_table_names = self._table_names, self._own_table_names
+            attached = dict(self._attached)
+        if table_name not in table_names:
+            raise KeyError(table_name)
+        if table_name in own_table_names:
+            table = self.backend.load_table(table_name, own_table_names)
+            if table is None:
+                # The table was dropped since the names were loaded.
+                raise KeyError(table_name)
+        else:
+            schema_name, _, attached_table_name = table_name.partition('.')
+            table = _qualify(attached[schema_name].get_table(attached_table_name), schema_name)
+        with self._lock:
+            self._tables[table_name] = table
+        return table
+
+    def _load(self) -> None:
+        """ Loads the whole schema, including the tables of the attached catalogs """
+        own_schema_version, table_schemas = self.backend.load_schema()
+        self._write_snapshot(own_schema_version, table_schemas)
+        own_table_names = [table.table_name for table in table_schemas]
+        schema_version = own_schema_version
+        with self._lock:
+            attached = list(self._attached.items())
+        if attached:
+            schema_version = (own_schema_version, *(catalog.schema_version for _, catalog in attached))
+            for schema_name, catalog in attached:
+                table_schemas.extend(_qualify(catalog.get_table(table_name), schema_name)
+                                     for table_name in catalog.table_names)
+        self._set_tables(schema_version, table_schemas, own_schema_version, own_table_names)
+
+    def _set_tables(self, schema_version: Hashable, table_schemas: List[TableSchema], own_schema_version: Hashable,
+                    own_table_names: Sequence[str]) -> None:
+        """ Replaces the catalog by the whole schema """
+        tables = {table.table_name: table for table in table_schemas}
+        referenced_by: Dict[str, List[RelatedTable]] = dict()
+        for table in table_schemas:
+            for related_table in table.foreign_keys:
+                referenced_by.setdefault(related_table.table_name, []).append(
+                    RelatedTable(table.table_name, related_table.to_column, related_table.from_column))
+
+        with self._lock:
+            self._tables = tables
+            self._referenced_by = referenced_by
+            self._table_names = sorted(tables)
+            self._own_table_names = own_table_names
+            self._schema_version = schema_version
+            self._own_schema_version = own_schema_version
+            self._is_complete = True
+
+    def _read_snapshot(self, schema_version: Hashable, table_names: Sequence[str]) -> Optional[List[TableSchema]]:
+        """ The tables of the snapshot, None if there is none or the schema changed since it was written """
+        with self._lock:
+            if self.snapshot_path is None or self._attached:
+                return None
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as snapshot_file:
+                content = json.load(snapshot_file)
+            if content['schema_version'] != schema_version:
+                return None
+            tables = [_table_from_mapping(table) for table in content['tables']]
+        except OSError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Ignoring the invalid schema snapshot %s', self.snapshot_path)
+            return None
+        # The schema version alone does not tell apart two databases that were replaced by one another.
+        if sorted(table.table_name for table in tables) != sorted(table_names):
+            return None
+        return tables
+
+    def _write_snapshot(self, schema_version: Hashable, table_schemas: Sequence[TableSchema]) -> None:
+        if self.snapshot_path is None or not self.backend.supports_lazy_schema:
+            return
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            # The file is replaced at once, so it is never left half written.
+            partial_path = self.snapshot_path.with_name(self.snapshot_path.name + '.part')
+            partial_path.write_text(json.dumps({'schema_version': schema_version,
+                                                'tables': [_table_to_mapping(table) for table in table_schemas]}),
+                                    encoding='utf-8')
+            partial_path.replace(self.snapshot_path)
+        except (OSError, TypeError):
+            # The snapshot only speeds up the next start, failing to write it should not fail loading the schema.
+            pass
+
+
+def _table_to_mapping(table: TableSchema) -> Dict[str, Any]:
+    return {'table_name': table.table_name,
+            'columns': [[column.title, column.column_type.name, column.is_primary, column.is_nullable]
+                        for column in table.columns],
+            'foreign_keys': [[related_table.table_name, related_table.from_column, related_table.to_column]
+                             for related_table in table.foreign_keys]}
+
+
+def _table_from_mapping(content: Dict[str, Any]) -> TableSchema:
+    table_name = content['table_name']
+    return TableSchema(table_name,
+                       tuple(ColumnData(table_name, ColumnType[column_type], title, bool(is_primary), bool(is_nullable))
+                             for title, column_type, is_primary, is_nullable in content['columns']),
+                       tuple(RelatedTable(*related_table) for related_table in content['foreign_keys']))
+
+
+def _qualify(table: TableSchema, schema_name: str) -> TableSchema:
+    """ The schema of an attached table, its name and the tables it references are qualified by `schema_name` """
+    table_name = f'{schema_name}.{table.table_name}'
+    return TableSchema(table_name,
+                       tuple(dataclasses.replace(column, table_name=table_name) for column in table.columns),
+                       tuple(dataclasses.replace(related_table, table_name=f'{schema_name}.{related_table.table_name}')
+                             for related_table in table.foreign_keys))
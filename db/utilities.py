@@ -1,61 +1,151 @@
 __all__ = ['execute_query']
 
-from typing import Iterable, List
+from typing import Any, Iterable, Iterator, List, Mapping, Sequence, Tuple, Union
 
-from db import filters
-from db.context_manager import SqlLocalDatabaseContextManager
-from db.data_structures import ColumnType
+from db import filters, operators
+from db.context_manager import DATABASE_PATH, SqlLocalDatabaseContextManager
+from db.data_structures import ColumnData, ColumnType, Query, SqlDialect
 
 
-def execute_query(query: str) -> Iterable[str]:
+def execute_query(query: str, parameters: Sequence[Any] = (), database_file_path=DATABASE_PATH) -> Iterable[str]:
     """
     Runs `query` on the database and yields the results one by one.
+    The statement is prepared once per connection and reused for every call with the same query.
 
     :param query: The query to run.
+    :param parameters: The values to bind to the placeholders of the query.
+    :param database_file_path: The database to run the query on.
     :return: Yields the results of the query.
     """
-    with SqlLocalDatabaseContextManager() as cursor:
-        cursor.execute(query)
+    with SqlLocalDatabaseContextManager(database_file_path) as cursor:
+        cursor.execute(query, parameters)
         for result in cursor:
             yield result
 
 
-def execute_queries(queries: Iterable[str]):
-    with SqlLocalDatabaseContextManager() as cursor:
+def execute_queries(queries: Iterable[Union[str, Query]], database_file_path=DATABASE_PATH):
+    """ Runs `queries` one after the other on the same connection, queries may be given with their parameters """
+    with SqlLocalDatabaseContextManager(database_file_path) as cursor:
         for query in queries:
-            cursor.execute(query)
+            if isinstance(query, str):
+                query = query, ()
+            cursor.execute(*query)
             yield from cursor
 
 
-def add_filters_to_query(query: str, query_filters: Iterable[filters.Filter], case_sensitive: bool) -> str:
+def execute_query_in_batches(query: str, parameters: Sequence[Any] = (), batch_size: int = 1000,
+                             setup_queries: Iterable[str] = (), database_file_path=DATABASE_PATH) -> Iterator:
+    """
+    Runs `query` on the database and yields its results in batches fetched with `fetchmany`.
+
+    :param query: The query to run.
+    :param parameters: The values to bind to the placeholders of the query.
+    :param batch_size: The maximal number of rows in every batch.
+    :param setup_queries: Statements to run on the connection before the query (e.g. PRAGMAs).
+    :param database_file_path: The database to run the query on.
+    :return: Yields the names of the columns and after that yields every batch of rows.
+    """
+    with SqlLocalDatabaseContextManager(database_file_path) as cursor:
+        for setup_query in setup_queries:
+            cursor.execute(setup_query)
+        cursor.execute(query, parameters)
+        yield [description[0] for description in cursor.description]
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if len(batch) == 0:
+                return
+            yield batch
+
+
+def consume(results: Iterable) -> None:
+    """ Runs a lazy query to its end, for statements that return no rows """
+    for _ in results:
+        pass
+
+
+def quote_identifier(name: str) -> str:
+    """ Quotes `name` so it can be used as a SQL identifier even if it contains dots or spaces """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def quote_table_name(table_name: str) -> str:
+    """ Quotes a table name, the table of an attached database is quoted with its schema (`"shard"."tracks"`) """
+    return '.'.join(quote_identifier(part) for part in table_name.split('.', 1))
+
+
+def select_columns(columns_full_names: Iterable[str]) -> str:
+    """
+    Formats the select list of `columns_full_names`, every column is aliased by its full name
+    (e.g. `albums.Title AS "albums.Title"`) so the columns of the result have unique names.
+    """
+    return ','.join(f'{full_name} AS {quote_identifier(full_name)}' for full_name in columns_full_names)
+
+
+def build_order_by(sort_keys: Iterable[Tuple[str, bool]], columns: Mapping[str, ColumnData],
+                   dialect: SqlDialect = operators.SQLITE_DIALECT) -> str:
+    """
+    Builds the ORDER BY clause for a result that was selected with `select_columns`.
+    Numeric columns are compared by their values as they are (sqlite orders numbers before texts, so the texts
+    of a numeric column, e.g. dates, are compared as texts), text columns case insensitively and NULLs are last.
+
+    :param sort_keys: (column full name, is descending) pairs, the first pair is the primary sort key.
+    :param columns: The columns of the result by their full names.
+    :param dialect: How the database engine compares texts case insensitively.
+    :return: The ORDER BY clause, or an empty string if there are no sort keys.
+    """
+    order_by_terms = []
+    for column_name, descending in sort_keys:
+        expression = quote_identifier(column_name)
+        if columns[column_name].column_type is not ColumnType.Numeric:
+            expression = f'{expression} COLLATE NOCASE' if dialect.has_nocase_collation else f'LOWER({expression})'
+        order_by_terms.append(f'{expression} {"DESC" if descending else "ASC"} NULLS LAST')
+
+    return f'ORDER BY {", ".join(order_by_terms)}' if len(order_by_terms) > 0 else ''
+
+
+def add_filters_to_query(query: str, query_filters: Iterable[filters.Filter], case_sensitive: bool,
+                         parameters: Sequence[Any] = (), quote_columns: bool = False,
+                         dialect: SqlDialect = operators.SQLITE_DIALECT) -> Query:
     """
     Appends `table_filters` to `query` as a 'WHERE' statement at the end of the query.
 
     :param query: The base query.
     :param query_filters: The filters to add to the query.
     :param case_sensitive: Are the filters case sensitive.
-    :return: The new query with the filters as 'WHERE' statement.
+    :param parameters: The parameters of the base query.
+    :param quote_columns: Refer to the columns by their quoted full name, for queries on results
+                          that were selected with `select_columns`.
+    :param dialect: How the database engine compares texts case insensitively.
+    :return: The new query with the filters as 'WHERE' statement and the parameters to bind to it.
     """
     # Get the query version of every filter
-    filters_queries: List[str] = [table_filter.get_query(case_sensitive) for table_filter in query_filters]
+    filters_queries: List[str] = []
+    query_parameters: List[Any] = list(parameters)
+    for table_filter in query_filters:
+        column = quote_identifier(table_filter.column_name) if quote_columns else None
+        filter_query, filter_parameters = table_filter.get_query(case_sensitive, column, dialect)
+        filters_queries.append(filter_query)
+        query_parameters.extend(filter_parameters)
 
     if len(filters_queries) == 0:
-        return query
+        return query, query_parameters
     # Concatenate the WHERE statement and the filters to the query and return the result.
-    return ' '.join((query, 'WHERE', ' AND '.join(filters_queries)))
+    return ' '.join((query, 'WHERE', ' AND '.join(filters_queries))), query_parameters
 
 
-def get_all_tables_in_database():
+def get_all_tables_in_database(database_file_path=DATABASE_PATH):
     """ Retrieves all the tables in the database and sorts them by name. """
-    query = """SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'; """
-    return sorted([i[0] for i in execute_query(query)])
+    query = r"""SELECT name FROM sqlite_master
+                WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'sql\_gui\_fts\_%' ESCAPE '\'; """
+    return sorted([i[0] for i in execute_query(query, database_file_path=database_file_path)])
 
 
 def sql_type_to_enum_type(column_type: str) -> ColumnType:
     """ Converts the given column type from a sql format (e.g. INTEGER, VARCHAR, etc…)
     to the appropriate ColumnType instance. """
-    # If the type is a varchar (text)
-    if column_type.lower().startswith('nvarchar'):
+    # If the type is a varchar (text), other engines name their text types e.g. VARCHAR, CHARACTER VARYING or TEXT
+    column_type = column_type.lower()
+    if any(text_type in column_type for text_type in ('char', 'text', 'clob', 'string')):
         return ColumnType.Text
 
     return ColumnType.Numeric
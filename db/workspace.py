@@ -0,0 +1,269 @@
+__all__ = ['Workspace']
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from db import utilities
+from db.context_manager import DATABASE_PATH, SqlConnectionPool, to_uri
+from db.data_structures import ColumnData
+from db.schema import SchemaCatalog
+
+DEFAULT_BATCH_SIZE = 1000
+# The number of batches every shard may fetch ahead of the reader before it waits.
+_QUEUED_BATCHES_PER_SHARD = 4
+# How often a shard that waits for the reader checks whether the reader stopped, in seconds.
+_PUT_TIMEOUT = 0.1
+# Schema names SQLite already uses, or that the application attaches on its own.
+_RESERVED_SCHEMAS = {'main', 'temp', 'saved'}
+
+
+def _get_attach_limit() -> int:
+    """ The number of databases SQLite can attach to a connection, 10 unless SQLite was compiled otherwise """
+    connection = sqlite3.connect(':memory:')
+    try:
+        return connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    finally:
+        connection.close()
+
+
+class Workspace:
+    """
+    Several database files opened together with a main database, e.g. the monthly shards of the same schema.
+
+    Every shard is attached to the connections of the main database's pool and its tables are listed in the
+    main catalog qualified by the shard's schema name, so they are browsed, joined and filtered like the tables
+    of the main database (`shard_2024_01.tracks`).
+
+    A table that is in several shards is read by `stream` as the UNION ALL of the shards: the query runs on
+    every shard in parallel, each on a connection of the shard's own pool, and the rows are yielded as soon as
+    any shard fetched them. The shards run on threads since sqlite releases the GIL while it executes a statement.
+
+    SQLite attaches at most 10 databases to a connection (`SQLITE_LIMIT_ATTACHED`). The refined results are always
+    attached as well and the saved queries' cache once it is used, so a workspace holds 8 or 9 shards.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, database_file_path=DATABASE_PATH, max_workers: int = None):
+        """
+        :param catalog: The catalog of the main database, the catalogs of the shards are attached to it.
+        :param database_file_path: The main database, the shards are attached to the connections of its pool.
+        :param max_workers: The maximal number of shards that are read at once, defaults to the number of CPUs.
+        """
+        self.catalog = catalog
+        self.database_file_path = database_file_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._shards: Dict[str, Path] = dict()
+        self._catalogs: Dict[str, SchemaCatalog] = dict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def shards(self) -> Dict[str, Path]:
+        """ The database files of the workspace by their schema names """
+        with self._lock:
+            return dict(self._shards)
+
+    def add(self, shard_path, schema_name: str = None) -> str:
+        """
+        Adds a database file to the workspace and attaches it to the connections of the main database.
+
+        :param shard_path: The database file.
+        :param schema_name: The name the tables of the shard are qualified with, defaults to the name of the file.
+        :return: The schema name of the shard.
+        :raise ValueError: If the file does not exist, the schema name is taken or SQLite can not attach more databases.
+        """
+        shard_path = Path(shard_path).resolve()
+        if not shard_path.is_file():
+            raise ValueError(f'No database file {str(shard_path)!r}')
+        pool = SqlConnectionPool.get_pool(self.database_file_path)
+        with self._lock:
+            if shard_path in self._shards.values():
+                return next(name for name, path in self._shards.items() if path == shard_path)
+            if schema_name is None:
+                schema_name = self._get_schema_name(shard_path, pool.attachments)
+            elif schema_name.lower() in _RESERVED_SCHEMAS or schema_name in pool.attachments or \
+                    re.fullmatch(r'[A-Za-z_]\w*', schema_name) is None:
+                raise ValueError(f'Invalid schema name {schema_name!r}')
+            if len(pool.attachments) >= _get_attach_limit():
+                raise ValueError(f'SQLite can not attach more than {_get_attach_limit()} databases, '
+                                 f'{", ".join(pool.attachments)} are attached')
+            self._shards[schema_name] = shard_path
+            self._catalogs[schema_name] = SchemaCatalog(shard_path)
+
+        pool.attach(schema_name, to_uri(shard_path))
+        self.catalog.attach(schema_name, self._catalogs[schema_name])
+        return schema_name
+
+    def get_shards(self, table_name: str) -> List[str]:
+        """ The schema names of the shards that have the table `table_name`, in the order they were added """
+        with self._lock:
+            catalogs = list(self._catalogs.items())
+        return [schema_name for schema_name, catalog in catalogs if table_name in catalog.table_names]
+
+    def get_columns(self, table_name: str) -> Sequence[ColumnData]:
+        """
+        The columns of `table_name` in the shards, qualified by the table name alone.
+
+        :raise ValueError: If no shard has the table, or the shards do not have the same columns.
+        """
+        shards = self.get_shards(table_name)
+        if len(shards) == 0:
+            raise ValueError(f'No shard has the table {table_name!r}')
+        columns = self._catalogs[shards[0]].get_columns(table_name)
+        titles = [column.title for column in columns]
+        for schema_name in shards[1:]:
+            if [column.title for column in self._catalogs[schema_name].get_columns(table_name)] != titles:
+                raise ValueError(f'The columns of {schema_name}.{table_name} are not the columns of '
+                                 f'{shards[0]}.{table_name}')
+        return columns
+
+    def build_union_query(self, table_name: str, columns_full_names: Sequence[str],
+                          shards: Sequence[str] = None) -> str:
+        """
+        Builds the UNION ALL of the table in the shards, for the connections the shards are attached to.
+        The columns are selected with `select_columns` like the columns of a table of the main database.
+
+        :param table_name: The table.
+        :param columns_full_names: The full names of the columns to select, qualified by the table name alone.
+        :param shards: The schema names of the shards, defaults to all the shards that have the table.
+        """
+        shards = self.get_shards(table_name) if shards is None else shards
+        select = utilities.select_columns(columns_full_names)
+        return ' UNION ALL '.join(f'SELECT {select} FROM {schema_name}.{table_name} AS {table_name}'
+                                  for schema_name in shards)
+
+    def stream(self, query: str, parameters: Sequence[Any] = (), shards: Sequence[str] = None,
+               batch_size: int = DEFAULT_BATCH_SIZE, setup_queries: Iterable[str] = ()) -> Iterator:
+        """
+        Runs `query` on every shard in parallel and merges the results as they come, in no particular order.
+
+        :param query: The query to run, it is run on every shard on its own so it refers to unqualified tables.
+        :param parameters: The values to bind to the placeholders of the query.
+        :param shards: The schema names of the shards to run the query on, defaults to all of them.
+        :param batch_size: The maximal number of rows every shard fetches at once.
+        :param setup_queries: Statements to run on the connection of every shard before the query (e.g. PRAGMAs).
+        :return: Yields the names of the columns and after that yields every batch of rows of any shard.
+        :raise ValueError: If the shards return different columns.
+        """
+        with self._lock:
+            paths = [self._shards[schema_name] for schema_name in (self._shards if shards is None else shards)]
+        if len(paths) == 0:
+            raise ValueError('There are no shards to run the query on')
+
+        results: queue.Queue = queue.Queue(maxsize=len(paths) * _QUEUED_BATCHES_PER_SHARD)
+        reading = _ShardReading(results)
+        executor = self._get_executor()
+        for index, path in enumerate(paths):
+            executor.submit(reading.read, index, path, query, parameters, batch_size, tuple(setup_queries))
+
+        try:
+            columns_names = None
+            remaining = len(paths)
+            while remaining > 0:
+                index, item = results.get()
+                if item is _ShardReading.DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                elif reading.is_columns_names(index, item):
+                    if columns_names is None:
+                        columns_names = item
+                        yield columns_names
+                    elif item != columns_names:
+                        raise ValueError(f'The shard {str(paths[index])!r} returned the columns {item}, '
+                                         f'not {columns_names}')
+                else:
+                    yield item
+        finally:
+            reading.stop()
+
+    def close(self) -> None:
+        """ Stops the threads the shards are read on """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='shard')
+            return self._executor
+
+    def _get_schema_name(self, shard_path: Path, attachments: Iterable[str]) -> str:
+        # Table names are not quoted in the queries, so the schema name must be a plain identifier.
+        base_name = re.sub(r'\W', '_', shard_path.stem)
+        if not re.match(r'[A-Za-z_]', base_name):
+            base_name = f'shard_{base_name}'
+        # Schema names are case insensitive.
+        taken = {name.lower() for name in (*_RESERVED_SCHEMAS, *attachments, *self._shards)}
+        schema_name, suffix = base_name, 1
+        while schema_name.lower() in taken:
+            suffix += 1
+            schema_name = f'{base_name}_{suffix}'
+        return schema_name
+
+
+class _ShardReading:
+    """ The reads of a single `Workspace.stream` call, they stop once the reader stopped reading """
+    DONE = object()
+
+    def __init__(self, results: queue.Queue):
+        self._results = results
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # The threads that are reading a shard, their queries are interrupted when the reader stops.
+        self._readers: Dict[int, int] = dict()
+        self._columns_sent: Set[int] = set()
+
+    def read(self, index: int, path: Path, query: str, parameters: Sequence[Any], batch_size: int,
+             setup_queries: Sequence[str]) -> None:
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._readers[index] = threading.get_ident()
+        try:
+            batches = utilities.execute_query_in_batches(query, parameters, batch_size, setup_queries, path)
+            try:
+                for batch in batches:
+                    if not self._put((index, batch)):
+                        return
+            finally:
+                batches.close()
+        except Exception as e:
+            if not self._stopped.is_set():
+                self._put((index, e))
+        finally:
+            with self._lock:
+                self._readers.pop(index, None)
+            self._put((index, self.DONE))
+
+    def is_columns_names(self, index: int, item) -> bool:
+        """ The first item of every shard is the names of its columns """
+        if index in self._columns_sent:
+            return False
+        self._columns_sent.add(index)
+        return True
+
+    def stop(self) -> None:
+        """ Stops the shards that are still read, the queries they run are aborted """
+        self._stopped.set()
+        with self._lock:
+            readers = list(self._readers.values())
+            for thread_id in readers:
+                SqlConnectionPool.interrupt_owner(thread_id)
+
+    def _put(self, item) -> bool:
+        # A shard waits while the reader is behind, and gives up once the reader stopped.
+        while not self._stopped.is_set():
+            try:
+                self._results.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
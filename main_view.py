@@ -1,14 +1,33 @@
+import logging
+import os
+import threading
+import time
 import tkinter as tk
-from tkinter import ttk
-from typing import Sequence
+import tkinter.font as tk_font
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from typing import Callable, Optional, Sequence, Tuple
 
 import db
+from db import export
 import view.constants as consts
 from view.constants import Colors as c
 from view.constants import Fonts as f
 from view.multi_selection_combobox import MultiSelectionComboBox
+from view.grouping_panel import GroupingPanel
+from view.profiling_panel import ProfilingPanel
+from view.virtual_treeview import VirtualTreeview
 from view.constants import WindowVariables as wv
 
+POLL_INTERVAL_MS = 50
+# A JSON Lines file every query profile is appended to, profiles are only kept in memory if it is not set.
+PROFILE_LOG_ENVIRONMENT_VARIABLE = 'SQL_GUI_PROFILE_LOG'
+# The name of the connection profile the database is opened with (see `db.CONNECTION_PROFILES`), e.g. 'analytics'.
+CONNECTION_PROFILE_ENVIRONMENT_VARIABLE = 'SQL_GUI_CONNECTION_PROFILE'
+MAX_BATCHES_PER_POLL = 4
+# The number of rows a table is previewed with, the preview is shown at once however large the table is.
+PREVIEW_ROWS = 1000
+
+
 class MainView(tk.Frame):
     def __init__(self):
         tk.Frame.__init__(self)
@@ -17,7 +36,11 @@ class MainView(tk.Frame):
         self.message_variable: tk.StringVar
         self.window: tk.Tk
         self.table: ttk.Treeview
-        self.current_table: str
+        self.classic_table: ttk.Treeview
+        self.virtual_table: VirtualTreeview
+        self.is_virtual_grid: tk.BooleanVar
+        # The table that is shown, None until the tables of the database were listed.
+        self.current_table: Optional[str] = None
         self.cols_data: Sequence[db.ColumnData]
         self.home_frame: tk.Frame
         self.table_names: Sequence[str]
@@ -29,20 +52,57 @@ class MainView(tk.Frame):
         self.listbox: tk.Listbox
         self.joinable_table_selected_box: MultiSelectionComboBox
         # self.operators_cb: ttk.Combobox
-        self.handler: db.SqlLiteHandler = db.SqlLiteHandler.get_instance()
+        # The handler is created on the executor while the window is shown, see `create_handler`.
+        self._handler: Optional[db.SqlLiteHandler] = None
+        self._handler_lock = threading.Lock()
+        self.executor = db.QueryExecutor()
+        self.current_task: Optional[db.QueryTask] = None
+        self.profiling_panel: Optional[ProfilingPanel] = None
+        self.grouping_panel: Optional[GroupingPanel] = None
+        # The columns of the result before it was grouped, None if the result is not grouped.
+        self.ungrouped_columns: Optional[Tuple[Sequence[db.ColumnData], Sequence[str]]] = None
+        # The current result loaded into memory in the analytics mode, it is filtered and sorted without the database.
+        self.columnar_result: Optional[db.ColumnarResult] = None
+        # The time spent inserting the rows of the current result into the table.
+        self.render_seconds = 0.0
         self.list_id: int = 0
         self.filters_applying = list()
-        self.last_sort_col = ''
+        self.available_operators: Sequence[db.Operator] = ()
         self.init_main_frame_view()
         self.init_table_selector_view()
         self.init_main_table_view()
         self.init_join_tables_menu_view()
+        self.init_progress_view()
         self.init_filter_pane()
 
         # ___ Set initial values ___
-        # ___ Set initial values ___
-        self.table_box.set(self.table_names[0])
-        self.view_table(self.table_names[0])
+        # The window is shown before the database is read, the tables are listed in the background.
+        self.load_table_names()
+
+    @property
+    def handler(self) -> db.SqlLiteHandler:
+        """ The handler of the database, waits for it if it is still created on the executor """
+        return self._handler or self.create_handler()
+
+    def create_handler(self) -> db.SqlLiteHandler:
+        """
+        Creates the handler of the database (its connection pool, catalog, caches, indexes, profiler, planners,
+        workspace and saved queries) once, on the executor on startup so the window is shown before it is ready
+        """
+        with self._handler_lock:
+            if self._handler is not None:
+                return self._handler
+            handler = db.SqlLiteHandler.get_instance()
+            if os.environ.get(PROFILE_LOG_ENVIRONMENT_VARIABLE):
+                handler.profiler.add_sink(db.JsonLinesSink(os.environ[PROFILE_LOG_ENVIRONMENT_VARIABLE]))
+            connection_profile_name = os.environ.get(CONNECTION_PROFILE_ENVIRONMENT_VARIABLE)
+            if connection_profile_name in db.CONNECTION_PROFILES:
+                handler.set_connection_profile(db.CONNECTION_PROFILES[connection_profile_name])
+            elif connection_profile_name:
+                logging.warning('Unknown connection profile %r, the profiles are: %s', connection_profile_name,
+                                ', '.join(db.CONNECTION_PROFILES))
+            self._handler = handler
+            return handler
 
     def init_join_tables_menu_view(self) -> None:
         """
@@ -62,6 +122,50 @@ class MainView(tk.Frame):
         message_label = tk.Label(button_frame, text="Join with", font=f.H2_FONT, bg=c.WINDOW_BACKGROUND)
         message_label.grid(row=0, column=1, sticky=tk.W, padx=5, pady=15)
 
+        advise_indexes_btn = tk.Button(button_frame, text="Advise indexes", font=f.BUTTONS_FONT,
+                                       bg=c.BUTTON_BACKGROUND, command=self.on_click_advise_indexes)
+        advise_indexes_btn.grid(row=0, column=3, padx=5, pady=5)
+        full_text_index_btn = tk.Button(button_frame, text="Full-text index", font=f.BUTTONS_FONT,
+                                        bg=c.BUTTON_BACKGROUND, command=self.on_click_full_text_index)
+        full_text_index_btn.grid(row=0, column=4, padx=5, pady=5)
+        save_query_btn = tk.Button(button_frame, text="Save query", font=f.BUTTONS_FONT, bg=c.BUTTON_BACKGROUND,
+                                   command=self.on_click_save_query)
+        save_query_btn.grid(row=0, column=5, padx=5, pady=5)
+        # The saved queries are listed once the handler is created.
+        self.saved_queries_box = ttk.Combobox(button_frame, state='readonly', width=20)
+        self.saved_queries_box.grid(row=0, column=6, padx=5, pady=5)
+        self.saved_queries_box.bind("<<ComboboxSelected>>", self.callback_saved_query_selected)
+        open_shards_btn = tk.Button(button_frame, text="Open shards", font=f.BUTTONS_FONT, bg=c.BUTTON_BACKGROUND,
+                                    command=self.on_click_open_shards)
+        open_shards_btn.grid(row=0, column=7, padx=5, pady=5)
+        self.is_all_shards = tk.BooleanVar(value=False)
+        tk.Checkbutton(button_frame, text="All shards", variable=self.is_all_shards, bg=c.WINDOW_BACKGROUND,
+                       activebackground=c.WINDOW_BACKGROUND, font=f.LABELS_FONT,
+                       command=self.callback_all_shards_toggled).grid(row=0, column=8, padx=5)
+
+    def init_progress_view(self) -> None:
+        """
+        Initialize the progress indicator of the running query and its cancel button
+        """
+        progress_frame = tk.Frame(self.home_frame, bg=c.WINDOW_BACKGROUND)
+        progress_frame.grid(row=4, column=0, sticky=tk.E)
+
+        self.progress_str = tk.StringVar()
+        tk.Label(progress_frame, textvar=self.progress_str, font=f.LABELS_FONT,
+                 bg=c.WINDOW_BACKGROUND).grid(column=0, row=0, padx=5, pady=5)
+        self.cancel_btn = tk.Button(progress_frame, text="Cancel", font=f.BUTTONS_FONT, state=tk.DISABLED,
+                                    bg=c.BUTTON_BACKGROUND, command=self.on_click_cancel_query)
+        self.cancel_btn.grid(column=1, row=0, padx=5, pady=5)
+        export_btn = tk.Button(progress_frame, text="Export", font=f.BUTTONS_FONT, bg=c.BUTTON_BACKGROUND,
+                               command=self.on_click_export)
+        export_btn.grid(column=2, row=0, padx=5, pady=5)
+        profile_btn = tk.Button(progress_frame, text="Profile", font=f.BUTTONS_FONT, bg=c.BUTTON_BACKGROUND,
+                                command=self.on_click_profile)
+        profile_btn.grid(column=3, row=0, padx=5, pady=5)
+        group_btn = tk.Button(progress_frame, text="Group", font=f.BUTTONS_FONT, bg=c.BUTTON_BACKGROUND,
+                              command=self.on_click_group)
+        group_btn.grid(column=4, row=0, padx=5, pady=5)
+
     def init_filter_pane(self) -> None:
         """
         Initialize all filter related views 
@@ -160,15 +264,52 @@ class MainView(tk.Frame):
         #  font=f.H1_FONT, bg=c.WINDOW_BACKGROUND) \
         #  .grid(column=0, row=0, padx=5, pady=5)
         # Create tables names Combobox
-        self.table_names = self.handler.table_names
+        # The tables are listed by `load_table_names`, once the window is shown.
+        self.table_names = ()
         self.table_box = ttk.Combobox(self.home_frame,
                                       values=self.table_names,
                                       width=27,
                                       font=f.LABELS_FONT)
-        self.table_box['state'] = 'readonly'
+        self.table_box['state'] = tk.DISABLED
         self.table_box.bind("<<ComboboxSelected>>", self.callback_select_main_table)
         self.table_box.grid(column=0, row=1, padx=5, pady=5)
 
+    def load_table_names(self) -> None:
+        """
+        Creates the handler and lists the tables of the database on the executor, only their names are read from
+        the database (or from the schema snapshot), the columns of a table are read once the table is opened
+        """
+        self.progress_str.set('Loading tables...')
+        task = self.executor.submit(lambda: [(table_name,) for table_name in self.create_handler().table_names])
+        self.after(POLL_INTERVAL_MS, self.poll_table_names, task)
+
+    def poll_table_names(self, task: db.QueryTask) -> None:
+        """
+        Args:
+            task: the task that lists the tables
+
+        shows the tables once they are listed, and opens the first of them when the window is idle
+        """
+        if not task.is_done:
+            self.after(POLL_INTERVAL_MS, self.poll_table_names, task)
+            return
+        self.progress_str.set('')
+        if task.error is not None:
+            self.exception_str.set(task.error)
+            return
+        # The handler is created and the catalog is loaded by now, so the names are read from memory.
+        self.saved_queries_box['values'] = self.handler.saved_queries.names
+        self.is_parallel_scan.set(self.handler.parallel_scan.enabled)
+        # Materialized saved queries are refreshed in the background while the application runs.
+        self.handler.materialized_views.start()
+        self.table_names = self.handler.table_names
+        self.table_box['values'] = self.table_names
+        self.table_box['state'] = 'readonly'
+        if len(self.table_names) > 0 and self.current_table is None:
+            self.table_box.set(self.table_names[0])
+            # The table list is drawn first, the first table is rendered right after it.
+            self.after_idle(self.view_table, self.table_names[0])
+
     def init_join_ables_menu_view(self) -> None:
         """
         Initialize all table joining related views
@@ -192,22 +333,86 @@ class MainView(tk.Frame):
         Initialize all main table's related views
         """
         # init TreeView Object and locate it in frame
-        self.table = ttk.Treeview(self.home_frame, show="headings", height=8, selectmode=tk.BROWSE)
-        self.table.grid(column=0, row=2, sticky=tk.NSEW)
+        self.classic_table_frame = tk.Frame(self.home_frame, bg=c.WINDOW_BACKGROUND)
+        self.classic_table_frame.rowconfigure(0, weight=1)
+        self.classic_table_frame.columnconfigure(0, weight=1)
+        self.classic_table = ttk.Treeview(self.classic_table_frame, show="headings", height=8, selectmode=tk.BROWSE)
+        self.classic_table.grid(column=0, row=0, sticky=tk.NSEW)
         # Setup scrollbars
-        vertical_scrollbar = ttk.Scrollbar(self.home_frame, orient=tk.VERTICAL, command=self.table.yview)
-        vertical_scrollbar.grid(column=1, row=2, sticky=tk.NS)
-        self.table.configure(yscrollcommand=vertical_scrollbar.set)
+        vertical_scrollbar = ttk.Scrollbar(self.classic_table_frame, orient=tk.VERTICAL,
+                                           command=self.classic_table.yview)
+        vertical_scrollbar.grid(column=1, row=0, sticky=tk.NS)
+        self.classic_table.configure(yscrollcommand=vertical_scrollbar.set)
+
+        horizontal_scrollbar = ttk.Scrollbar(self.classic_table_frame, orient=tk.HORIZONTAL,
+                                             command=self.classic_table.xview)
+        horizontal_scrollbar.grid(column=0, row=1, sticky=tk.EW)
+        self.classic_table.configure(xscrollcommand=horizontal_scrollbar.set)
 
-        horizontal_scrollbar = ttk.Scrollbar(self.home_frame, orient=tk.HORIZONTAL, command=self.table.xview)
-        horizontal_scrollbar.grid(column=0, row=3, sticky=tk.EW)
-        self.table.configure(xscrollcommand=horizontal_scrollbar.set)
+        # The virtual grid only keeps the visible rows in the TreeView and fetches them on demand
+        self.virtual_table = VirtualTreeview(self.home_frame)
+        self.is_virtual_grid = tk.BooleanVar(value=True)
+        virtual_grid_cb = tk.Checkbutton(self.home_frame, text="Virtual scrolling", variable=self.is_virtual_grid,
+                                         bg=c.WINDOW_BACKGROUND, activebackground=c.WINDOW_BACKGROUND,
+                                         font=f.H2_FONT, command=self.callback_virtual_grid_toggled)
+        virtual_grid_cb.grid(column=0, row=1, sticky=tk.E, padx=5, pady=5)
+        self.is_analytics_mode = tk.BooleanVar(value=False)
+        analytics_mode_cb = tk.Checkbutton(self.home_frame, text="Analytics mode", variable=self.is_analytics_mode,
+                                           bg=c.WINDOW_BACKGROUND, activebackground=c.WINDOW_BACKGROUND,
+                                           font=f.H2_FONT, command=self.callback_analytics_mode_toggled)
+        analytics_mode_cb.grid(column=0, row=1, sticky=tk.W, padx=5, pady=5)
+        self.init_preview_view()
+        self.place_table_view()
+        for table in (self.classic_table, self.virtual_table.table):
+            table.bind('<Shift-Button-1>', self.callback_heading_shift_click)
 
         #  table fonts & style
         style = ttk.Style()
         style.configure("Treeview.Heading", font=consts.Fonts.H2_FONT, text="B")
+        style.configure("Treeview", rowheight=tk_font.nametofont("TkDefaultFont").metrics('linespace') + 4)
         style.configure('.', font=f.LABELS_FONT)
 
+    def init_preview_view(self) -> None:
+        """
+        Initialize the preview mode views: a table is opened with its first rows (or a sample of its rows)
+        and the estimated number of rows, until the whole table is loaded
+        """
+        preview_frame = tk.Frame(self.home_frame, bg=c.WINDOW_BACKGROUND)
+        preview_frame.grid(column=0, row=1)
+        self.is_preview_mode = tk.BooleanVar(value=True)
+        tk.Checkbutton(preview_frame, text="Preview", variable=self.is_preview_mode, bg=c.WINDOW_BACKGROUND,
+                       activebackground=c.WINDOW_BACKGROUND, font=f.H2_FONT,
+                       command=self.callback_preview_mode_toggled).grid(column=0, row=0, padx=5)
+        self.is_sample_preview = tk.BooleanVar(value=False)
+        tk.Checkbutton(preview_frame, text="Random sample", variable=self.is_sample_preview, bg=c.WINDOW_BACKGROUND,
+                       activebackground=c.WINDOW_BACKGROUND, font=f.LABELS_FONT,
+                       command=self.callback_preview_mode_toggled).grid(column=1, row=0, padx=5)
+        self.estimate_str = tk.StringVar()
+        tk.Label(preview_frame, textvar=self.estimate_str, font=f.LABELS_FONT,
+                 bg=c.WINDOW_BACKGROUND).grid(column=2, row=0, padx=5)
+        self.load_all_btn = tk.Button(preview_frame, text="Load all", font=f.BUTTONS_FONT, state=tk.DISABLED,
+                                      bg=c.BUTTON_BACKGROUND, command=self.on_click_load_all)
+        self.load_all_btn.grid(column=3, row=0, padx=5)
+        # Filters and sorts of large tables are run on several cores, see `db.ParallelScanner`. The virtual grid
+        # counts and pages with single LIMIT/OFFSET queries, so the toggle applies to the classic grid.
+        self.is_parallel_scan = tk.BooleanVar(value=True)
+        tk.Checkbutton(preview_frame, text="Parallel scan", variable=self.is_parallel_scan, bg=c.WINDOW_BACKGROUND,
+                       activebackground=c.WINDOW_BACKGROUND, font=f.LABELS_FONT,
+                       command=self.callback_parallel_scan_toggled).grid(column=4, row=0, padx=5)
+
+    def place_table_view(self) -> None:
+        """
+        Shows the table view of the selected grid mode and hides the other one
+        """
+        if self.is_virtual_grid.get():
+            self.classic_table_frame.grid_remove()
+            self.virtual_table.grid(column=0, row=2, sticky=tk.NSEW)
+            self.table = self.virtual_table.table
+        else:
+            self.virtual_table.grid_remove()
+            self.classic_table_frame.grid(column=0, row=2, sticky=tk.NSEW)
+            self.table = self.classic_table
+
     def on_click_remove_filter(self) -> None:
         """
         removes filter from filter list
@@ -221,11 +426,325 @@ class MainView(tk.Frame):
             self.submit_btn['state'] = tk.DISABLED
             self.on_click_submit_filter()
 
+    def on_click_advise_indexes(self) -> None:
+        """
+        Shows the indexes the index advisor recommends and creates them if the user agrees
+        """
+        if self.handler.connection_profile.read_only:
+            self.exception_str.set('The database is opened read-only, indexes can not be created')
+            return
+        recommendations = self.handler.index_advisor.get_recommendations()
+        if len(recommendations) == 0:
+            messagebox.showinfo("Index advisor", "No indexes to recommend yet.", parent=self.window)
+            return
+
+        details = '\n'.join(f'{r.table_name}.{r.column_name}: {r.reason}' for r in recommendations)
+        if messagebox.askyesno("Index advisor", f"Recommended indexes:\n{details}\n\nCreate them now?",
+                               parent=self.window):
+            self.run_in_background(lambda: self.handler.index_advisor.create_indexes(recommendations),
+                                   lambda _: None,
+                                   lambda _: self.progress_str.set(f'Created {len(recommendations)} indexes'))
+
+    def on_click_full_text_index(self) -> None:
+        """
+        Creates (or drops) a full-text index for the text column selected in the filters pane,
+        the index enables the fast 'Matches' operators on the column
+        """
+        if self.handler.connection_profile.read_only:
+            self.exception_str.set('The database is opened read-only, full-text indexes can not be changed')
+            return
+        col_idx = self.filter_columns_combobox.current()
+        if col_idx == -1 or self.cols_data[col_idx].column_type is not db.ColumnType.Text:
+            self.exception_str.set('Select a text column to index in the filters pane')
+            return
+
+        col_data = self.cols_data[col_idx]
+        table_name = col_data.table_name
+        indexed_columns = list(self.handler.full_text.get_indexed_columns(table_name))
+        if col_data.title in indexed_columns:
+            if not messagebox.askyesno("Full-text index", f"Drop the full-text index of {col_data.get_full_name()}?",
+                                       parent=self.window):
+                return
+            indexed_columns.remove(col_data.title)
+        else:
+            indexed_columns.append(col_data.title)
+
+        def update_index():
+            if indexed_columns:
+                self.handler.full_text.create(table_name, indexed_columns)
+            else:
+                self.handler.full_text.drop(table_name)
+            return []
+
+        self.run_in_background(update_index, lambda _: None,
+                               lambda _: self.progress_str.set(f'Full-text index of {table_name}: '
+                                                               f'{", ".join(indexed_columns) or "dropped"}'),
+                               lambda _: f'Indexing {table_name}...')
+
+    def get_available_operators(self, col_data: db.ColumnData) -> Sequence[db.Operator]:
+        """
+        Args:
+            col_data: the column to filter
+
+        returns the operators of the column's filter, the full-text operators only if the column is indexed
+        """
+        operators = db.get_operators(col_data.column_type)
+        if self.handler.full_text.is_indexed(col_data.get_full_name()):
+            return operators
+        return [operator for operator in operators if operator not in db.operators.FULL_TEXT_OPERATORS]
+
+    def on_click_profile(self) -> None:
+        """
+        Opens the profiling panel that shows how long every phase of the recent queries took
+        """
+        if self.profiling_panel is not None and self.profiling_panel.winfo_exists():
+            self.profiling_panel.lift()
+            return
+        self.profiling_panel = ProfilingPanel(self, self.handler.profiler)
+
+    def get_filterable_columns(self) -> Sequence[db.ColumnData]:
+        """
+        The columns the filters apply to, the columns of the rows even if the result is grouped
+        """
+        return self.ungrouped_columns[0] if self.ungrouped_columns is not None else self.cols_data
+
+    def on_click_group(self) -> None:
+        """
+        Opens the grouping panel of the current result
+        """
+        if self.grouping_panel is not None and self.grouping_panel.winfo_exists():
+            self.grouping_panel.lift()
+            return
+        self.grouping_panel = GroupingPanel(self, self.get_filterable_columns(), self.apply_grouping,
+                                            self.clear_grouping)
+
+    def apply_grouping(self, group_by: Sequence[str], aggregates: Sequence[db.Aggregate],
+                       having: Sequence[db.filters.Filter]) -> None:
+        """
+        Args:
+            group_by: the full names of the columns to group by
+            aggregates: the aggregates to compute for every group
+            having: the filters of the groups
+
+        displays the groups of the current result, computed by the database
+        """
+        if self.columnar_result is not None:
+            # The groups are computed from the filters of the database, not from the ones applied in memory.
+            self.leave_analytics_mode()
+            self.handler.filter_last_executed_query(self.filters_applying, self.is_case_sensitive.get())
+        try:
+            group_columns, all_data = self.handler.group_current_result(group_by, aggregates, having)
+        except ValueError as e:
+            self.exception_str.set(e)
+            return
+        if self.ungrouped_columns is None:
+            self.ungrouped_columns = self.cols_data, self.cols_names
+        self.cols_data = group_columns
+        self.cols_names = [col.get_full_name() for col in group_columns]
+        self.display_new_data_in_table(self.cols_names, all_data)
+
+    def clear_grouping(self) -> None:
+        """
+        Displays the rows of the current result again instead of its groups
+        """
+        if self.ungrouped_columns is None:
+            return
+        all_data = self.handler.ungroup_current_result()
+        self.restore_ungrouped_columns()
+        self.display_new_data_in_table(self.cols_names, all_data)
+
+    def restore_ungrouped_columns(self) -> None:
+        """
+        Shows the columns of the rows again, after the handler dropped the grouping of the result
+        """
+        if self.ungrouped_columns is not None:
+            self.cols_data, self.cols_names = self.ungrouped_columns
+            self.ungrouped_columns = None
+
+    def reset_grouping(self) -> None:
+        """
+        Closes the grouping panel when a new result is retrieved, its columns are not the result's columns anymore
+        """
+        self.ungrouped_columns = None
+        if self.grouping_panel is not None and self.grouping_panel.winfo_exists():
+            self.grouping_panel.destroy()
+        self.grouping_panel = None
+
+    def callback_preview_mode_toggled(self) -> None:
+        """
+        Opens the current table again with the new preview settings
+        """
+        if self.current_table is None:
+            return
+        self.view_table(self.current_table)
+        self.filters_applying.clear()
+        self.listbox.delete(0, tk.END)
+
+    def on_click_open_shards(self) -> None:
+        """
+        Opens database files in the workspace, their tables are listed qualified by the name of the file
+        """
+        file_paths = filedialog.askopenfilenames(title="Open shards", parent=self.window,
+                                                 filetypes=[("SQLite database", "*.db *.sqlite *.sqlite3"),
+                                                            ("All files", "*")])
+        for file_path in file_paths:
+            try:
+                self.handler.workspace.add(file_path)
+            except ValueError as e:
+                self.exception_str.set(e)
+                break
+        self.table_names = self.handler.table_names
+        self.table_box['values'] = self.table_names
+
+    def callback_all_shards_toggled(self) -> None:
+        """
+        Opens the current table again, from all the shards that have it or from its own shard alone
+        """
+        if self.current_table is None:
+            return
+        self.view_table(self.current_table)
+        self.filters_applying.clear()
+        self.listbox.delete(0, tk.END)
+
+    def callback_parallel_scan_toggled(self) -> None:
+        """
+        Turns the parallel scan of large tables on or off, for the next filter or sort
+        """
+        self.handler.parallel_scan.enabled = self.is_parallel_scan.get()
+
+    def on_click_load_all(self) -> None:
+        """
+        Replaces the preview by the whole table, with the same filters and sort
+        """
+        self.leave_analytics_mode()
+        all_data = self.handler.promote_preview()
+        # Promoting a grouped preview ungroups it.
+        self.restore_ungrouped_columns()
+        self.display_new_data_in_table(self.cols_names, all_data)
+
+    def update_preview_estimate(self) -> None:
+        """
+        Shows how many rows the whole result is estimated to have while only a preview of it is shown
+        """
+        if not self.handler.is_preview:
+            self.estimate_str.set('')
+            self.load_all_btn['state'] = tk.DISABLED
+            return
+        estimate = self.handler.estimate_current_rows()
+        self.estimate_str.set(f'Preview of {estimate} rows' if estimate is not None else 'Preview')
+        self.load_all_btn['state'] = tk.NORMAL
+
+    def record_render_time(self) -> None:
+        """
+        Reports the time spent inserting the rows of the last query to the handler's profiler
+        """
+        if self.columnar_result is not None:
+            return  # The rows of the analytics mode were not fetched by a query.
+        self.handler.profiler.record_render(self.handler.profiler.last_profile, self.render_seconds)
+
+    def on_click_export(self) -> None:
+        """
+        Exports the current result (including joins and filters) to a file chosen by the user, in the background
+        """
+        formats = export.get_available_formats()
+        file_path = filedialog.asksaveasfilename(parent=self.window, title="Export result", defaultextension='.csv',
+                                                 filetypes=[(fmt.upper(), f'*.{fmt}') for fmt in formats])
+        if not file_path:
+            return
+
+        rows_exported = [0]
+
+        def on_progress(batch):
+            rows_exported[0] = batch[-1]
+
+        result = self.columnar_result
+        if result is not None:
+            rows_source = lambda: export.export_batches(result.stream(), file_path)
+        else:
+            rows_source = lambda: self.handler.export_current_result(file_path)
+        self.run_in_background(rows_source, on_progress,
+                               lambda _: self.progress_str.set(f'Exported {rows_exported[0]} rows to {file_path}'),
+                               describe_progress=lambda _: f'{rows_exported[0]} rows exported',
+                               batch_size=1)
+
+    def on_click_cancel_query(self) -> None:
+        """
+        Cancels the query that is currently running in the background
+        """
+        task = self.current_task
+        if task is not None:
+            self.cancel_running_query()
+            self.progress_str.set(f'Cancelled after {task.rows_fetched} rows')
+
+    def cancel_running_query(self) -> None:
+        """
+        Stops the running background query (if any), its remaining results are discarded
+        """
+        if self.current_task is not None:
+            self.current_task.cancel()
+            self.current_task = None
+        self.cancel_btn['state'] = tk.DISABLED
+
+    def run_in_background(self, rows_source: Callable, on_rows: Callable,
+                          on_done: Callable[[db.QueryTask], None] = None,
+                          describe_progress: Callable[[db.QueryTask], str] = None,
+                          batch_size: int = db.executor.DEFAULT_BATCH_SIZE) -> None:
+        """
+        Args:
+            rows_source: function that executes the query, called on a worker thread
+            on_rows: called on the UI thread with every batch of rows fetched
+            on_done: called on the UI thread with the task when the query finished successfully
+            describe_progress: returns the text of the progress indicator, defaults to the number of rows fetched
+            batch_size: the number of rows in every batch passed to `on_rows`
+
+        runs a query on the executor and streams its rows back to the UI
+        """
+        self.cancel_running_query()
+        self.exception_str.set('')
+        self.current_task = task = self.executor.submit(rows_source, batch_size)
+        self.cancel_btn['state'] = tk.NORMAL
+        self.poll_task(task, on_rows, on_done, describe_progress or (lambda t: f'{t.rows_fetched} rows fetched'))
+
+    def poll_task(self, task: db.QueryTask, on_rows: Callable, on_done: Optional[Callable],
+                  describe_progress: Callable[[db.QueryTask], str]) -> None:
+        """
+        Passes the rows the background task fetched so far to `on_rows` and reschedules itself until the task is done
+        """
+        if task is not self.current_task:
+            # The task was cancelled or replaced by a newer query.
+            return
+        # Check if the task is done before collecting the batches, so no batch is left behind.
+        is_done = task.is_done
+        for batch in task.get_batches(MAX_BATCHES_PER_POLL):
+            on_rows(batch)
+        self.progress_str.set(describe_progress(task))
+
+        if not is_done or task.has_pending_batches:
+            self.after(POLL_INTERVAL_MS, self.poll_task, task, on_rows, on_done, describe_progress)
+            return
+
+        self.current_task = None
+        self.cancel_btn['state'] = tk.DISABLED
+        if task.error is not None:
+            self.exception_str.set(task.error)
+        elif on_done is not None:
+            on_done(task)
+
     def on_click_submit_filter(self) -> None:
         """
         fetch all the data from db (including joins) and apply the filters specified.
         """
+        if self.columnar_result is not None:
+            try:
+                self.columnar_result.filter(self.filters_applying, self.is_case_sensitive.get())
+            except ValueError as e:
+                self.exception_str.set(e)
+                return
+            self.display_new_data_in_table(self.cols_names, iter(self.columnar_result))
+            return
         all_data = self.handler.filter_last_executed_query(self.filters_applying, self.is_case_sensitive.get())
+        # Filtering applies to the rows, so it drops the grouping of the result.
+        self.restore_ungrouped_columns()
         self.display_new_data_in_table(self.cols_names, all_data)
 
     def on_click_add_filter(self) -> None:
@@ -239,8 +758,8 @@ class MainView(tk.Frame):
             self.exception_str.set('Must select a column and an operator!!!')
             return
 
-        flter = db.get_filter(self.cols_data[col_idx])
-        flter.operator = flter.operators[operator]
+        flter = db.get_filter(self.get_filterable_columns()[col_idx])
+        flter.operator = self.available_operators[operator]
         try:
             self.exception_str.set('')
             flter.value = value
@@ -256,6 +775,56 @@ class MainView(tk.Frame):
         except ValueError as e:
             self.exception_str.set(e)
 
+    def callback_virtual_grid_toggled(self) -> None:
+        """
+        Switches between the virtual grid and the classic grid and shows the current result again
+        """
+        self.table.delete(*self.table.get_children())
+        self.table['columns'] = ()
+        self.place_table_view()
+        all_data = iter(self.columnar_result) if self.columnar_result is not None \
+            else self.handler.execute_current_query()
+        self.display_new_data_in_table(self.cols_names, all_data)
+
+    def callback_analytics_mode_toggled(self) -> None:
+        """
+        Loads the current result into memory (or drops it), in the analytics mode the result is filtered and sorted
+        in memory instead of querying the database again
+        """
+        if not self.is_analytics_mode.get():
+            # The database shows the result with the filters and the sort that were applied in memory.
+            sort_keys = self.columnar_result.sort_keys if self.columnar_result is not None else ()
+            self.columnar_result = None
+            self.handler.filter_last_executed_query(self.filters_applying, self.is_case_sensitive.get())
+            self.display_new_data_in_table(self.cols_names, self.handler.sort_current_result(sort_keys))
+            return
+        if not db.ColumnarResult.is_supported():
+            self.is_analytics_mode.set(False)
+            self.exception_str.set('The analytics mode requires NumPy')
+            return
+        if self.ungrouped_columns is not None:
+            # The analytics mode filters and sorts the rows, not the groups.
+            self.handler.ungroup_current_result()
+            self.restore_ungrouped_columns()
+
+        def on_loaded(batch) -> None:
+            result = batch[0][0]
+            # Show the same rows as before, with the filters and the sort of the database.
+            result.filter(self.filters_applying, self.is_case_sensitive.get())
+            result.sort(self.handler.sort_keys)
+            self.columnar_result = result
+            self.display_new_data_in_table(self.cols_names, iter(result))
+
+        self.run_in_background(lambda: ((self.handler.load_columnar_result(),),), on_loaded,
+                               describe_progress=lambda _: 'Loading the result into memory')
+
+    def leave_analytics_mode(self) -> None:
+        """
+        Drops the result that was loaded into memory, when a new result is retrieved from the database
+        """
+        self.columnar_result = None
+        self.is_analytics_mode.set(False)
+
     def callback_listbox_selection(self, event) -> None:
         """
         Marks selected filter (currently only used for removing filters)
@@ -269,8 +838,8 @@ class MainView(tk.Frame):
         Harteteishen litigation
         """
         index = event.widget.current()
-        flter = db.get_filter(self.cols_data[index])
-        self.operator_combobox['values'] = flter.operators
+        self.available_operators = self.get_available_operators(self.get_filterable_columns()[index])
+        self.operator_combobox['values'] = self.available_operators
         self.operator_combobox['state'] = 'readonly'
 
     def callback_operators_combobox(self, _) -> None:
@@ -290,7 +859,7 @@ class MainView(tk.Frame):
         """
         selected_table = event.widget.get()
         self.view_table(selected_table)
-        if len(self.handler.get_related_tables(selected_table)) > 0:
+        if len(self.joinable_tables) > 0:
             self.joinable_table_selected_box.set_state(tk.NORMAL)
         else:
             self.joinable_table_selected_box.set_state(tk.DISABLED)
@@ -305,6 +874,8 @@ class MainView(tk.Frame):
         display joined data main table
         """
         selected_tables = [self.joinable_tables[table_index] for table_index in indices]
+        self.leave_analytics_mode()
+        self.reset_grouping()
         self.cols_data, data = self.handler.join_tables(self.current_table, *selected_tables)
         self.cols_names = [col.get_full_name() for col in self.cols_data]
         self.filter_columns_combobox['values'] = self.cols_names
@@ -312,12 +883,68 @@ class MainView(tk.Frame):
         self.filters_applying.clear()
         self.listbox.delete(0, tk.END)
 
+    def on_click_save_query(self) -> None:
+        """
+        Saves the current tables, filters and sort under a name, optionally materialized so opening it
+        reads the precomputed result
+        """
+        try:
+            spec = self.handler.get_current_query_spec()
+        except ValueError as e:
+            self.exception_str.set(e)
+            return
+        name = simpledialog.askstring("Save query", "Name:", parent=self.window)
+        if not name:
+            return
+        materialize = messagebox.askyesno(
+            "Save query", "Precompute the result? It is refreshed whenever the database changes.", parent=self.window)
+        self.handler.saved_queries.save(db.SavedQuery(name, spec, materialize))
+        self.saved_queries_box['values'] = self.handler.saved_queries.names
+        if materialize:
+            self.run_in_background(lambda: ((self.handler.materialized_views.refresh(name),),),
+                                   lambda batch: self.progress_str.set(f'Saved {name!r} with {batch[0][0]} rows'),
+                                   describe_progress=lambda _: f'Computing {name!r}')
+
+    def callback_saved_query_selected(self, event) -> None:
+        """
+        Args:
+            event: holds the data of the click event that triggered the callback
+
+        displays the result of the selected saved query
+        """
+        name = event.widget.get()
+        self.leave_analytics_mode()
+        self.reset_grouping()
+        try:
+            cols_data, data = self.handler.open_saved_query(name)
+        except ValueError as e:
+            self.exception_str.set(e)
+            return
+        self.cols_data = cols_data
+        self.cols_names = [col.get_full_name() for col in cols_data]
+        spec = self.handler.saved_queries.get(name).spec
+        self.current_table = spec.main_table
+        self.table_box.set(self.current_table)
+        self.display_joinable_tables()
+        self.filter_columns_combobox['values'] = self.cols_names
+        # The filters of a materialized query are part of its result, the others can be changed.
+        self.filters_applying = list(self.handler.current_filters)
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(str(flter) for flter in self.filters_applying))
+        self.list_id = len(self.filters_applying)
+        if self.filters_applying:
+            self.is_case_sensitive.set(spec.case_sensitive)
+        self.display_new_data_in_table(self.cols_names, data)
+
     def display_joinable_tables(self) -> None:
         """
         Ze masbir et azmo..
         """
-        self.joinable_tables = self.handler.get_related_tables(self.current_table)
-        self.joinable_table_selected_box.set_options([t.table_name for t in self.joinable_tables])
+        joinable_tables = self.handler.get_joinable_tables(self.current_table)
+        self.joinable_tables = [table_name for table_name, _ in joinable_tables]
+        # Tables that are not related directly show the tables they are joined through.
+        self.joinable_table_selected_box.set_options(
+            [f'{table_name} (via {", ".join(via)})' if via else table_name for table_name, via in joinable_tables])
         # self.joinable_table_selected_box['values'] = [t.table_name for t in self.joinable_tables]
 
     def view_table(self, table_name: str) -> None:
@@ -331,11 +958,30 @@ class MainView(tk.Frame):
 
         # ___ get current table's data ___
         # get columns
+        self.leave_analytics_mode()
+        self.reset_grouping()
         self.current_table = table_name
-        self.cols_data = self.handler.get_columns_for(table_name)
-        self.cols_names = [col.title for col in self.cols_data]
-        # get data for required columns
-        all_data = self.handler.get_data_from_table(table_name, columns_names=self.cols_names)
+        schema_name, _, shard_table = table_name.partition('.')
+        if self.is_all_shards.get() and schema_name in self.handler.workspace.shards:
+            # The table of a shard is read from all the shards that have it. The classic grid reads the shards in
+            # parallel, the virtual grid counts the rows on every shard in parallel and pages through their UNION ALL.
+            try:
+                self.cols_data, all_data = self.handler.get_data_from_shards(shard_table)
+            except ValueError as e:
+                # The shards do not have the same columns, so only the table's own shard is shown.
+                self.exception_str.set(e)
+                self.is_all_shards.set(False)
+                self.view_table(table_name)
+                return
+            self.cols_names = [col.title for col in self.cols_data]
+        else:
+            self.cols_data = self.handler.get_columns_for(table_name)
+            self.cols_names = [col.title for col in self.cols_data]
+            # get data for required columns
+            preview_rows = PREVIEW_ROWS if self.is_preview_mode.get() else None
+            all_data = self.handler.get_data_from_table(
+                table_name, columns_names=self.cols_names, preview_rows=preview_rows,
+                sample=preview_rows is not None and self.is_sample_preview.get())
 
         self.display_new_data_in_table(self.cols_names, all_data)
 
@@ -356,59 +1002,158 @@ class MainView(tk.Frame):
         self.operator_combobox['state'] = tk.DISABLED
         self.operator_combobox.set('')
         self.filter_columns_combobox.set('')
-        self.last_sort_col = ''
-        # delete all existing data from table_view
-        self.table.delete(*self.table.get_children())
-        self.window.update()
 
         # ___ build view from data retrieved ___
         # set table's columns
+        self.table.delete(*self.table.get_children())
         self.table['columns'] = cols_names
+        self.update_headings()
+        self.update_preview_estimate()
 
-        # ___ Adding the data into the table_view ___
-        for col in cols_names:
-            self.table.heading(col, text=col.title(), command=lambda c=col: self.treeview_sort_column(self.table, c, 0),
-                               anchor=tk.W)
+        self.load_rows(all_data)
 
-        for i, item in enumerate(all_data):
-            self.table.insert('', tk.END, i, values=item)
+    def load_rows(self, all_data, rows_count: int = None) -> None:
+        """
+        Args:
+            all_data: the rows of the current result, only consumed by the classic grid
+            rows_count: the number of rows in the result if it is already known
 
-    def treeview_sort_column(self, table, col, reverse) -> None:
+        replaces the rows in the table with the current result
         """
+        self.table.delete(*self.table.get_children())
+        self.render_seconds = 0.0
+        if not self.is_virtual_grid.get():
+            # ___ Adding the data into the table_view ___
+            def on_done(task: db.QueryTask) -> None:
+                self.progress_str.set(f'{task.rows_fetched} rows')
+                self.record_render_time()
 
+            self.run_in_background(lambda: all_data, self.insert_rows, on_done)
+            return
+
+        # The rows are fetched by the virtual grid on demand, so the given data is not consumed.
+        self.virtual_table.clear()
+        result = self.columnar_result
+        if result is not None:
+            # The loaded result is in memory, so its rows are fetched directly.
+            self.virtual_table.set_data(len(result), result.fetch_rows)
+            self.progress_str.set(f'{len(result)} of {result.total_rows} rows')
+            return
+        if rows_count is None:
+            self.run_in_background(lambda: ((self.handler.count_current_rows(),),),
+                                   lambda batch: self.virtual_table.set_data(batch[0][0],
+                                                                             self.handler.fetch_current_rows),
+                                   lambda _: self.progress_str.set(f'{self.virtual_table.rows_count} rows'))
+            return
+
+        # Only the first window is fetched (in the background), the rest is fetched when scrolled to.
+        first_rows = []
+        visible_rows = self.virtual_table.visible_rows
+        def on_done(_) -> None:
+            start = time.perf_counter()
+            self.virtual_table.set_data(rows_count, self.handler.fetch_current_rows, first_rows)
+            self.render_seconds += time.perf_counter() - start
+            self.record_render_time()
+
+        self.run_in_background(lambda: self.handler.fetch_current_rows(0, visible_rows), first_rows.extend, on_done)
+
+    def insert_rows(self, rows) -> None:
+        """
         Args:
-            table: don't ask me.. we have it in self
-            col: the col we are sorting by
-            reverse: is reversing the order or not
+            rows: batch of rows fetched by the background query
 
-        sort the data in the table according to the col (ascending or descending order)
+        appends the rows to the end of the classic table
+        """
+        start = time.perf_counter()
+        for item in rows:
+            self.table.insert('', tk.END, values=item)
+        self.render_seconds += time.perf_counter() - start
 
+    def update_headings(self) -> None:
         """
-        l = [(table.set(k, col), k) for k in table.get_children('')]
-        try:
-            l.sort(key=lambda t: int(t[0]), reverse=reverse)
-        except ValueError:
-            l.sort(reverse=reverse)
-        for index, (val, k) in enumerate(l):
-            table.move(k, '', index)
+        Sets the titles of the table's headings, the columns the result is sorted by are marked with their direction
+        """
+        sort_keys = self.get_sort_keys()
+        for col, col_data in zip(self.cols_names, self.cols_data):
+            full_name = col_data.get_full_name()
+            text = col.title()
+            for index, (sorted_column, descending) in enumerate(sort_keys):
+                if sorted_column == full_name:
+                    arrow = '▼' if descending else '▲'
+                    # Number the sort keys when sorting by more than one column.
+                    text = f'{text} ({arrow}{index + 1 if len(sort_keys) > 1 else ""})'
+            self.table.heading(col, text=text, anchor=tk.W,
+                               command=lambda c=full_name: self.treeview_sort_column(c, add_key=False))
+
+    def get_sort_keys(self) -> Sequence[Tuple[str, bool]]:
+        """
+        The (column full name, is descending) pairs the current result is sorted by
+        """
+        if self.columnar_result is not None:
+            return self.columnar_result.sort_keys
+        return self.handler.sort_keys
+
+    def callback_heading_shift_click(self, event) -> Optional[str]:
+        """
+        Args:
+            event: holds the data of the click event that triggered the callback
+
+        shift+click on a heading adds the column as another sort key (or reverses it if it is already one)
+        """
+        if event.widget.identify_region(event.x, event.y) != 'heading':
+            return None
+        column_index = int(event.widget.identify_column(event.x).lstrip('#')) - 1
+        self.treeview_sort_column(self.cols_data[column_index].get_full_name(), add_key=True)
+        return 'break'
 
-        if len(self.last_sort_col) > 0 and self.last_sort_col != col:
-            temp = self.last_sort_col
-            table.heading(self.last_sort_col, text=self.last_sort_col,
-                          command=lambda: self.treeview_sort_column(table, temp, False))
+    def treeview_sort_column(self, col: str, add_key: bool) -> None:
+        """
+
+        Args:
+            col: the full name of the col we are sorting by
+            add_key: add the col as another sort key instead of sorting only by it
 
-        arrow = '▼' if reverse else '▲'
-        table.heading(col, text=f'{col.title()} ({arrow})',
-                      command=lambda: self.treeview_sort_column(table, col, not reverse))
-        self.last_sort_col = col
+        sort the data in the table according to the col (ascending or descending order),
+        clicking again on a sorted col reverses its order.
+        The sort is done by the database, so only the rows that are displayed are fetched,
+        or in memory in the analytics mode.
+        """
+        sort_keys = list(self.get_sort_keys())
+        sorted_columns = [name for name, _ in sort_keys]
+        if col in sorted_columns:
+            index = sorted_columns.index(col)
+            sort_key = (col, not sort_keys[index][1])
+        else:
+            index = len(sort_keys)
+            sort_key = (col, False)
+
+        if not add_key:
+            sort_keys = [sort_key]
+        elif index < len(sort_keys):
+            sort_keys[index] = sort_key
+        else:
+            sort_keys.append(sort_key)
+
+        if self.columnar_result is not None:
+            self.columnar_result.sort(sort_keys)
+            self.update_headings()
+            self.load_rows(iter(self.columnar_result))
+            return
+        all_data = self.handler.sort_current_result(sort_keys)
+        self.update_headings()
+        self.load_rows(all_data, self.virtual_table.rows_count if self.is_virtual_grid.get() else None)
 
 
 def main() -> None:
     """
         Runs the program
     """
+    # Slow queries are logged as warnings by the handler's profiler.
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
     main_view = MainView()
     main_view.mainloop()
+    main_view.cancel_running_query()
+    main_view.executor.shutdown()
 
 
 if __name__ == '__main__':
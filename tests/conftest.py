@@ -0,0 +1,20 @@
+import shutil
+
+import pytest
+
+from db import context_manager
+
+
+@pytest.fixture(autouse=True)
+def state_directory(tmp_path, monkeypatch):
+    """ Keeps the files the application writes about the databases out of the home directory """
+    monkeypatch.setattr(context_manager, 'STATE_DIRECTORY', tmp_path / 'state')
+    return tmp_path / 'state'
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    """ A copy of the chinook database the test may change """
+    path = tmp_path / 'chinook.db'
+    shutil.copyfile(context_manager.DATABASE_PATH, path)
+    return path
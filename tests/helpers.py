@@ -0,0 +1,10 @@
+from db.filters import get_filter
+
+
+def create_filter(handler, table_name, column_title, operator_name, value):
+    """ A filter of a column of `table_name` by the names of its column and operator """
+    column = next(column for column in handler.get_columns_for(table_name) if column.title == column_title)
+    table_filter = get_filter(column)
+    table_filter.operator = next(operator for operator in table_filter.operators if operator.name == operator_name)
+    table_filter.value = value
+    return table_filter
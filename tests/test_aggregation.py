@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from db import aggregation
+from db.data_structures import Aggregate
+from db.filters import get_filter
+from db.handler import SqlLiteHandler
+
+_COUNT = Aggregate('count')
+_TOTAL_LENGTH = Aggregate('sum', 'tracks.Milliseconds')
+
+
+@pytest.fixture
+def handler(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    return handler
+
+
+def _query(database_path, query):
+    with sqlite3.connect(database_path) as connection:
+        rows = connection.execute(query).fetchall()
+    connection.close()
+    return rows
+
+
+def _having(handler, aggregate, operator_name, value):
+    columns = {column.get_full_name(): column for column in handler.get_columns_for('tracks')}
+    having_filter = get_filter(aggregation.get_aggregate_column(aggregate, columns))
+    having_filter.operator = next(operator for operator in having_filter.operators if operator.name == operator_name)
+    having_filter.value = value
+    return having_filter
+
+
+def test_groups_are_computed_by_the_database(handler, database_path):
+    columns, rows = handler.group_current_result(['tracks.GenreId'], [_COUNT, _TOTAL_LENGTH])
+
+    assert [column.get_full_name() for column in columns] == ['tracks.GenreId', 'count.*', 'sum.tracks.Milliseconds']
+    assert sorted(rows, key=str) == sorted(_query(database_path, 'SELECT GenreId, COUNT(*), SUM(Milliseconds) '
+                                                                 'FROM tracks GROUP BY GenreId'), key=str)
+    assert handler.is_grouped
+
+
+def test_groups_are_filtered_by_their_aggregates(handler, database_path):
+    having = [_having(handler, _COUNT, 'Greater than', '300')]
+    _, rows = handler.group_current_result(['tracks.GenreId'], [_COUNT], having)
+
+    expected = _query(database_path, 'SELECT GenreId, COUNT(*) FROM tracks GROUP BY GenreId HAVING COUNT(*) > 300')
+    assert sorted(rows) == sorted(expected) and len(expected) > 0
+    assert handler.count_current_rows() == len(expected)
+
+
+def test_grouped_result_is_sorted_by_an_aggregate(handler):
+    list(handler.group_current_result(['tracks.GenreId'], [_COUNT])[1])
+    counts = [count for _, count in handler.sort_current_result([('count.*', True)])]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_ungrouping_restores_the_rows(handler):
+    rows = list(handler.execute_current_query())
+    list(handler.group_current_result([], [_COUNT])[1])
+    assert list(handler.execute_current_query()) == [(len(rows), )]
+
+    assert list(handler.ungroup_current_result()) == rows
+    assert not handler.is_grouped
+
+
+@pytest.mark.parametrize('group_by, aggregates', [
+    ([], []),
+    (['tracks.Unknown'], [_COUNT]),
+    ([], [Aggregate('sum', 'tracks.Name')]),
+    ([], [Aggregate('median', 'tracks.Milliseconds')]),
+    ([], [Aggregate('max')]),
+])
+def test_invalid_grouping_is_rejected(handler, group_by, aggregates):
+    with pytest.raises(ValueError):
+        handler.group_current_result(group_by, aggregates)
+    assert not handler.is_grouped
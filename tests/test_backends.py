@@ -0,0 +1,53 @@
+import pytest
+
+from db.data_structures import FilterSpec, QuerySpec
+from db.engine import QueryEngine
+
+duckdb = pytest.importorskip('duckdb')
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """ A query engine on a DuckDB database with the artists of the chinook database """
+    path = tmp_path / 'artists.duckdb'
+    connection = duckdb.connect(str(path))
+    connection.execute('CREATE TABLE artists (ArtistId INTEGER PRIMARY KEY, Name VARCHAR)')
+    connection.execute("INSERT INTO artists VALUES (1, 'AC/DC'), (2, 'Accept'), (3, 'aerosmith'), (4, 'Audioslave')")
+    connection.close()
+    engine = QueryEngine(f'duckdb:///{path}')
+    yield engine
+    engine.backend.close()
+
+
+def _get_names(engine, filter_spec, case_sensitive=False, sort_keys=()):
+    spec = QuerySpec('artists', filters=(filter_spec,) if filter_spec else (), case_sensitive=case_sensitive,
+                     sort_keys=sort_keys)
+    with engine.run(spec) as cursor:
+        return [row[1] for row in cursor.fetchall()]
+
+
+@pytest.mark.parametrize('operator_name, value, expected', [
+    ('Starts with', 'ac', ['AC/DC', 'Accept']),
+    ('Ends with', 'DC', ['AC/DC']),
+    ('Contains', 'SLAVE', ['Audioslave']),
+    ('Like', 'a_r%', ['aerosmith']),
+    ('Not Like', 'AC%', ['aerosmith', 'Audioslave']),
+    ('Equals', 'ac/dc', ['AC/DC']),
+    ('In', 'accept, AEROSMITH', ['Accept', 'aerosmith']),
+])
+def test_text_filters_are_case_insensitive(engine, operator_name, value, expected):
+    assert _get_names(engine, FilterSpec('artists.Name', operator_name, value)) == expected
+
+
+@pytest.mark.parametrize('operator_name, value, expected', [
+    ('Starts with', 'ac', []),
+    ('Starts with', 'Ac', ['Accept']),
+    ('Equals', 'ac/dc', []),
+])
+def test_text_filters_are_case_sensitive(engine, operator_name, value, expected):
+    assert _get_names(engine, FilterSpec('artists.Name', operator_name, value), case_sensitive=True) == expected
+
+
+def test_text_column_is_sorted_case_insensitively(engine):
+    names = _get_names(engine, None, sort_keys=(('artists.Name', False),))
+    assert names == ['AC/DC', 'Accept', 'aerosmith', 'Audioslave']
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from bench.__main__ import compare, percentile
+from bench.synthetic import generate_database, get_table_sizes
+
+
+def _dump(database_path):
+    with sqlite3.connect(database_path) as connection:
+        dump = list(connection.iterdump())
+    connection.close()
+    return dump
+
+
+def test_synthetic_database_is_scaled_and_consistent(tmp_path):
+    database_path = generate_database(tmp_path / 'bench.db', 1000)
+    with sqlite3.connect(database_path) as connection:
+        counts = {table_name: connection.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                  for table_name in get_table_sizes(1000)}
+        violations = connection.execute('PRAGMA foreign_key_check').fetchall()
+    connection.close()
+
+    assert counts == get_table_sizes(1000)
+    assert violations == []
+
+
+def test_synthetic_database_depends_only_on_its_size_and_seed(tmp_path):
+    first = _dump(generate_database(tmp_path / 'first.db', 200, seed=1))
+    assert _dump(generate_database(tmp_path / 'second.db', 200, seed=1)) == first
+    assert _dump(generate_database(tmp_path / 'other_seed.db', 200, seed=2)) != first
+
+
+@pytest.mark.parametrize('fraction, expected', [(0.5, 3), (0.99, 5), (0, 1)])
+def test_percentile_is_the_nearest_rank(fraction, expected):
+    assert percentile([5, 1, 4, 2, 3], fraction) == expected
+
+
+def test_only_operations_slower_than_the_threshold_are_regressions():
+    baseline = {'databases': {'1000': {'page': {'p50_s': 0.010}, 'sort': {'p50_s': 0.010}}},
+                'imports': {'db': {'p50_s': 0.100}}}
+    results = {'databases': {'1000': {'page': {'p50_s': 0.0115}, 'sort': {'p50_s': 0.013}, 'new': {'p50_s': 1}}},
+               'imports': {'db': {'p50_s': 0.200}}}
+
+    regressions = compare(results, baseline, threshold=0.2)
+    assert [regression.split(':')[0] for regression in regressions] == ['sort on 1000 tracks', 'import db']
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+pytest.importorskip('numpy')
+
+from db.columnar import ColumnarResult  # noqa: E402
+
+
+def _load(database_path, table_name):
+    handler = SqlLiteHandler(database_path)
+    columns = handler.get_columns_for(table_name)
+    with sqlite3.connect(database_path) as connection:
+        rows = connection.execute(f'SELECT * FROM {table_name}').fetchall()
+    connection.close()
+    return ColumnarResult.load(columns, [rows]), [column.title for column in columns]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_date_column_is_sorted_chronologically(database_path, descending):
+    result, titles = _load(database_path, 'invoices')
+    invoice_date = titles.index('InvoiceDate')
+    result.sort([('invoices.InvoiceDate', descending)])
+    invoice_dates = [row[invoice_date] for row in result]
+    assert invoice_dates == sorted(invoice_dates, reverse=descending)
+
+
+def test_text_column_is_sorted_case_insensitively(database_path):
+    result, titles = _load(database_path, 'artists')
+    name = titles.index('Name')
+    result.sort([('artists.Name', False)])
+    names = [row[name] for row in result]
+    assert names == sorted(names, key=lambda value: value.lower())
+
+
+def test_matches_finds_the_texts_that_contain_every_term(database_path):
+    result, titles = _load(database_path, 'artists')
+    name = titles.index('Name')
+    handler = SqlLiteHandler(database_path)
+    result.filter([create_filter(handler, 'artists', 'Name', 'Matches', "guns roses")])
+    assert [row[name] for row in result] == ["Guns N' Roses"]
@@ -0,0 +1,61 @@
+import pytest
+
+from db.context_manager import SqlConnectionPool, SqlLocalDatabaseContextManager
+
+
+def test_context_manager_reuses_the_connection(database_path):
+    with SqlLocalDatabaseContextManager(database_path) as cursor:
+        first = cursor.connection
+    with SqlLocalDatabaseContextManager(database_path) as cursor:
+        assert cursor.connection is first
+
+
+def test_pool_keeps_at_most_pool_size_idle_connections(database_path):
+    pool = SqlConnectionPool(database_path, pool_size=2)
+    connections = [pool.acquire() for _ in range(3)]
+    assert len(set(connections)) == 3
+    for con in connections:
+        pool.release(con)
+
+    assert [pool.acquire() for _ in range(2)] == connections[1::-1]
+    assert pool.acquire() not in connections
+    pool.close()
+
+
+def test_connections_are_configured_by_the_pragmas(database_path):
+    pool = SqlConnectionPool(database_path, pragmas={'cache_size': -2000})
+    con = pool.acquire()
+    assert con.execute('PRAGMA cache_size').fetchone() == (-2000, )
+    pool.release(con)
+    pool.close()
+
+
+def test_released_connection_is_rolled_back(database_path):
+    pool = SqlConnectionPool(database_path)
+    con = pool.acquire()
+    con.execute("INSERT INTO artists (Name) VALUES ('never committed')")
+    pool.release(con)
+
+    con = pool.acquire()
+    assert not con.in_transaction
+    assert con.execute("SELECT COUNT(*) FROM artists WHERE Name = 'never committed'").fetchone() == (0, )
+    pool.release(con)
+    pool.close()
+
+
+def test_broken_idle_connection_is_replaced(database_path):
+    pool = SqlConnectionPool(database_path)
+    con = pool.acquire()
+    pool.release(con)
+    con.close()
+
+    replacement = pool.acquire()
+    assert replacement is not con
+    assert replacement.execute('SELECT COUNT(*) FROM artists').fetchone()[0] > 0
+    pool.release(replacement)
+    pool.close()
+
+
+def test_pool_size_must_be_positive(database_path):
+    with pytest.raises(ValueError):
+        SqlConnectionPool(database_path, pool_size=0)
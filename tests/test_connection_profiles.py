@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from db.context_manager import DEFAULT_PROFILE, READ_ONLY_ANALYTICS_PROFILE, SqlConnectionPool, \
+    SqlLocalDatabaseContextManager
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path):
+    return SqlLiteHandler(database_path, READ_ONLY_ANALYTICS_PROFILE)
+
+
+def test_analytics_profile_can_not_write_the_database(handler, database_path):
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        with SqlLocalDatabaseContextManager(database_path) as cursor:
+            cursor.execute("INSERT INTO artists (Name) VALUES ('not written')")
+
+
+def test_analytics_profile_applies_its_pragmas(handler, database_path):
+    with SqlLocalDatabaseContextManager(database_path) as cursor:
+        assert cursor.execute('PRAGMA busy_timeout').fetchone() == (10000, )
+        assert cursor.execute('PRAGMA temp_store').fetchone() == (2, )  # MEMORY
+
+
+def test_results_are_refined_and_sorted_read_only(handler):
+    list(handler.get_data_from_table('tracks'))
+    composer_filter = create_filter(handler, 'tracks', 'Composer', 'Contains', 'Young')
+    length_filter = create_filter(handler, 'tracks', 'Milliseconds', 'Greater than', '300000')
+    list(handler.filter_last_executed_query([composer_filter]))
+    # The refined result is written to the attached database, which stays writable.
+    rows = list(handler.filter_last_executed_query([composer_filter, length_filter]))
+    lengths = [row[6] for row in handler.sort_current_result([('tracks.Milliseconds', True)])]
+
+    assert len(rows) > 0 and all(row[6] > 300000 for row in rows)
+    assert lengths == sorted(lengths, reverse=True) and len(lengths) == len(rows)
+
+
+def test_readers_are_not_blocked_by_an_open_write_transaction(handler, database_path):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute('PRAGMA journal_mode = WAL')
+    connection.close()
+    artists = len(list(handler.get_data_from_table('artists')))
+
+    writer = sqlite3.connect(database_path, isolation_level=None)
+    try:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("INSERT INTO artists (Name) VALUES ('not committed yet')")
+        assert len(list(handler.get_data_from_table('artists'))) == artists
+        writer.execute('COMMIT')
+    finally:
+        writer.close()
+    assert len(list(handler.get_data_from_table('artists'))) == artists + 1
+
+
+def test_changing_the_profile_reopens_the_connections(database_path):
+    pool = SqlConnectionPool.get_pool(database_path)
+    idle, checked_out = pool.acquire(), pool.acquire()
+    pool.release(idle)
+
+    pool.set_profile(READ_ONLY_ANALYTICS_PROFILE)
+    pool.release(checked_out)
+    con = pool.acquire()
+    assert con is not idle and con is not checked_out
+    with pytest.raises(sqlite3.OperationalError):
+        con.execute("INSERT INTO artists (Name) VALUES ('not written')")
+    pool.release(con)
+    pool.set_profile(DEFAULT_PROFILE)
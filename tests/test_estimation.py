@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from db.estimation import RowEstimator
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path):
+    return SqlLiteHandler(database_path)
+
+
+def _execute(database_path, statement):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(statement)
+    connection.close()
+
+
+def test_preview_reads_the_first_rows_until_it_is_promoted(handler):
+    assert len(list(handler.get_data_from_table('tracks', preview_rows=100))) == 100 and handler.is_preview
+    assert handler.count_current_rows() == 100
+
+    # The filtered preview is the first rows of the filtered table.
+    composer_filter = create_filter(handler, 'tracks', 'Composer', 'Contains', 'Young')
+    filtered = list(handler.filter_last_executed_query([composer_filter]))
+    assert handler.is_preview and 0 < len(filtered) <= 100
+
+    promoted = list(handler.promote_preview())
+    assert not handler.is_preview
+    assert promoted[:len(filtered)] == filtered and all('Young' in row[5] for row in promoted)
+
+
+def test_sample_is_spread_over_the_table_and_repeatable(handler):
+    sample = list(handler.get_data_from_table('tracks', preview_rows=100, sample=True))
+    track_ids = [row[0] for row in sample]
+
+    assert 0 < len(sample) <= 100 and max(track_ids) > 3000
+    assert list(handler.get_data_from_table('tracks', preview_rows=100, sample=True)) == sample
+
+
+def test_estimates_of_the_table_come_from_the_statistics(handler):
+    assert handler.row_estimator.estimate('tracks').rows == 3503
+    list(handler.get_data_from_table('tracks', preview_rows=10))
+    album_filter = create_filter(handler, 'tracks', 'AlbumId', 'Equals', '1')
+    list(handler.filter_last_executed_query([album_filter]))
+
+    # sqlite_stat1 has 11 tracks per album on average.
+    assert (handler.estimate_current_rows().rows, handler.estimate_current_rows().source) == (11, 'stat1')
+
+
+def test_estimates_of_other_filters_come_from_a_sample(database_path):
+    _execute(database_path, 'DROP TABLE sqlite_stat1')
+    estimator = RowEstimator(database_path, sample_size=500)
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    price_filter = create_filter(handler, 'tracks', 'UnitPrice', 'Greater than', '1')
+
+    assert estimator.estimate('tracks').source == 'rowid'
+    estimate = estimator.estimate('tracks', [price_filter])
+    with sqlite3.connect(database_path) as connection:
+        (exact, ), = connection.execute('SELECT COUNT(*) FROM tracks WHERE UnitPrice > 1').fetchall()
+    connection.close()
+    assert estimate.source == 'sample'
+    assert abs(estimate.rows - exact) < 100
+
+
+def test_small_tables_are_counted_exactly(database_path):
+    _execute(database_path, 'DROP TABLE sqlite_stat1')
+    estimator = RowEstimator(database_path)
+    assert estimator.estimate('genres').source == 'exact'
@@ -0,0 +1,53 @@
+from db.context_manager import SqlLocalDatabaseContextManager
+from db.executor import QueryExecutor, QueryTask
+
+# Counts long enough for the progress handler to be called many times.
+_SLOW_QUERY = 'WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers WHERE n < 1000000) ' \
+              'SELECT COUNT(*) FROM numbers'
+
+
+def _count_slowly(database_path, on_progress):
+    """ Runs `_SLOW_QUERY` and calls `on_progress` while it runs """
+    with SqlLocalDatabaseContextManager(database_path) as cursor:
+        cursor.connection.set_progress_handler(on_progress, 10000)
+        try:
+            yield from cursor.execute(_SLOW_QUERY)
+        finally:
+            cursor.connection.set_progress_handler(None, 0)
+
+
+def _select(database_path, query):
+    with SqlLocalDatabaseContextManager(database_path) as cursor:
+        yield from cursor.execute(query)
+
+
+def test_cancel_interrupts_the_query_of_the_task(database_path):
+    task = QueryTask(lambda: _count_slowly(database_path, lambda: task.cancel()))
+    task.run()
+
+    assert task.is_cancelled and task.is_done
+    assert task.error is None and task.rows_fetched == 0
+
+
+def test_cancel_does_not_interrupt_the_query_of_another_task(database_path):
+    # The other task runs on the thread of the cancelled task while it is not done yet,
+    # like the next task of the executor does right after the cancelled task returned its connection.
+    cancelled_task = QueryTask(lambda: other_task.run() or [])
+    other_task = QueryTask(lambda: _count_slowly(database_path, lambda: cancelled_task.cancel()))
+    cancelled_task.run()
+
+    assert cancelled_task.is_cancelled
+    assert other_task.error is None
+    assert other_task.get_batches() == [[(1000000, )]]
+
+
+def test_executor_streams_the_rows_in_batches(database_path):
+    executor = QueryExecutor()
+    try:
+        task = executor.submit(lambda: _select(database_path, 'SELECT TrackId FROM tracks LIMIT 1200'), batch_size=500)
+        assert task.wait(10)
+    finally:
+        executor.shutdown()
+
+    assert [len(batch) for batch in task.get_batches()] == [500, 500, 200]
+    assert task.rows_fetched == 1200 and task.error is None
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from db import export
+
+pyarrow = pytest.importorskip('pyarrow')
+pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+
+
+def _export(tmp_path, batches):
+    file_path = tmp_path / 'result.parquet'
+    list(export.export_batches(iter([['id', 'value'], *batches]), file_path))
+    assert list(tmp_path.iterdir()) == [file_path]
+    return pyarrow_parquet.read_table(file_path)
+
+
+def test_null_batch_is_followed_by_numbers(tmp_path):
+    table = _export(tmp_path, [[(1, None), (2, None)], [(3, 1.5), (4, None)]])
+    assert table.column('value').to_pylist() == [None, None, 1.5, None]
+    assert table.schema.field('value').type == pyarrow.float64()
+
+
+def test_integers_are_promoted_to_floats(tmp_path):
+    table = _export(tmp_path, [[(1, 10)], [(2, 2.5)], [(3, 7)]])
+    assert table.column('value').to_pylist() == [10.0, 2.5, 7.0]
+    assert table.column('id').to_pylist() == [1, 2, 3]
+
+
+def test_mixed_numbers_and_texts_are_written_as_texts(tmp_path):
+    table = _export(tmp_path, [[(1, 5)], [(2, '2009-01-01 00:00:00'), (3, 6)]])
+    assert table.column('value').to_pylist() == ['5', '2009-01-01 00:00:00', '6']
+
+
+def test_pyarrow_is_not_imported_on_startup():
+    # A new interpreter, pyarrow is already imported by the tests of this module.
+    code = 'import sys, db; ' \
+           'print("pyarrow" in sys.modules, db.export.PARQUET_FORMAT in db.export.get_available_formats())'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).parent.parent).stdout
+    assert output.split() == ['False', 'True']
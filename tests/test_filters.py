@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from db import operators, utilities
+from db.data_structures import ColumnType
+from db.filters import get_filter, get_operators
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('artists'))
+    return handler
+
+
+def _get_names(handler, filters):
+    name = [column.title for column in handler.get_columns_for('artists')].index('Name')
+    return [row[name] for row in handler.filter_last_executed_query(filters)]
+
+
+@pytest.mark.parametrize('operator_name, value', [
+    ('Equals', "x' OR '1'='1"),
+    ('Contains', "'; DROP TABLE artists; --"),
+    ('In', "a', 'b"),
+])
+def test_values_are_bound_rather_than_formatted_into_the_query(handler, operator_name, value):
+    name_filter = create_filter(handler, 'artists', 'Name', operator_name, value)
+    query, _ = utilities.add_filters_to_query('SELECT * FROM artists', [name_filter], False)
+
+    assert "'" not in query and '?' in query
+    assert _get_names(handler, [name_filter]) == []
+    assert 'artists' in handler.table_names
+
+
+def test_values_with_quotes_are_found(handler):
+    name_filter = create_filter(handler, 'artists', 'Name', 'Equals', "guns n' roses")
+    assert _get_names(handler, [name_filter]) == ["Guns N' Roses"]
+
+
+def test_numeric_values_are_bound_as_numbers(handler):
+    id_filter = create_filter(handler, 'artists', 'ArtistId', 'Greater than', '270')
+    _, parameters = utilities.add_filters_to_query('SELECT * FROM artists', [id_filter], False)
+
+    assert parameters == [270]
+    with sqlite3.connect(handler.database_file_path) as connection:
+        (expected, ), = connection.execute('SELECT COUNT(*) FROM artists WHERE ArtistId > 270').fetchall()
+    connection.close()
+    assert len(_get_names(handler, [id_filter])) == expected
+
+
+def test_long_in_list_is_bound_as_a_single_json_parameter(handler):
+    names = ['ac/dc', 'AEROSMITH', *(f'unknown {index}' for index in range(operators.BULK_IN_MIN_VALUES))]
+    name_filter = create_filter(handler, 'artists', 'Name', 'In', ', '.join(names))
+    query, parameters = utilities.add_filters_to_query('SELECT * FROM artists', [name_filter], False)
+
+    assert 'json_each' in query and len(parameters) == 1
+    assert sorted(_get_names(handler, [name_filter])) == ['AC/DC', 'Aerosmith']
+
+
+def test_invalid_values_of_an_in_list_are_reported(handler):
+    id_filter = get_filter(next(column for column in handler.get_columns_for('artists') if column.title == 'ArtistId'))
+    id_filter.operator = operators.IN_OPERATOR
+    with pytest.raises(ValueError, match=r"Invalid values \['x0', .*'x9'\] and 5 more!"):
+        id_filter.value = ', '.join(['1', *(f'x{index}' for index in range(15))])
+
+
+def test_operators_are_known_without_creating_a_filter(handler):
+    name_column = next(column for column in handler.get_columns_for('artists') if column.title == 'Name')
+    name_filter = get_filter(name_column)
+
+    assert get_operators(ColumnType.Text) == name_filter.operators
+    assert operators.STARTS_WITH_OPERATOR not in get_operators(ColumnType.Numeric)
+    # Filters keep no per-instance dict, there is one for every filter the user adds.
+    assert not hasattr(name_filter, '__dict__')
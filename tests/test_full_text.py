@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path):
+    """ A handler of a database with a full-text index of the artists' names """
+    with sqlite3.connect(database_path) as connection:
+        connection.executemany('INSERT INTO artists (Name) VALUES (?)',
+                               [('x-y',), ('AND',), ('NOT me',), ('say "hi"',)])
+    connection.close()
+    handler = SqlLiteHandler(database_path)
+    handler.full_text.create('artists', ['Name'])
+    list(handler.get_data_from_table('artists'))
+    return handler
+
+
+@pytest.mark.parametrize('value', ['AC/DC', "Guns N' Roses", 'x-y', 'AND', 'NOT me', '"hi"'])
+def test_matches_looks_up_the_value_as_it_is(handler, database_path, value):
+    name_filter = create_filter(handler, 'artists', 'Name', 'Matches', value)
+    name = [column.title for column in handler.get_columns_for('artists')].index('Name')
+    names = [row[name] for row in handler.filter_last_executed_query([name_filter])]
+
+    # The trigram index finds the names that contain every term, case insensitively.
+    with sqlite3.connect(database_path) as connection:
+        expected = [name for name, in connection.execute('SELECT Name FROM artists').fetchall()
+                    if all(term.lower() in name.lower() for term in value.split())]
+    connection.close()
+    assert len(names) > 0 and sorted(names) == sorted(expected)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('guns', ["Guns N' Roses"]),
+    ('Roses', []),
+    ('x-y', ['x-y']),
+])
+def test_matches_prefix_matches_the_start_of_the_whole_value(handler, value, expected):
+    # The trigram index has no words, so a value that starts a later word of the name does not match it.
+    name_filter = create_filter(handler, 'artists', 'Name', 'Matches prefix', value)
+    name = [column.title for column in handler.get_columns_for('artists')].index('Name')
+    assert [row[name] for row in handler.filter_last_executed_query([name_filter])] == expected
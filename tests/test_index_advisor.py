@@ -0,0 +1,37 @@
+from db import index_advisor
+from db.handler import SqlLiteHandler
+from db.index_advisor import IndexAdvisor
+from db.schema import SchemaCatalog
+from tests.helpers import create_filter
+
+
+def test_statistics_are_saved_in_batches(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    composer_filter = create_filter(handler, 'tracks', 'Composer', 'Equals', 'AC/DC')
+    advisor = handler.index_advisor
+    statistics_path = advisor._statistics_path
+
+    for _ in range(index_advisor._SAVE_INTERVAL - 1):
+        advisor.record_filters([composer_filter])
+    assert not statistics_path.exists()
+
+    advisor.record_filters([composer_filter])
+    assert statistics_path.exists()
+    advisor.record_filters([composer_filter])
+    advisor.save()
+    reloaded = IndexAdvisor(SchemaCatalog(database_path), database_path)
+    assert reloaded._uses == {'tracks.Composer': {'filter': index_advisor._SAVE_INTERVAL + 1}}
+
+
+def test_columns_of_scanned_tables_are_recommended_first(database_path):
+    advisor = IndexAdvisor(SchemaCatalog(database_path), database_path)
+    for _ in range(3):
+        advisor._record(['tracks.Composer'], 'filter')
+    for index in range(2):
+        advisor._record(['customers.Company'], 'filter')
+        advisor.record_query('SELECT * FROM customers WHERE Company = ?', (f'company {index}', ))
+
+    recommendations = advisor.get_recommendations()
+    assert [(r.table_name, r.column_name, r.scans) for r in recommendations] == \
+        [('customers', 'Company', 2), ('tracks', 'Composer', 0)]
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from db import utilities
+from db.handler import SqlLiteHandler
+from db.join_planner import build_plan_query
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path):
+    # A track without an album, it is only kept by a LEFT join of the albums.
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO tracks (Name, MediaTypeId, Milliseconds, UnitPrice) "
+                           "VALUES ('single', 1, 1000, 0.99)")
+    connection.close()
+    return SqlLiteHandler(database_path)
+
+
+def _get_join_types(plan):
+    return {step.table_name: 'LEFT' if step.is_left else 'INNER' for step in plan.steps}
+
+
+def test_join_on_a_not_null_foreign_key_is_inner(handler):
+    plan = handler.join_planner.plan('tracks', ['media_types'])
+    assert _get_join_types(plan) == {'media_types': 'INNER'}
+
+
+def test_join_on_a_nullable_foreign_key_is_left(handler):
+    plan = handler.join_planner.plan('tracks', ['albums'])
+    assert _get_join_types(plan) == {'albums': 'LEFT'}
+
+
+def test_join_of_referencing_table_is_left(handler):
+    plan = handler.join_planner.plan('artists', ['albums'])
+    assert _get_join_types(plan) == {'albums': 'LEFT'}
+
+
+def test_tables_joined_through_a_left_join_are_left_joined(handler):
+    # albums.ArtistId is not null, but the albums of the tracks may be missing.
+    plan = handler.join_planner.plan('tracks', ['artists'])
+    assert _get_join_types(plan) == {'albums': 'LEFT', 'artists': 'LEFT'}
+    assert plan.table_names == ('albums', 'artists')
+
+
+def test_filter_that_rejects_nulls_makes_the_joins_on_its_path_inner(handler):
+    name_filter = create_filter(handler, 'artists', 'Name', 'Equals', 'AC/DC')
+    plan = handler.join_planner.plan('tracks', ['artists'], [name_filter])
+    assert _get_join_types(plan) == {'albums': 'INNER', 'artists': 'INNER'}
+
+    none_filter = create_filter(handler, 'artists', 'Name', 'Is None', '')
+    plan = handler.join_planner.plan('tracks', ['artists'], [none_filter])
+    assert _get_join_types(plan) == {'albums': 'LEFT', 'artists': 'LEFT'}
+
+
+def test_left_join_keeps_every_row_of_the_main_table(handler):
+    plan = handler.join_planner.plan('tracks', ['albums'])
+    _, (query, parameters) = build_plan_query(plan, handler.get_columns_for)
+    rows = list(utilities.execute_query(query, parameters, handler.database_file_path))
+
+    with sqlite3.connect(handler.database_file_path) as connection:
+        (count, ), = connection.execute('SELECT COUNT(*) FROM tracks').fetchall()
+    connection.close()
+    assert len(rows) == count
+
+
+def test_unrelated_table_can_not_be_joined(handler):
+    with sqlite3.connect(handler.database_file_path) as connection:
+        connection.execute('CREATE TABLE notes (NoteId INTEGER PRIMARY KEY, Text TEXT)')
+    connection.close()
+    handler.catalog.validate()
+
+    with pytest.raises(ValueError):
+        handler.join_planner.plan('tracks', ['notes'])
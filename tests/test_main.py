@@ -0,0 +1,36 @@
+import pytest
+
+from db.__main__ import main
+
+
+@pytest.mark.parametrize('file_name, content', [
+    ('spec.yaml', 'main_table: [tracks\n'),
+    ('spec.yaml', 'main_table: tracks\n  related_tables: albums\n'),
+    ('spec.json', '{"main_table": '),
+    ('spec.json', '{"related_tables": []}'),
+])
+def test_invalid_spec_is_reported(tmp_path, capsys, file_name, content):
+    if file_name.endswith('.yaml'):
+        pytest.importorskip('yaml')
+    spec_path = tmp_path / file_name
+    spec_path.write_text(content, encoding='utf-8')
+    assert main([str(spec_path)]) == 2
+    assert 'error: invalid spec' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('content, message', [
+    ('{"main_table": "nope"}', "Unknown table 'nope'"),
+    ('{"main_table": "tracks", "filters": [{"column": "tracks.Nope", "operator": "Equals", "value": "x"}]}',
+     "unknown column 'tracks.Nope'"),
+])
+@pytest.mark.parametrize('output', [None, 'out/{database}.csv'])
+def test_spec_that_does_not_match_the_database_is_reported(tmp_path, capsys, database_path, content, message,
+                                                           output):
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(content, encoding='utf-8')
+    arguments = [str(spec_path), '--database', str(database_path)]
+    if output:
+        arguments += ['--output', str(tmp_path / output)]
+    assert main(arguments) == 2
+    captured = capsys.readouterr()
+    assert 'error: ' in captured.err and message in captured.err and captured.out == ''
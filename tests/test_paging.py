@@ -0,0 +1,30 @@
+import pytest
+
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+def _get_pages(handler, page_size):
+    return [row for offset in range(0, handler.count_current_rows(), page_size)
+            for row in handler.fetch_current_rows(offset, page_size)]
+
+
+@pytest.mark.parametrize('page_size', [1, 7, 100, 10000])
+def test_pages_of_the_current_query_are_its_rows(database_path, page_size):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('albums'))
+    rows = list(handler.filter_last_executed_query([create_filter(handler, 'albums', 'Title', 'Contains', 'the')]))
+
+    assert handler.count_current_rows() == len(rows) > 0
+    assert _get_pages(handler, page_size) == rows
+    assert list(handler.execute_current_query()) == rows
+
+
+def test_pages_follow_the_sort_order(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('albums'))
+    rows = list(handler.sort_current_result([('albums.Title', True)]))
+
+    assert _get_pages(handler, 50) == rows
+    assert handler.fetch_current_rows(len(rows) - 1, 50) == rows[-1:]
+    assert handler.fetch_current_rows(len(rows), 50) == []
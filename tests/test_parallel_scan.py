@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from db import utilities
+from db.handler import SqlLiteHandler
+from db.parallel_scan import ParallelScanner
+from db.schema import SchemaCatalog
+from tests.helpers import create_filter
+
+
+@pytest.mark.parametrize('sort_keys', [
+    [('invoices.InvoiceDate', True)],
+    [('invoices.BillingCountry', False), ('invoices.InvoiceDate', False)],
+    [('invoices.Total', True), ('invoices.InvoiceId', False)],
+])
+def test_sorted_ranges_are_merged_like_a_single_query(database_path, sort_keys):
+    columns = {column.get_full_name(): column for column in SchemaCatalog(database_path).get_columns('invoices')}
+    scanner = ParallelScanner(database_path, workers=4, min_rows=0)
+    ranges = scanner.get_rowid_ranges('invoices')
+    assert len(ranges) == 4
+
+    rows = list(scanner.scan('invoices', columns, sort_keys=sort_keys, ranges=ranges))
+
+    query = f'SELECT * FROM (SELECT {utilities.select_columns(columns)} FROM invoices) ' \
+            f'{utilities.build_order_by(sort_keys, columns)}'
+    with sqlite3.connect(database_path) as connection:
+        expected = connection.execute(query).fetchall()
+    connection.close()
+    sort_indices = [list(columns).index(column_name) for column_name, _ in sort_keys]
+    assert [[row[index] for index in sort_indices] for row in rows] == \
+        [[row[index] for index in sort_indices] for row in expected]
+
+
+@pytest.mark.parametrize('sort_keys', [[], [('tracks.Name', False), ('tracks.TrackId', False)]])
+def test_virtual_grid_pages_with_a_single_query(database_path, monkeypatch, sort_keys):
+    handler = SqlLiteHandler(database_path)
+    handler.parallel_scan = ParallelScanner(database_path, workers=4, min_rows=0)
+    list(handler.get_data_from_table('tracks'))
+    list(handler.filter_last_executed_query([create_filter(handler, 'tracks', 'Name', 'Contains', 'love')]))
+    if sort_keys:
+        list(handler.sort_current_result(sort_keys))
+    with sqlite3.connect(database_path) as connection:
+        expected = connection.execute(handler.current_query, handler.current_parameters).fetchall()
+    connection.close()
+
+    # A page is read with LIMIT and OFFSET, rather than by scanning the whole table again.
+    def scan(*_, **__):
+        raise AssertionError('A page was read from the parallel scan')
+
+    monkeypatch.setattr(handler.parallel_scan, 'scan', scan)
+    assert handler.count_current_rows() == len(expected)
+    window = handler.fetch_current_rows(10, 20)
+    assert [row[0] for row in window] == [row[0] for row in expected[10:30]]
+
+
+@pytest.mark.parametrize('sort_keys', [[], [('tracks.Name', True), ('tracks.TrackId', False)]])
+def test_limit_is_applied_to_every_range(database_path, sort_keys):
+    columns = {column.get_full_name(): column for column in SchemaCatalog(database_path).get_columns('tracks')}
+    scanner = ParallelScanner(database_path, workers=4, min_rows=0)
+    ranges = scanner.get_rowid_ranges('tracks')
+    expected = list(scanner.scan('tracks', columns, sort_keys=sort_keys, ranges=ranges))[:25]
+
+    queries, connections = [], []
+    pool = scanner._get_pool()
+    acquire = pool.acquire
+
+    def acquire_traced():
+        connection = acquire()
+        connection.set_trace_callback(queries.append)
+        connections.append(connection)
+        return connection
+
+    pool.acquire = acquire_traced
+    try:
+        assert list(scanner.scan('tracks', columns, sort_keys=sort_keys, ranges=ranges, limit=25)) == expected
+    finally:
+        del pool.acquire
+        for connection in connections:
+            connection.set_trace_callback(None)
+    # The ranges that were read before the limit was reached selected at most the limit themselves.
+    range_queries = [query for query in queries if 'rowid BETWEEN' in query]
+    assert len(range_queries) > 0 and all(query.rstrip().endswith('LIMIT 25') for query in range_queries)
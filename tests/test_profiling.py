@@ -0,0 +1,63 @@
+import json
+import logging
+
+from db.handler import SqlLiteHandler
+from db.profiling import JsonLinesSink, QueryProfiler
+
+
+def _profile(profiler, database_path, query, parameters=()):
+    profile = profiler.start(query, parameters, 'test')
+    rows = list(profiler.profile_rows(profile, profiler.execute([(query, parameters)], profile, database_path)))
+    return profile, rows
+
+
+def test_profile_measures_the_phases_rows_and_plan(database_path):
+    profiler = QueryProfiler()
+    profile, rows = _profile(profiler, database_path, 'SELECT * FROM tracks WHERE Composer LIKE ?', ('%Young%', ))
+
+    assert profile.rows == len(rows) > 0
+    assert {'connect', 'execute'} <= set(profile.spans)
+    assert profile.vm_steps > 0
+    assert any('tracks' in detail for detail in profile.query_plan)
+    assert profiler.last_profile is profile
+
+
+def test_finished_profiles_are_written_to_the_sinks(database_path, tmp_path):
+    profiler = QueryProfiler()
+    sink_path = tmp_path / 'profiles.jsonl'
+    profiler.add_sink(JsonLinesSink(sink_path))
+    profile, _ = _profile(profiler, database_path, 'SELECT Name FROM artists')
+    profiler.record_render(profile, 0.25)
+
+    query_record, render_record = [json.loads(line) for line in sink_path.read_text().splitlines()]
+    assert query_record['event'] == 'query' and query_record['id'] == profile.id
+    assert query_record['rows'] == profile.rows
+    assert render_record == {'event': 'render', 'id': profile.id, 'render_s': 0.25}
+
+
+def test_failing_sink_does_not_fail_the_query(database_path):
+    profiler = QueryProfiler()
+
+    def fail(_):
+        raise OSError('disk full')
+    profiler.add_sink(fail)
+    _, rows = _profile(profiler, database_path, 'SELECT Name FROM artists')
+    assert len(rows) > 0
+
+
+def test_slow_queries_are_logged_with_their_plan(database_path, caplog):
+    profiler = QueryProfiler(slow_query_threshold=0)
+    with caplog.at_level(logging.WARNING, logger='db.profiling'):
+        _profile(profiler, database_path, 'SELECT Name FROM artists')
+    assert 'Slow test query' in caplog.text and 'SCAN' in caplog.text
+
+
+def test_disabled_profiler_records_nothing(database_path):
+    handler = SqlLiteHandler(database_path)
+    handler.profiler.enabled = False
+    list(handler.get_data_from_table('artists'))
+    assert handler.profiler.recent_profiles == []
+
+    handler.profiler.enabled = True
+    list(handler.get_data_from_table('albums'))
+    assert len(handler.profiler.recent_profiles) > 0
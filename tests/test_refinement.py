@@ -0,0 +1,84 @@
+import sqlite3
+
+from db import utilities
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+def _count(database_path, condition):
+    with sqlite3.connect(database_path) as connection:
+        (count, ), = connection.execute(f'SELECT COUNT(*) FROM tracks WHERE {condition}').fetchall()
+    connection.close()
+    return count
+
+
+def test_refined_result_is_computed_again_after_the_database_changed(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    name_filter = create_filter(handler, 'tracks', 'Name', 'Contains', 'love')
+    length_filter = create_filter(handler, 'tracks', 'Milliseconds', 'Greater than', '900000')
+    loved = _count(database_path, "Name LIKE '%love%'")
+    assert len(list(handler.filter_last_executed_query([name_filter]))) == loved
+
+    # Another process writes to the database.
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO tracks (Name, MediaTypeId, Milliseconds, UnitPrice) "
+                           "VALUES ('love song X', 1, 1000000, 0.99)")
+    connection.close()
+
+    assert len(list(handler.filter_last_executed_query([name_filter]))) == loved + 1
+    assert len(list(handler.filter_last_executed_query([name_filter, length_filter]))) == \
+        _count(database_path, "Name LIKE '%love%' AND Milliseconds > 900000")
+
+
+
+def _get_result_tables(handler):
+    path = handler._refinement._path
+    with sqlite3.connect(path) as connection:
+        tables = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    connection.close()
+    return tables
+
+
+def test_replaced_results_are_dropped_right_away(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    name_filter = create_filter(handler, 'tracks', 'Name', 'Contains', 'love')
+    length_filter = create_filter(handler, 'tracks', 'Milliseconds', 'Greater than', '300000')
+    list(handler.filter_last_executed_query([name_filter]))
+    first_tables = _get_result_tables(handler)
+    assert len(first_tables) == 1
+
+    # The refined result replaces the result it was computed from.
+    list(handler.filter_last_executed_query([name_filter, length_filter]))
+    tables = _get_result_tables(handler)
+    assert len(tables) == 1 and tables != first_tables
+
+    list(handler.get_data_from_table('albums'))
+    assert _get_result_tables(handler) == []
+
+
+def test_export_reads_the_tables_rather_than_the_refined_result(database_path, monkeypatch):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    name_filter = create_filter(handler, 'tracks', 'Name', 'Contains', 'love')
+    list(handler.filter_last_executed_query([name_filter]))
+    list(handler.sort_current_result([('tracks.Milliseconds', True)]))
+    assert 'refine.' in handler.current_query
+
+    queries = []
+    execute_query_in_batches = utilities.execute_query_in_batches
+
+    def execute_traced(query, *args, **kwargs):
+        queries.append(query)
+        return execute_query_in_batches(query, *args, **kwargs)
+
+    monkeypatch.setattr(utilities, 'execute_query_in_batches', execute_traced)
+    result = handler.stream_current_result(batch_size=10)
+    # The refined result may be replaced while the export runs.
+    list(handler.get_data_from_table('albums'))
+    next(result)
+    rows = [row for batch in result for row in batch]
+    assert len(queries) == 1 and 'refine.' not in queries[0]
+    assert len(rows) == _count(database_path, "Name LIKE '%love%'")
+    assert [row[6] for row in rows] == sorted((row[6] for row in rows), reverse=True)
@@ -0,0 +1,63 @@
+import sqlite3
+
+from db.result_cache import ResultCache
+
+
+def _select(database_path, query):
+    def execute():
+        with sqlite3.connect(database_path) as connection:
+            rows = connection.execute(query).fetchall()
+        connection.close()
+        return rows
+    return execute
+
+
+def test_results_are_cached_by_the_normalized_query(database_path):
+    cache = ResultCache(database_path)
+    query = 'SELECT Name FROM artists WHERE ArtistId < 5'
+    rows = list(cache.execute(query, (), _select(database_path, query)))
+
+    def fail():
+        raise AssertionError('The cached result should be used')
+    assert list(cache.execute(' SELECT Name\n FROM artists  WHERE ArtistId < 5', (), fail)) == rows
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Other parameters are another result.
+    list(cache.execute(query, (1, ), _select(database_path, query)))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_is_invalidated_when_another_connection_commits(database_path):
+    cache = ResultCache(database_path)
+    query = 'SELECT COUNT(*) FROM artists'
+    (count, ), = cache.execute(query, (), _select(database_path, query))
+
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO artists (Name) VALUES ('new artist')")
+    connection.close()
+
+    assert list(cache.execute(query, (), _select(database_path, query))) == [(count + 1, )]
+    assert cache.hits == 0
+
+
+def test_least_recently_used_results_are_evicted_first(database_path):
+    cache = ResultCache(database_path, memory_budget=2000, max_entry_size=1000)
+    queries = [f'SELECT Name FROM artists WHERE ArtistId = {artist_id}' for artist_id in range(1, 20)]
+    for query in queries:
+        list(cache.execute(query, (), _select(database_path, query)))
+
+    statistics = cache.statistics
+    assert 0 < statistics['entries'] < len(queries) and statistics['bytes'] <= 2000
+    list(cache.execute(queries[-1], (), _select(database_path, queries[-1])))
+    assert cache.hits == 1
+    list(cache.execute(queries[0], (), _select(database_path, queries[0])))
+    assert cache.hits == 1
+
+
+def test_results_larger_than_an_entry_are_streamed_without_being_cached(database_path):
+    cache = ResultCache(database_path, max_entry_size=1000)
+    query = 'SELECT * FROM tracks'
+    rows = list(cache.execute(query, (), _select(database_path, query)))
+
+    assert len(rows) > 100
+    assert cache.statistics['entries'] == 0
@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from db.data_structures import FilterSpec, QuerySpec, SavedQuery
+from db.handler import SqlLiteHandler
+from db.saved_queries import SavedQueryStore
+
+_ROCK_TRACKS = QuerySpec('tracks', ('genres',), (FilterSpec('genres.Name', 'Equals', 'rock'),),
+                         sort_keys=(('tracks.TrackId', False),))
+
+
+@pytest.fixture
+def handler(database_path):
+    handler = SqlLiteHandler(database_path)
+    handler.saved_queries.save(SavedQuery('rock', _ROCK_TRACKS, materialize=True))
+    return handler
+
+
+def _add_rock_track(database_path):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO tracks (Name, MediaTypeId, GenreId, Milliseconds, UnitPrice) "
+                           "VALUES ('new rock song', 1, 1, 1000, 0.99)")
+    connection.close()
+
+
+def test_saved_queries_are_kept_between_sessions(handler, database_path):
+    saved_query, = SavedQueryStore(database_path).saved_queries
+    assert (saved_query.name, saved_query.materialize) == ('rock', True)
+    assert saved_query.spec.filters[0].value == 'rock'
+
+
+def test_materialized_result_is_the_result_of_the_query(handler):
+    handler.saved_queries.save(SavedQuery('rock (live)', _ROCK_TRACKS))
+    _, live_rows = handler.open_saved_query('rock (live)')
+    live_rows = list(live_rows)
+
+    assert handler.materialized_views.refresh('rock') == len(live_rows) > 0
+    _, rows = handler.open_saved_query('rock')
+    assert list(rows) == live_rows
+    assert handler.last_data_retrieve_query.startswith('SELECT * FROM saved.')
+
+
+def test_results_are_refreshed_when_the_database_changes(handler, database_path):
+    views = handler.materialized_views
+    assert views.refresh_stale() == ['rock']
+    assert views.refresh_stale() == []
+    rows = len(list(handler.open_saved_query('rock')[1]))
+
+    _add_rock_track(database_path)
+    assert views.refresh_stale() == ['rock']
+    assert len(list(handler.open_saved_query('rock')[1])) == rows + 1
+
+
+def test_result_of_a_changed_query_is_not_used(handler):
+    views = handler.materialized_views
+    views.refresh('rock')
+    handler.saved_queries.save(SavedQuery('rock', QuerySpec('tracks'), materialize=True))
+
+    assert views.get_table('rock') is None
+    assert views.refresh_stale() == ['rock']
+    assert views.get_table('rock') is not None
+
+
+def test_results_are_refreshed_by_their_interval(handler):
+    handler.saved_queries.save(SavedQuery('rock', _ROCK_TRACKS, materialize=True, refresh_interval=0))
+    views = handler.materialized_views
+    views.refresh_stale()
+    refreshed_at = views.get_refreshed_at('rock')
+
+    assert views.refresh_stale() == ['rock']
+    assert views.get_refreshed_at('rock') >= refreshed_at
+
+
+def test_dropped_result_is_computed_live(handler):
+    views = handler.materialized_views
+    views.refresh('rock')
+    views.drop('rock')
+
+    assert views.get_table('rock') is None
+    list(handler.open_saved_query('rock')[1])
+    assert 'saved.' not in handler.last_data_retrieve_query
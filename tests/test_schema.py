@@ -0,0 +1,91 @@
+import sqlite3
+
+from db.schema import SchemaCatalog
+
+
+def _execute(database_path, statement):
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(statement)
+    connection.close()
+
+
+def test_catalog_describes_the_tables_and_their_references(database_path):
+    catalog = SchemaCatalog(database_path)
+    assert {'albums', 'artists', 'tracks'} <= set(catalog.table_names)
+    assert [column.title for column in catalog.get_columns('artists')] == ['ArtistId', 'Name']
+    assert [(related.table_name, related.from_column, related.to_column)
+            for related in catalog.get_foreign_keys('albums')] == [('artists', 'ArtistId', 'ArtistId')]
+    assert ('albums', 'ArtistId', 'ArtistId') in [(related.table_name, related.from_column, related.to_column)
+                                                 for related in catalog.get_referencing_tables('artists')]
+
+
+def test_catalog_is_reloaded_only_after_the_schema_changed(database_path):
+    catalog = SchemaCatalog(database_path)
+    catalog.get_columns('artists')
+    assert not catalog.validate()
+
+    _execute(database_path, 'ALTER TABLE artists ADD COLUMN Country TEXT')
+    _execute(database_path, 'CREATE TABLE labels (LabelId INTEGER PRIMARY KEY, Name TEXT)')
+    assert catalog.validate()
+    assert [column.title for column in catalog.get_columns('artists')] == ['ArtistId', 'Name', 'Country']
+    assert 'labels' in catalog.table_names
+    assert not catalog.validate()
+
+
+def test_invalidated_catalog_is_reloaded_on_the_next_lookup(database_path):
+    catalog = SchemaCatalog(database_path)
+    schema_version = catalog.schema_version
+    catalog.get_columns('artists')
+
+    # The schema version is only read by `validate`, a lookup is served from memory until the catalog is dropped.
+    _execute(database_path, 'CREATE TABLE labels (LabelId INTEGER PRIMARY KEY, Name TEXT)')
+    assert 'labels' not in catalog.table_names
+    catalog.invalidate()
+    assert 'labels' in catalog.table_names
+    assert catalog.schema_version != schema_version
+
+
+def _describe(columns):
+    return [(column.table_name, column.column_type, column.title, column.is_primary, column.is_nullable)
+            for column in columns]
+
+
+def _fail(*_):
+    raise AssertionError('The schema should not be introspected')
+
+
+def test_tables_are_loaded_only_once_they_are_used(database_path, monkeypatch):
+    catalog = SchemaCatalog(database_path)
+    monkeypatch.setattr(catalog.backend, 'load_schema', _fail)
+
+    assert 'tracks' in catalog.table_names
+    assert [column.title for column in catalog.get_columns('artists')] == ['ArtistId', 'Name']
+
+
+def test_snapshot_is_used_until_the_tables_change(database_path, tmp_path, monkeypatch):
+    snapshot_path = tmp_path / 'schema.json'
+    catalog = SchemaCatalog(database_path, snapshot_path)
+    catalog.get_referencing_tables('artists')
+    assert snapshot_path.exists()
+
+    snapshot_catalog = SchemaCatalog(database_path, snapshot_path)
+    monkeypatch.setattr(snapshot_catalog.backend, 'load_table', _fail)
+    monkeypatch.setattr(snapshot_catalog.backend, 'load_schema', _fail)
+    assert _describe(snapshot_catalog.get_columns('artists')) == _describe(catalog.get_columns('artists'))
+    monkeypatch.undo()
+
+    _execute(database_path, 'ALTER TABLE artists ADD COLUMN Country TEXT')
+    changed_catalog = SchemaCatalog(database_path, snapshot_path)
+    assert [column.title for column in changed_catalog.get_columns('artists')] == ['ArtistId', 'Name', 'Country']
+    changed_catalog.get_referencing_tables('artists')
+
+    _execute(database_path, 'CREATE TABLE labels (LabelId INTEGER PRIMARY KEY, Name TEXT)')
+    assert 'labels' in SchemaCatalog(database_path, snapshot_path).table_names
+
+
+def test_invalid_snapshot_is_ignored(database_path, tmp_path):
+    snapshot_path = tmp_path / 'schema.json'
+    snapshot_path.write_text('{"schema_version": ')
+
+    catalog = SchemaCatalog(database_path, snapshot_path)
+    assert [column.title for column in catalog.get_columns('artists')] == ['ArtistId', 'Name']
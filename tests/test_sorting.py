@@ -0,0 +1,40 @@
+import sqlite3
+
+from db.handler import SqlLiteHandler
+
+
+def _get_values(database_path, query):
+    with sqlite3.connect(database_path) as connection:
+        values = [value for value, in connection.execute(query).fetchall()]
+    connection.close()
+    return values
+
+
+def _get_index(handler, table_name, column_title):
+    return [column.title for column in handler.get_columns_for(table_name)].index(column_title)
+
+
+def test_date_column_is_sorted_chronologically(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('employees'))
+    birth_date = _get_index(handler, 'employees', 'BirthDate')
+    birth_dates = [row[birth_date] for row in handler.sort_current_result([('employees.BirthDate', False)])]
+    assert birth_dates == sorted(_get_values(database_path, 'SELECT BirthDate FROM employees'))
+    # Dates of the same year are ordered by their month and day as well.
+    assert birth_dates.index('1973-07-01 00:00:00') < birth_dates.index('1973-08-29 00:00:00')
+
+
+def test_date_column_is_sorted_chronologically_descending(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('invoices'))
+    invoice_date = _get_index(handler, 'invoices', 'InvoiceDate')
+    invoice_dates = [row[invoice_date] for row in handler.sort_current_result([('invoices.InvoiceDate', True)])]
+    assert invoice_dates == sorted(_get_values(database_path, 'SELECT InvoiceDate FROM invoices'), reverse=True)
+
+
+def test_numeric_column_is_sorted_by_number(database_path):
+    handler = SqlLiteHandler(database_path)
+    list(handler.get_data_from_table('tracks'))
+    milliseconds = _get_index(handler, 'tracks', 'Milliseconds')
+    lengths = [row[milliseconds] for row in handler.sort_current_result([('tracks.Milliseconds', False)])]
+    assert lengths == sorted(lengths) and isinstance(lengths[0], int)
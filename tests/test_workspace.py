@@ -0,0 +1,47 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from db.handler import SqlLiteHandler
+from tests.helpers import create_filter
+
+
+@pytest.fixture
+def handler(database_path, tmp_path):
+    """ A handler of the chinook database with 3 copies of it opened as shards """
+    handler = SqlLiteHandler(database_path)
+    for index in range(3):
+        shard_path = tmp_path / f'shard_{index}.db'
+        shutil.copyfile(database_path, shard_path)
+        handler.workspace.add(shard_path)
+    yield handler
+    handler.workspace.close()
+
+
+def test_virtual_grid_counts_the_rows_on_every_shard(handler, database_path, monkeypatch):
+    handler.get_data_from_shards('tracks')
+    list(handler.filter_last_executed_query([create_filter(handler, 'tracks', 'Name', 'Contains', 'love')], False))
+    with sqlite3.connect(database_path) as connection:
+        (count, ), = connection.execute("SELECT COUNT(*) FROM tracks WHERE Name LIKE '%love%'").fetchall()
+    connection.close()
+
+    execute_current = handler._execute_current
+
+    def execute_without_count(query, *args):
+        assert 'COUNT(*)' not in query, 'The shards were counted by a single query'
+        return execute_current(query, *args)
+
+    monkeypatch.setattr(handler, '_execute_current', execute_without_count)
+    assert handler.count_current_rows() == 3 * count
+    # The windows are read from the UNION ALL of the shards, so they are the same every time.
+    assert handler.fetch_current_rows(10, 20) == handler.fetch_current_rows(10, 20)
+
+
+def test_shards_are_limited_by_the_attached_databases(handler, tmp_path):
+    with pytest.raises(ValueError, match='can not attach more than'):
+        for index in range(3, 20):
+            shard_path = tmp_path / f'shard_{index}.db'
+            shutil.copyfile(handler.database_file_path, shard_path)
+            handler.workspace.add(shard_path)
+    assert len(handler.workspace.shards) <= 9
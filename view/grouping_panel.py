@@ -0,0 +1,142 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Sequence
+
+import db
+from view.constants import Colors as c
+
+
+class GroupingPanel(tk.Toplevel):
+    """
+    Window that groups the current result: the columns to group by, the aggregates to compute for every group
+    and filters on the groups (HAVING), the grouping itself is done by the database.
+    """
+
+    def __init__(self, parent, columns: Sequence[db.ColumnData],
+                 on_apply: Callable[[Sequence[str], Sequence[db.Aggregate], Sequence[db.filters.Filter]], None],
+                 on_clear: Callable[[], None]):
+        super().__init__(parent, bg=c.WINDOW_BACKGROUND)
+        self.title('Group result')
+        self.columns: Dict[str, db.ColumnData] = {column.get_full_name(): column for column in columns}
+        self.on_apply = on_apply
+        self.on_clear = on_clear
+        self.aggregates: List[db.Aggregate] = []
+        self.having: List[db.filters.Filter] = []
+        self.having_columns: List[db.ColumnData] = []
+        self.available_operators: Sequence[db.Operator] = ()
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        tk.Label(self, text='Group by', bg=c.WINDOW_BACKGROUND).grid(column=0, row=0, sticky=tk.W, padx=5)
+        self.group_by_listbox = tk.Listbox(self, selectmode=tk.MULTIPLE, exportselection=False, height=10)
+        self.group_by_listbox.insert(tk.END, *self.columns)
+        self.group_by_listbox.grid(column=0, row=1, sticky=tk.NSEW, padx=5, pady=5)
+        self.group_by_listbox.bind('<<ListboxSelect>>', lambda _: self.update_having_columns())
+
+        # ___ aggregates ___
+        aggregates_frame = tk.Frame(self, bg=c.WINDOW_BACKGROUND)
+        aggregates_frame.grid(column=1, row=0, rowspan=2, sticky=tk.NSEW, padx=5, pady=5)
+        aggregates_frame.rowconfigure(1, weight=1)
+        self.function_combobox = ttk.Combobox(aggregates_frame, values=db.AGGREGATE_FUNCTIONS, state='readonly',
+                                              width=14)
+        self.function_combobox.grid(column=0, row=0, padx=5, pady=5)
+        self.aggregated_column_combobox = ttk.Combobox(aggregates_frame, values=['*', *self.columns],
+                                                       state='readonly', width=24)
+        self.aggregated_column_combobox.grid(column=1, row=0, padx=5, pady=5)
+        tk.Button(aggregates_frame, text='Add', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_add_aggregate).grid(column=2, row=0, padx=5, pady=5)
+        self.aggregates_listbox = tk.Listbox(aggregates_frame, height=8)
+        self.aggregates_listbox.grid(column=0, row=1, columnspan=3, sticky=tk.NSEW, padx=5, pady=5)
+
+        # ___ filters of the groups ___
+        having_frame = tk.Frame(self, bg=c.WINDOW_BACKGROUND)
+        having_frame.grid(column=0, row=2, columnspan=2, sticky=tk.EW, padx=5, pady=5)
+        tk.Label(having_frame, text='Having', bg=c.WINDOW_BACKGROUND).grid(column=0, row=0, padx=5)
+        self.having_column_combobox = ttk.Combobox(having_frame, state='readonly', width=24)
+        self.having_column_combobox.grid(column=1, row=0, padx=5)
+        self.having_column_combobox.bind('<<ComboboxSelected>>', self.callback_having_column_combobox)
+        self.having_operator_combobox = ttk.Combobox(having_frame, state='readonly', width=14)
+        self.having_operator_combobox.grid(column=2, row=0, padx=5)
+        self.having_value = tk.Entry(having_frame, width=14)
+        self.having_value.grid(column=3, row=0, padx=5)
+        tk.Button(having_frame, text='Add', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_add_having).grid(column=4, row=0, padx=5)
+        self.having_listbox = tk.Listbox(having_frame, height=3)
+        self.having_listbox.grid(column=0, row=1, columnspan=5, sticky=tk.EW, padx=5, pady=5)
+
+        self.error_str = tk.StringVar()
+        tk.Label(self, textvar=self.error_str, fg='red', bg=c.WINDOW_BACKGROUND).grid(column=0, row=3, sticky=tk.W)
+        buttons_frame = tk.Frame(self, bg=c.WINDOW_BACKGROUND)
+        buttons_frame.grid(column=1, row=3, sticky=tk.E)
+        tk.Button(buttons_frame, text='Clear', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_clear).grid(column=0, row=0, padx=5, pady=5)
+        tk.Button(buttons_frame, text='Apply', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_apply).grid(column=1, row=0, padx=5, pady=5)
+
+    @property
+    def group_by(self) -> List[str]:
+        """ The full names of the selected columns to group by """
+        return [self.group_by_listbox.get(index) for index in self.group_by_listbox.curselection()]
+
+    def update_having_columns(self) -> None:
+        """ The groups can be filtered by the grouped columns and by the aggregates """
+        self.having_columns = [self.columns[column_name] for column_name in self.group_by] + \
+                              [db.aggregation.get_aggregate_column(aggregate, self.columns)
+                               for aggregate in self.aggregates]
+        self.having_column_combobox['values'] = [column.get_full_name() for column in self.having_columns]
+
+    def on_click_add_aggregate(self) -> None:
+        function = self.function_combobox.get()
+        column_name = self.aggregated_column_combobox.get()
+        if not function or not column_name:
+            self.error_str.set('Select a function and a column')
+            return
+        aggregate = db.Aggregate(function, None if column_name == '*' else column_name)
+        try:
+            db.aggregation.get_aggregate_column(aggregate, self.columns)
+        except ValueError as e:
+            self.error_str.set(e)
+            return
+        self.error_str.set('')
+        self.aggregates.append(aggregate)
+        self.aggregates_listbox.insert(tk.END, aggregate.get_full_name())
+        self.update_having_columns()
+
+    def callback_having_column_combobox(self, _) -> None:
+        column = self.having_columns[self.having_column_combobox.current()]
+        # The full-text indexes are of the table's columns, so they can not filter groups.
+        self.available_operators = [operator for operator in db.get_operators(column.column_type)
+                                    if operator not in db.operators.FULL_TEXT_OPERATORS]
+        self.having_operator_combobox['values'] = self.available_operators
+        self.having_operator_combobox.set('')
+
+    def on_click_add_having(self) -> None:
+        column_index = self.having_column_combobox.current()
+        operator_index = self.having_operator_combobox.current()
+        if column_index == -1 or operator_index == -1:
+            self.error_str.set('Select a column and an operator')
+            return
+        having_filter = db.get_filter(self.having_columns[column_index])
+        having_filter.operator = self.available_operators[operator_index]
+        try:
+            having_filter.value = self.having_value.get()
+        except ValueError as e:
+            self.error_str.set(e)
+            return
+        self.error_str.set('')
+        self.having.append(having_filter)
+        self.having_listbox.insert(tk.END, str(having_filter))
+        self.having_value.delete(0, tk.END)
+
+    def on_click_apply(self) -> None:
+        self.on_apply(self.group_by, list(self.aggregates), list(self.having))
+
+    def on_click_clear(self) -> None:
+        self.group_by_listbox.selection_clear(0, tk.END)
+        self.aggregates.clear()
+        self.having.clear()
+        self.aggregates_listbox.delete(0, tk.END)
+        self.having_listbox.delete(0, tk.END)
+        self.update_having_columns()
+        self.on_clear()
@@ -0,0 +1,106 @@
+import json
+import time
+import tkinter as tk
+from tkinter import filedialog, ttk
+from typing import Dict
+
+from db.profiling import QueryProfile, QueryProfiler
+from view.constants import Colors as c
+
+_COLUMNS = ('time', 'label', 'total', 'materialize', 'connect', 'execute', 'fetch', 'render', 'rows', 'vm_steps',
+            'cache')
+_REFRESH_INTERVAL_MS = 1000
+
+
+def _format_seconds(seconds) -> str:
+    return f'{seconds * 1000:.1f} ms' if seconds is not None else ''
+
+
+class ProfilingPanel(tk.Toplevel):
+    """
+    Window that lists the recent query profiles of a `QueryProfiler`, the time of every phase of the query,
+    and shows the query and its plan of the selected profile.
+    """
+
+    def __init__(self, parent, profiler: QueryProfiler):
+        super().__init__(parent, bg=c.WINDOW_BACKGROUND)
+        self.title('Query profiles')
+        self.profiler = profiler
+        self.rowconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.table = ttk.Treeview(self, columns=_COLUMNS, show='headings', selectmode=tk.BROWSE, height=12)
+        for column in _COLUMNS:
+            self.table.heading(column, text=column.replace('_', ' ').title(), anchor=tk.W)
+            self.table.column(column, width=80, stretch=True)
+        self.table.grid(column=0, row=0, sticky=tk.NSEW, padx=5, pady=5)
+        self.table.bind('<<TreeviewSelect>>', self.on_select_profile)
+
+        self.details = tk.Text(self, height=10, wrap=tk.WORD)
+        self.details.grid(column=0, row=1, sticky=tk.NSEW, padx=5, pady=5)
+
+        buttons_frame = tk.Frame(self, bg=c.WINDOW_BACKGROUND)
+        buttons_frame.grid(column=0, row=2, sticky=tk.E)
+        self.is_enabled = tk.BooleanVar(value=profiler.enabled)
+        tk.Checkbutton(buttons_frame, text='Profile queries', variable=self.is_enabled, bg=c.WINDOW_BACKGROUND,
+                       command=self.on_toggle_profiling).grid(column=0, row=0, padx=5, pady=5)
+        tk.Button(buttons_frame, text='Clear', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_clear).grid(column=1, row=0, padx=5, pady=5)
+        tk.Button(buttons_frame, text='Save JSON', bg=c.BUTTON_BACKGROUND,
+                  command=self.on_click_save).grid(column=2, row=0, padx=5, pady=5)
+
+        self._profiles_by_item: Dict[str, QueryProfile] = dict()
+        self._refresh_id = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """ Shows the recent profiles, the newest first, and reschedules itself while the window is open """
+        selected = self.table.selection()
+        selected_id = self._profiles_by_item[selected[0]].id if selected else None
+        self.table.delete(*self.table.get_children())
+        self._profiles_by_item = dict()
+        for profile in reversed(self.profiler.recent_profiles):
+            spans = profile.spans
+            item = self.table.insert('', tk.END, values=(
+                time.strftime('%H:%M:%S', time.localtime(profile.started_at)), profile.label,
+                _format_seconds(profile.elapsed), *(_format_seconds(spans.get(phase)) for phase in
+                                                    ('materialize', 'connect', 'execute', 'fetch', 'render')),
+                profile.rows, profile.vm_steps if profile.vm_steps is not None else '',
+                'hit' if profile.cache_hit else ''))
+            self._profiles_by_item[item] = profile
+            if profile.id == selected_id:
+                self.table.selection_set(item)
+        self._refresh_id = self.after(_REFRESH_INTERVAL_MS, self.refresh)
+
+    def destroy(self) -> None:
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+        super().destroy()
+
+    def on_select_profile(self, _) -> None:
+        selected = self.table.selection()
+        if not selected:
+            return
+        profile = self._profiles_by_item[selected[0]]
+        text = f'{" ".join(profile.query.split())}\n\nParameters: {list(profile.parameters)}\n\nQuery plan:\n' + \
+               '\n'.join(profile.query_plan)
+        if profile.error:
+            text += f'\n\nError: {profile.error}'
+        self.details.delete('1.0', tk.END)
+        self.details.insert('1.0', text)
+
+    def on_toggle_profiling(self) -> None:
+        self.profiler.enabled = self.is_enabled.get()
+
+    def on_click_clear(self) -> None:
+        self.profiler.clear()
+        self.details.delete('1.0', tk.END)
+
+    def on_click_save(self) -> None:
+        file_path = filedialog.asksaveasfilename(parent=self, defaultextension='.json',
+                                                 filetypes=[('JSON', '*.json')])
+        if file_path:
+            with open(file_path, 'w', encoding='utf-8') as output:
+                json.dump([profile.to_dict() for profile in self.profiler.recent_profiles], output, indent=2,
+                          default=str)
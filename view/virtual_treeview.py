@@ -0,0 +1,100 @@
+import tkinter as tk
+import tkinter.font as tk_font
+from tkinter import ttk
+from typing import Callable, Iterable, Optional, Sequence
+
+from view.constants import Colors as c
+
+FetchRows = Callable[[int, int], Sequence[Iterable[str]]]
+
+_DEFAULT_ROW_HEIGHT = 20
+_HEADING_PADDING = 8
+_WHEEL_SCROLL_ROWS = 3
+
+
+class VirtualTreeview(tk.Frame):
+    """
+    Treeview that shows a window of a (possibly huge) result.
+
+    Only the visible rows exist as items of the treeview, the rows are fetched on demand
+    with `fetch_rows(offset, limit)` whenever the window is scrolled.
+    """
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, bg=c.WINDOW_BACKGROUND, **kwargs)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.table = ttk.Treeview(self, show="headings", selectmode=tk.BROWSE)
+        self.table.grid(column=0, row=0, sticky=tk.NSEW)
+        self.vertical_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scroll)
+        self.vertical_scrollbar.grid(column=1, row=0, sticky=tk.NS)
+        horizontal_scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.table.xview)
+        horizontal_scrollbar.grid(column=0, row=1, sticky=tk.EW)
+        self.table.configure(xscrollcommand=horizontal_scrollbar.set)
+
+        self.table.bind('<Configure>', self.on_resize)
+        self.table.bind('<MouseWheel>', lambda event: self.scroll_by(-_WHEEL_SCROLL_ROWS if event.delta > 0
+                                                                     else _WHEEL_SCROLL_ROWS))
+        self.table.bind('<Button-4>', lambda _: self.scroll_by(-_WHEEL_SCROLL_ROWS))
+        self.table.bind('<Button-5>', lambda _: self.scroll_by(_WHEEL_SCROLL_ROWS))
+
+        self.rows_count = 0
+        self.offset = 0
+        self.visible_rows = 1
+        self._fetch_rows: Optional[FetchRows] = None
+
+    def set_data(self, rows_count: int, fetch_rows: FetchRows, first_rows: Sequence[Iterable[str]] = None) -> None:
+        """ Shows a new result of `rows_count` rows scrolled to the top, `first_rows` saves fetching the first window """
+        self.rows_count = rows_count
+        self._fetch_rows = fetch_rows
+        self.offset = 0
+        self.refresh(first_rows)
+
+    def clear(self) -> None:
+        self.set_data(0, lambda offset, limit: [])
+
+    def refresh(self, rows: Sequence[Iterable[str]] = None) -> None:
+        """ Fetches the rows of the current window (unless given) and shows them """
+        if rows is None:
+            rows = self._fetch_rows(self.offset, self.visible_rows) if self._fetch_rows and self.rows_count else []
+        items = self.table.get_children()
+        # Reuse the existing items and only add or remove the difference.
+        if len(items) > len(rows):
+            self.table.delete(*items[len(rows):])
+        for index, row in enumerate(rows):
+            if index < len(items):
+                self.table.item(items[index], values=row)
+            else:
+                self.table.insert('', tk.END, values=row)
+
+        if self.rows_count <= self.visible_rows:
+            self.vertical_scrollbar.set(0, 1)
+        else:
+            self.vertical_scrollbar.set(self.offset / self.rows_count,
+                                        (self.offset + self.visible_rows) / self.rows_count)
+
+    def scroll_to(self, offset: int) -> None:
+        offset = max(0, min(offset, self.rows_count - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def scroll_by(self, rows: int) -> None:
+        self.scroll_to(self.offset + rows)
+
+    def on_scroll(self, action, *args) -> None:
+        """ Handles the commands of the vertical scrollbar """
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(args[0]) * self.rows_count))
+        elif action == tk.SCROLL:
+            amount, units = args
+            self.scroll_by(int(amount) * (self.visible_rows if units == tk.PAGES else 1))
+
+    def on_resize(self, event) -> None:
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or _DEFAULT_ROW_HEIGHT)
+        heading_height = tk_font.nametofont('TkHeadingFont').metrics('linespace') + _HEADING_PADDING
+        visible_rows = max(1, (event.height - heading_height) // row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.refresh()